@@ -0,0 +1,403 @@
+import asyncio
+import base64
+import fcntl
+import hashlib
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timezone
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_PREFIX = "worker-"
+_INVERSE_POWERS = [2.0 ** -r for r in range(65)]
+
+
+def _user_hash(user_id) -> int:
+    return int.from_bytes(hashlib.blake2b(str(user_id).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Fixed-size distinct counter (1 KiB, about 3% error); merges by register max."""
+
+    __slots__ = ("registers", "_estimate")
+
+    P = 10
+    M = 1 << P
+    ALPHA = 0.7213 / (1 + 1.079 / M)
+
+    def __init__(self, registers: bytes = None):
+        self.registers = bytearray(registers) if registers else bytearray(self.M)
+        self._estimate = None
+
+    def add_hash(self, h: int):
+        index = h >> (64 - self.P)
+        rest = h & ((1 << (64 - self.P)) - 1)
+        rank = (64 - self.P) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            self._estimate = None
+
+    def merge(self, other: "HyperLogLog"):
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        self._estimate = None
+
+    def count(self) -> int:
+        if self._estimate is None:
+            zeros = self.registers.count(0)
+            estimate = self.ALPHA * self.M * self.M / sum(map(_INVERSE_POWERS.__getitem__, self.registers))
+            if estimate <= 2.5 * self.M and zeros:
+                estimate = self.M * math.log(self.M / zeros)  # small-range correction
+            self._estimate = round(estimate)
+        return self._estimate
+
+    def dumps(self) -> str:
+        return base64.b64encode(bytes(self.registers)).decode("ascii")
+
+    @classmethod
+    def loads(cls, data: str) -> "HyperLogLog":
+        return cls(base64.b64decode(data))
+
+
+class _Counts:
+    """Events per step, plus distinct users per step."""
+
+    __slots__ = ("events", "users")
+
+    def __init__(self):
+        self.events = {}
+        self.users = {}
+
+    def add(self, step: str, user_hash):
+        self.events[step] = self.events.get(step, 0) + 1
+        if user_hash is not None:
+            hll = self.users.get(step)
+            if hll is None:
+                hll = self.users[step] = HyperLogLog()
+            hll.add_hash(user_hash)
+
+    def merge(self, other: "_Counts"):
+        for step, n in other.events.items():
+            self.events[step] = self.events.get(step, 0) + n
+        for step, hll in other.users.items():
+            if step in self.users:
+                self.users[step].merge(hll)
+            else:
+                self.users[step] = HyperLogLog(hll.registers)
+
+    def to_json(self) -> dict:
+        return {"events": dict(self.events), "users": {s: h.dumps() for s, h in self.users.items()}}
+
+    @classmethod
+    def from_json(cls, data: dict) -> "_Counts":
+        counts = cls()
+        counts.events = dict(data.get("events", {}))
+        counts.users = {s: HyperLogLog.loads(v) for s, v in data.get("users", {}).items()}
+        return counts
+
+
+class _Window:
+    """Hourly event counts, daily counts with users, and all-time totals."""
+
+    __slots__ = ("hours", "days", "total")
+
+    def __init__(self):
+        self.hours = {}  # hour number -> {step: events}
+        self.days = {}  # day number -> _Counts
+        self.total = _Counts()
+
+    def merge(self, other: "_Window", since_hour: int = None):
+        """Add ``other`` in; with ``since_hour`` older hours and days are skipped."""
+        since_day = since_hour // 24 if since_hour is not None else None
+        for hour, events in other.hours.items():
+            if since_hour is not None and hour < since_hour:
+                continue
+            mine = self.hours.setdefault(hour, {})
+            for step, n in events.items():
+                mine[step] = mine.get(step, 0) + n
+        for day, counts in other.days.items():
+            if since_day is not None and day < since_day:
+                continue
+            self.days.setdefault(day, _Counts()).merge(counts)
+        self.total.merge(other.total)
+
+    def prune(self, hour_retention: int, day_retention: int, now_hour: int):
+        for hour in [h for h in self.hours if h <= now_hour - hour_retention]:
+            del self.hours[hour]
+        for day in [d for d in self.days if d <= now_hour // 24 - day_retention]:
+            del self.days[day]
+
+    def to_json(self) -> dict:
+        return {
+            "hours": {str(h): dict(e) for h, e in self.hours.items()},
+            "days": {str(d): c.to_json() for d, c in self.days.items()},
+            "total": self.total.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "_Window":
+        window = cls()
+        window.hours = {int(h): dict(e) for h, e in data.get("hours", {}).items()}
+        window.days = {int(d): _Counts.from_json(c) for d, c in data.get("days", {}).items()}
+        window.total = _Counts.from_json(data.get("total", {}))
+        return window
+
+
+class FunnelAnalytics:
+    """In-memory funnel counters with periodic snapshots, shared across workers.
+
+    ``record()`` only bumps a few counters, so handlers can call it on every
+    step. Each worker snapshots its own counters to
+    ``worker-<host>-<pid>-<started>-<nonce>.json`` and holds an flock on the matching
+    ``.lock`` for as long as it runs. :meth:`stats` merges the live counters
+    with the other workers' snapshots (re-read only when they change) and a
+    ``base.json`` into which snapshots of workers that have exited are folded.
+    The cost of a query depends on the number of steps, buckets and workers,
+    never on the number of users or leads.
+    """
+
+    def __init__(
+        self,
+        directory: str = "analytics",
+        steps=(),
+        snapshot_interval: float = 60.0,
+        hour_retention: int = 48,
+        day_retention: int = 90,
+    ):
+        self.directory = directory
+        self.steps = tuple(steps)
+        self.snapshot_interval = snapshot_interval
+        self.hour_retention = hour_retention
+        self.day_retention = day_retention
+        self.token = f"{socket.gethostname()}-{os.getpid()}-{int(time.time())}-{os.urandom(3).hex()}"
+
+        os.makedirs(directory, exist_ok=True)
+        self.base_path = os.path.join(directory, "base.json")
+        self.snapshot_path = os.path.join(directory, f"{SNAPSHOT_PREFIX}{self.token}.json")
+        self._liveness_fd = _hold_lock(self.snapshot_path[: -len(".json")] + ".lock")
+
+        self._lock = threading.Lock()
+        self._window = _Window()
+        self._file_cache = {}  # path -> (mtime_ns, _Window)
+        self._cache_lock = threading.Lock()  # stats() runs on several request threads at once
+        self._task = None
+        self.recorded = 0
+        self.snapshots = 0
+        self._fold_dead_workers()
+
+    # ----- recording -----
+    def record(self, step: str, user_id=None, now: float = None):
+        hour = int((time.time() if now is None else now) // 3600)
+        user_hash = _user_hash(user_id) if user_id is not None else None
+        with self._lock:
+            events = self._window.hours.get(hour)
+            if events is None:
+                events = self._window.hours[hour] = {}
+                self._window.prune(self.hour_retention, self.day_retention, hour)
+            events[step] = events.get(step, 0) + 1
+            day = self._window.days.get(hour // 24)
+            if day is None:
+                day = self._window.days[hour // 24] = _Counts()
+            day.add(step, user_hash)
+            self._window.total.add(step, user_hash)
+            self.recorded += 1
+
+    # ----- snapshots -----
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="funnel-analytics-snapshots")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.snapshot()
+        # Our snapshot is now final; releasing the lock lets another worker fold it.
+        if self._liveness_fd is not None:
+            os.close(self._liveness_fd)
+            self._liveness_fd = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                await asyncio.to_thread(self.snapshot)
+                await asyncio.to_thread(self._fold_dead_workers)
+            except Exception as e:
+                log.warning("⚠️ Analytics snapshot failed: %s", e)
+
+    def snapshot(self):
+        with self._lock:
+            data = self._window.to_json()
+        data["worker"] = self.token
+        data["saved_at"] = time.time()
+        _write_json(self.snapshot_path, data)
+        self.snapshots += 1
+
+    def _fold_dead_workers(self):
+        """Merge snapshots of workers that no longer hold their lock into base.json."""
+        fold_fd = os.open(os.path.join(self.directory, ".fold.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fold_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # another worker is folding
+            dead = [path for path in self._peer_snapshots() if not _is_locked(path[: -len(".json")] + ".lock")]
+            self._remove_orphan_locks()
+            if not dead:
+                return
+            base = _read_json(self.base_path) or {}
+            folded = base.get("folded", [])
+            window = _Window.from_json(base)
+            for path in dead:
+                data = _read_json(path)
+                if data and data.get("worker") not in folded:
+                    window.merge(_Window.from_json(data))
+                    folded.append(data.get("worker"))
+            window.prune(self.hour_retention, self.day_retention, int(time.time() // 3600))
+            _write_json(self.base_path, {**window.to_json(), "folded": folded[-200:]})
+            for path in dead:
+                for stale in (path, path[: -len(".json")] + ".lock"):
+                    try:
+                        os.remove(stale)
+                    except FileNotFoundError:
+                        pass
+        finally:
+            os.close(fold_fd)
+
+    def _remove_orphan_locks(self):
+        """Drop lock files of exited workers that never wrote a snapshot."""
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if (
+                name.startswith(SNAPSHOT_PREFIX) and name.endswith(".lock")
+                and not os.path.exists(path[: -len(".lock")] + ".json")
+                and not _is_locked(path)
+            ):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def _peer_snapshots(self):
+        return [
+            os.path.join(self.directory, name)
+            for name in sorted(os.listdir(self.directory))
+            if name.startswith(SNAPSHOT_PREFIX) and name.endswith(".json")
+            and os.path.join(self.directory, name) != self.snapshot_path
+        ]
+
+    def _cached_window(self, path: str):
+        """Parsed snapshot at ``path``, re-read only when it changed; needs ``_cache_lock``."""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._file_cache.pop(path, None)
+            return None
+        cached = self._file_cache.get(path)
+        if cached is None or cached[0] != mtime:
+            data = _read_json(path)
+            cached = self._file_cache[path] = (mtime, _Window.from_json(data) if data else None)
+        return cached[1]
+
+    # ----- queries -----
+    def stats(self, hours: int = 24, days: int = 7, now: float = None) -> dict:
+        now = time.time() if now is None else now
+        now_hour = int(now // 3600)
+        since_hour = min(now_hour - hours + 1, (now_hour // 24 - days + 1) * 24)
+        merged = _Window()
+        with self._lock:
+            merged.merge(self._window, since_hour)
+        peers = self._peer_snapshots()
+        with self._cache_lock:
+            for path in [self.base_path, *peers]:
+                window = self._cached_window(path)
+                if window is not None:
+                    merged.merge(window, since_hour)
+            for stale in set(self._file_cache) - {self.base_path, *peers}:
+                del self._file_cache[stale]
+
+        steps = self.steps or tuple(sorted(merged.total.events))
+        return {
+            "generated_at": _iso(now),
+            "workers": 1 + len(peers),
+            "steps": list(steps),
+            "total": _summary(merged.total, steps),
+            "hourly": [
+                {"hour": _iso(h * 3600), "events": {s: merged.hours.get(h, {}).get(s, 0) for s in steps}}
+                for h in range(now_hour - hours + 1, now_hour + 1)
+            ],
+            "daily": [
+                {"day": _iso(d * 86400)[:10], **_summary(merged.days.get(d) or _Counts(), steps)}
+                for d in range(now_hour // 24 - days + 1, now_hour // 24 + 1)
+            ],
+        }
+
+
+def _summary(counts: _Counts, steps) -> dict:
+    users = {s: counts.users[s].count() if s in counts.users else 0 for s in steps}
+    first = users[steps[0]] if steps else 0
+    conversion = {}
+    for i, step in enumerate(steps):
+        previous = users[steps[i - 1]] if i else users[step]
+        conversion[step] = {
+            "from_first": round(users[step] / first, 4) if first else None,
+            "from_previous": round(users[step] / previous, 4) if previous else None,
+        }
+    return {
+        "events": {s: counts.events.get(s, 0) for s in steps},
+        "users": users,
+        "conversion": conversion,
+    }
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _hold_lock(path: str) -> int:
+    """Create and flock ``path``, retrying if a folder removed it in between."""
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        try:
+            if os.stat(path).st_ino == os.fstat(fd).st_ino:
+                return fd
+        except FileNotFoundError:
+            pass
+        os.close(fd)
+
+
+def _is_locked(path: str) -> bool:
+    try:
+        fd = os.open(path, os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_json(path: str, data: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -1,20 +1,54 @@
+import time
+IMPORT_STARTED = time.monotonic()  # first thing, so import cost is measured in full
+
 import os
 import re
-import json
-import requests
+import hmac
+import uuid
+import logging
+import atexit
+import contextlib
+import threading
 import asyncio
+import argparse
+import functools
 from datetime import datetime, timezone
-from flask import Flask, request as flask_request
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from flask import Flask, Response, jsonify, request as flask_request
+from telegram import Update
 from telegram.ext import (
     Application,
     CommandHandler,
     MessageHandler,
     ConversationHandler,
     ContextTypes,
+    PersistenceInput,
+    TypeHandler,
     filters,
 )
-from telegram.request import HTTPXRequest
+
+from analytics import FunnelAnalytics
+from bot_registry import DEFAULT_BOT, BotConfig, BotRegistry, HostedBot, SharedRequest, load_bot_configs
+from bot_runtime import BotRuntime
+from broadcast import Broadcaster, BroadcastBusy
+from http_client import SharedHTTPClient, parse_host_timeouts
+from inline_reply import InlineReplyRequest, process_update_inline
+from lead_export import FORMATS, ExportQuery, export_leads
+from lead_store import LeadStore
+from polling import UpdatePoller
+from media_cache import MediaCache
+from menu_router import MenuRouter, strip_invisible
+from metrics import MetricsRegistry, TimedHTTPXRequest, instrument_handlers
+from profiler import SamplingProfiler, SharedProfilerControl
+from content_catalog import CatalogStore
+from flood_guard import ALLOW, WARN, FloodGuard
+from sheet_outbox import SheetOutbox
+from sheet_reconcile import SheetReconciler
+from sqlite_persistence import SQLitePersistence
+from structured_logging import log_context, setup_logging
+from update_filter import UpdatePrefilter, parse_update
+from update_queue import UpdateQueue, extract_chat_id, is_valid_update
+from user_state import UserState, UserStateCache
+from webhook_setup import WebhookRegistrar, ensure_webhook, webhook_url_for
 
 
 # ========== ENV CONFIG ==========
@@ -22,109 +56,154 @@ TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
 GOOGLE_SHEET_WEBAPP_URL = os.getenv("GOOGLE_SHEET_WEBAPP_URL")
 SUPPORT_USERNAME = os.getenv("SUPPORT_USERNAME", "@support")
 ROOT_URL = os.getenv("ROOT_URL", "https://digitalmarketingacademy-bot.onrender.com")
+# Bot API server; point at a local Bot API server or a test double if needed
+TELEGRAM_API_BASE_URL = (os.getenv("TELEGRAM_API_BASE_URL") or "https://api.telegram.org").rstrip("/")
 PORT = int(os.getenv("PORT", "10000"))
+# "sync" answers the webhook after handlers finish; "queue" acks at once and
+# processes updates on a pool of consumers.
+WEBHOOK_MODE = os.getenv("WEBHOOK_MODE", "sync").lower()
+UPDATE_WORKERS = int(os.getenv("UPDATE_WORKERS", "4"))
+UPDATE_QUEUE_SIZE = int(os.getenv("UPDATE_QUEUE_SIZE", "1000"))
+# `python app.py --polling`: updates per getUpdates call, long-poll seconds, chats handled at once
+POLL_LIMIT = int(os.getenv("POLL_LIMIT", "100"))
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", "50"))
+POLL_CONCURRENCY = int(os.getenv("POLL_CONCURRENCY", "32"))
+# In sync mode, send a handler's single reply in the webhook response body
+INLINE_REPLIES = os.getenv("INLINE_REPLIES", "0") == "1"
+# Protects /admin/* endpoints; they are disabled while it is unset
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# More bots served next to TELEGRAM_TOKEN's (JSON, see README); their data goes under BOTS_DATA_DIR
+BOTS_FILE = os.getenv("BOTS_FILE", "")
+BOTS_DATA_DIR = os.getenv("BOTS_DATA_DIR", "bots")
 
 if not TELEGRAM_TOKEN:
     raise RuntimeError("❌ TELEGRAM_TOKEN is not set!")
 
 
-# ========== STORAGE ==========
-LEADS_FILE = "leads.json"
+# ========== LOGGING ==========
+# JSON lines through a bounded queue and one writer thread: logging never
+# blocks a request, and records carry the request/update id they belong to.
+log_pipeline = setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    sample=os.getenv("LOG_SAMPLE", "raw_update=100"),
+    fmt=os.getenv("LOG_FORMAT", "json"),
+)
+log = logging.getLogger("app")
+
+
+# ========== METRICS ==========
+# Served on /metrics in the Prometheus text format
+metrics = MetricsRegistry()
+metrics.gauge_callback("log_queue_depth", "Log records waiting for the writer.", log_pipeline.queue.qsize)
+metrics.counter_callback(
+    "log_records_dropped_total", "Log records dropped because the queue was full.", lambda: log_pipeline.handler.dropped
+)
+
+# Stack samples of 1 in PROFILE_EVERY webhook requests, switched on from /admin/profile
+profiler = SamplingProfiler(
+    every=int(os.getenv("PROFILE_EVERY", "20")),
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    max_stacks=int(os.getenv("PROFILE_MAX_STACKS", "5000")),
+)
+# Each worker has its own profiler; this carries /admin/profile to all of them
+profiler_control = SharedProfilerControl(profiler, os.getenv("PROFILE_DIR", "profile"))
 
-def load_leads():
-    if not os.path.exists(LEADS_FILE):
-        return []
-    try:
-        with open(LEADS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
 
-def save_leads(leads):
-    with open(LEADS_FILE, "w", encoding="utf-8") as f:
-        json.dump(leads, f, ensure_ascii=False, indent=2)
+# ========== STORAGE ==========
+LEADS_FILE = "leads.json"  # legacy single-file store, imported once into LEADS_DIR
+LEADS_DIR = os.getenv("LEADS_DIR", "leads")
+SHEET_OUTBOX_DIR = os.getenv("SHEET_OUTBOX_DIR", "outbox")
+# One SQLite file for every bot's conversation state; each bot has its own namespace in it
+STATE_DB = os.getenv("STATE_DB", "state.db")
+
+# Exports hold a request thread for as long as the client reads, so cap how many
+# run per worker to leave the other threads to the webhook.
+EXPORT_MAX_ROWS = int(os.getenv("EXPORT_MAX_ROWS", "100000"))
+export_slots = threading.BoundedSemaphore(int(os.getenv("EXPORT_CONCURRENCY", "1")))
+
+# Pooled client shared by the Google Sheet sink and any other non-Telegram calls
+http_client = SharedHTTPClient(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "10")),
+    timeout=float(os.getenv("HTTP_TIMEOUT", "10")),
+    host_timeouts=parse_host_timeouts(os.getenv("HTTP_HOST_TIMEOUTS", "")),
+)
 
 
 # ========== HELPERS ==========
 def normalize_email(raw: str) -> str:
     if not raw:
         return ""
-    return raw.replace("\u200c", "").replace("\u200f", "").strip().lower()
+    return strip_invisible(raw).strip().lower()
 
 EMAIL_RE = re.compile(r"^[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Za-z]{2,}$")
 def is_valid_email(email: str) -> bool:
     return EMAIL_RE.match(email.strip()) if email else False
 
 
-async def post_to_sheet_async(payload: dict):
-    """Send lead data to Google Sheet Web App asynchronously (non-blocking)."""
-    if not GOOGLE_SHEET_WEBAPP_URL:
-        print("⚠️ GOOGLE_SHEET_WEBAPP_URL not set")
-        return
-    try:
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, lambda: requests.post(
-            GOOGLE_SHEET_WEBAPP_URL, json=payload, timeout=(5, 10)
-        ))
-        print("📤 Lead sent to Google Sheet.")
-    except requests.exceptions.Timeout:
-        print("⚠️ post_to_sheet_async timeout — Google Sheet too slow.")
-    except Exception as e:
-        print("❌ post_to_sheet_async error:", e)
-
-
-# ========== MENU ==========
-MAIN_MENU = ReplyKeyboardMarkup(
-    [
-        ["🏁 شروع", "📘 درباره ما"],
-        ["📥 دریافت اطلاعات", "🎓 آموزش رایگان"],
-        ["💼 فرانچایز", "💬 پشتیبانی"],
-    ],
-    resize_keyboard=True,
+def hosted_bot(context) -> HostedBot:
+    """The bot an update came in for; handlers reach its catalog and stores through it."""
+    return context.bot_data["hosted_bot"]
+
+
+# ========== CONTENT ==========
+# Texts, keyboards, learning steps and links; edits are picked up without a restart
+CONTENT_FILE = os.getenv("CONTENT_FILE", "content.json")
+
+
+# ========== ANALYTICS ==========
+FUNNEL_STEPS = (
+    "start",
+    "start_learning",
+    "learning_step2",
+    "learning_step3",
+    "appointment",
+    "registration_started",
+    "registration_name",
+    "registration_completed",
 )
 
 
+def track(context, step: str, update: Update):
+    hosted_bot(context).analytics.record(step, update.effective_user.id if update.effective_user else None)
+
+
 # ========== STATES ==========
 ASK_NAME, ASK_EMAIL = range(2)
 
 
 # ========== TELEGRAM HANDLERS ==========
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "👋 سلام! به ربات دیجیتال مارکتینگ خوش آمدید.\n\n"
-        "از منوی زیر انتخاب کنید:",
-        reply_markup=MAIN_MENU,
-    )
+    track(context, "start", update)
+    await hosted_bot(context).catalog.current.replies["menu"].send(update.message)
 
 
 async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "📘 *درباره ما:*\n"
-        "ما آموزش و راه‌اندازی بیزنس آنلاین، اتوماسیون و دیجیتال مارکتینگ را "
-        "برای همه ساده کرده‌ایم. با ما یاد بگیرید چطور برند خودتان را بسازید و درآمد آنلاین کسب کنید.",
-        parse_mode="Markdown",
-        reply_markup=MAIN_MENU,
-    )
+    await hosted_bot(context).catalog.current.replies["about"].send(update.message)
 
 
 # === Information Collection ===
 async def start_registration(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("📥 لطفاً نام کامل خود را وارد کنید:", reply_markup=ReplyKeyboardRemove())
+    track(context, "registration_started", update)
+    await hosted_bot(context).catalog.current.replies["ask_name"].send(update.message)
     return ASK_NAME
 
 
 async def ask_name(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["name"] = update.message.text.strip()
-    await update.message.reply_text("خوب 🌟 حالا لطفاً ایمیل خود را وارد کنید:")
+    track(context, "registration_name", update)
+    await hosted_bot(context).catalog.current.replies["ask_email"].send(update.message)
     return ASK_EMAIL
 
 
 async def ask_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    bot = hosted_bot(context)
     email = normalize_email(update.message.text)
     name = context.user_data.get("name", "")
 
     if not is_valid_email(email):
-        await update.message.reply_text("❌ ایمیل معتبر نیست. دوباره وارد کنید:")
+        await bot.catalog.current.replies["invalid_email"].send(update.message)
         return ASK_EMAIL
 
     lead = {
@@ -136,124 +215,430 @@ async def ask_email(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "created_at": datetime.now(timezone.utc).isoformat(),
     }
 
-    leads = load_leads()
-    leads.append(lead)
-    save_leads(leads)
+    # Batched append + fsync on the lead store's writer thread; the loop stays free
+    lead = await asyncio.wrap_future(bot.lead_store.append(lead))
 
-    # Send to Google Sheet asynchronously
-    asyncio.create_task(post_to_sheet_async(lead))
+    bot.sheet_outbox.enqueue(lead)
+    track(context, "registration_completed", update)
 
-    await update.message.reply_text(
-        f"✅ {name}، اطلاعات شما با موفقیت دریافت شد!\n\n🎓 حالا می‌خوای آموزش رایگان شروع دیجیتال مارکتینگ رو ببینی؟",
-        reply_markup=ReplyKeyboardMarkup([["🎓 بریم سراغ آموزش", "🏁 منو اصلی"]], resize_keyboard=True),
-    )
+    await bot.catalog.current.replies["registered"].send(update.message, name=name)
     return ConversationHandler.END
 
 
 # === Education & Franchise ===
-async def start_learning(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "🎓 *مرحله ۱: چرا الان بهترین زمان شروعه؟*\n"
-        "چون بازار آنلاین در حال انفجاره! برندهایی موفق می‌شن که زودتر شروع کنن.\n\n"
-        "می‌خوای بری مرحله بعد؟",
-        parse_mode="Markdown",
-        reply_markup=ReplyKeyboardMarkup([["➡️ مرحله ۲", "🏁 منو اصلی"]], resize_keyboard=True),
-    )
+async def learning_step(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Generic learning funnel step: the button label selects the catalog step."""
+    step = hosted_bot(context).catalog.current.step_for(update.message.text)
+    if step is not None:
+        track(context, step.event, update)
+        await step.send(update.message)
+        if step.media:
+            await hosted_bot(context).media_cache.send(update.message, step.media)
 
 
-async def learning_step2(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "📈 *مرحله ۲: مدل فرانچایز دیجیتال مارکتینگ چیه؟*\n"
-        "ما بهت آموزش می‌دیم چطور با تبلیغات و فروش دیجیتال، محصولات شرکت اسپانسر رو بفروشی و پورسانت بگیری.",
-        parse_mode="Markdown",
-        reply_markup=ReplyKeyboardMarkup([["➡️ مرحله ۳", "🏁 منو اصلی"]], resize_keyboard=True),
-    )
+async def franchise_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await hosted_bot(context).catalog.current.replies["franchise"].send(update.message)
 
 
-async def learning_step3(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "💰 *مرحله ۳: چطور درآمدت رو بسازی؟*\n"
-        "با ما یاد می‌گیری چطور محتوا تولید کنی، کمپین اجرا کنی و درآمد واقعی آنلاین بسازی.\n\n"
-        "می‌خوای جلسه رایگان مشاوره رزرو کنی؟ 📅",
-        parse_mode="Markdown",
-        reply_markup=ReplyKeyboardMarkup([["📅 رزرو جلسه", "🏁 منو اصلی"]], resize_keyboard=True),
-    )
+async def support(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await hosted_bot(context).catalog.current.replies["support"].send(update.message)
 
 
-async def franchise_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "💼 *فرانچایز چیست؟*\n"
-        "این مدل همکاری بهت اجازه می‌ده از برند و سیستم آموزشی ما استفاده کنی، "
-        "محصولات رو بفروشی و از هر فروش پورسانت بگیری.\n\n"
-        "📈 با ما یاد می‌گیری چطور بیزنس آنلاین بسازی بدون اینکه از صفر شروع کنی!",
-        parse_mode="Markdown",
-        reply_markup=MAIN_MENU,
-    )
+async def appointment(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    track(context, "appointment", update)
+    await hosted_bot(context).catalog.current.replies["appointment"].send(update.message)
 
 
-async def support(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        f"💬 برای ارتباط با پشتیبانی پیام بده به: {SUPPORT_USERNAME}",
-        reply_markup=ReplyKeyboardMarkup([["🏁 منو اصلی"]], resize_keyboard=True),
-    )
+def reply_route(key: str):
+    """Handler for a catalog route that has no dedicated function: send its reply."""
+    async def send_catalog_reply(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        await hosted_bot(context).catalog.current.replies[key].send(update.message)
+    send_catalog_reply.__name__ = f"reply_{key}"
+    return send_catalog_reply
 
 
-async def appointment(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text(
-        "📅 برای رزرو جلسه رایگان وارد لینک شو:\nhttps://calendly.com/your-link",
-        reply_markup=MAIN_MENU,
-    )
+# === Shared State ===
+async def load_shared_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs first: pick up registration progress another worker may have saved."""
+    bot = hosted_bot(context)
+    await bot.persistence.refresh_conversation(bot.conv_handler, update)
+    if context.user_data is not None:
+        bot.user_states.expire(update, context.user_data)
+    bot.user_states.touch(update)
+
+
+async def save_shared_state(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Runs last: hand this update's state changes to the persistence right away."""
+    user = update.effective_user
+    if user is not None:
+        context.application.mark_data_for_update_persistence(user_ids=user.id)
+    await context.application.update_persistence()
 
 
 # === Ping Command ===
 async def ping(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    await update.message.reply_text("🏓 pong — bot is alive and connected.")
+    await hosted_bot(context).catalog.current.replies["pong"].send(update.message)
 
 
 # ========== TELEGRAM APPLICATION ==========
-telegram_request = HTTPXRequest(
+class TelegramRequest(SharedRequest, InlineReplyRequest, TimedHTTPXRequest):
+    """One Bot API pool for every bot, with inline replies (when enabled) and timed real calls."""
+
+
+telegram_request = TelegramRequest(
+    # PTB's default is a single connection, which serializes every outgoing reply
+    connection_pool_size=int(os.getenv("TELEGRAM_POOL_SIZE", "16")),
     connect_timeout=10,
     read_timeout=20,
     write_timeout=10,
     pool_timeout=10,
-)
-application = Application.builder().token(TELEGRAM_TOKEN).request(telegram_request).build()
-
-conv_handler = ConversationHandler(
-    entry_points=[MessageHandler(filters.Regex("^(📥 دریافت اطلاعات|دریافت اطلاعات)$"), start_registration)],
-    states={
-        ASK_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_name)],
-        ASK_EMAIL: [MessageHandler(filters.TEXT & ~filters.COMMAND, ask_email)],
-    },
-    fallbacks=[],
+    metrics=metrics,
 )
 
-application.add_handler(conv_handler)
-application.add_handler(CommandHandler("start", show_menu))
-application.add_handler(CommandHandler("ping", ping))
-application.add_handler(MessageHandler(filters.Regex("^(🏁 شروع|🏁 منو اصلی)$"), show_menu))
-application.add_handler(MessageHandler(filters.Regex("^(📘 درباره ما)$"), about))
-application.add_handler(MessageHandler(filters.Regex("^(🎓 آموزش رایگان|🎓 بریم سراغ آموزش)$"), start_learning))
-application.add_handler(MessageHandler(filters.Regex("^(➡️ مرحله ۲)$"), learning_step2))
-application.add_handler(MessageHandler(filters.Regex("^(➡️ مرحله ۳)$"), learning_step3))
-application.add_handler(MessageHandler(filters.Regex("^(💼 فرانچایز)$"), franchise_info))
-application.add_handler(MessageHandler(filters.Regex("^(📅 رزرو جلسه)$"), appointment))
-application.add_handler(MessageHandler(filters.Regex("^(💬 پشتیبانی)$"), support))
+# Catalog route keys with dedicated handlers; other routes just send their reply
+ROUTE_HANDLERS = {
+    "menu": show_menu,
+    "about": about,
+    "franchise": franchise_info,
+    "support": support,
+    "appointment": appointment,
+}
+
+
+def build_menu_routes(content) -> dict:
+    """Button label(s) -> handler, built from the content catalog."""
+    routes = {
+        labels: ROUTE_HANDLERS.get(key) or reply_route(key) for key, labels in content.routes.items()
+    }
+    for step in content.steps:
+        routes[step.labels] = learning_step
+    return routes
+
+
+# Handlers read update.message, which edited messages do not have
+NEW_TEXT = filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND
+
+
+def build_bot(config: BotConfig) -> HostedBot:
+    """One bot's application, content catalog, lead namespace and background services.
+
+    Every bot shares the loop, the Bot API pool, ``http_client`` and STATE_DB.
+    """
+    # Every series of the bot's components carries its name as the ``bot`` label
+    bot_metrics = metrics.labeled(bot=config.name)
+
+    lead_store = LeadStore(config.leads_dir, legacy_file=config.legacy_leads_file, metrics=bot_metrics)
+    atexit.register(lead_store.close)
+    # Leads are recorded here first and delivered to the Google Sheet in the background
+    sheet_outbox = SheetOutbox(
+        config.outbox_dir,
+        config.sheet_url,
+        http_client,
+        batch_size=int(os.getenv("SHEET_BATCH_SIZE", "1")),
+        max_attempts=int(os.getenv("SHEET_MAX_ATTEMPTS", "8")),
+        metrics=bot_metrics,
+    )
+    # Re-sends stored leads the Sheet never accepted (lost enqueues, dead letters, later changes)
+    sheet_reconciler = SheetReconciler(
+        lead_store,
+        sheet_outbox,
+        os.path.join(config.outbox_dir, "reconcile.json"),
+        interval=float(os.getenv("SHEET_RECONCILE_INTERVAL", "900")),
+        max_per_run=int(os.getenv("SHEET_RECONCILE_MAX_LEADS", "500")),
+        metrics=bot_metrics,
+    )
+    # Conversation states and user_data shared by all workers and kept across restarts
+    persistence = SQLitePersistence(
+        STATE_DB,
+        store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False),
+        update_interval=float(os.getenv("PERSISTENCE_INTERVAL", "5")),
+        namespace=config.state_namespace,
+    )
+    catalog = CatalogStore(config.content_file, variables={"support_username": config.support_username})
+    # Lesson media is uploaded once per bot; later sends reuse Telegram's file_id
+    media_cache = MediaCache(
+        STATE_DB,
+        bot_id=config.token.split(":")[0],
+        upload_timeout=float(os.getenv("MEDIA_UPLOAD_TIMEOUT", "120")),
+        metrics=bot_metrics,
+    )
+    analytics = FunnelAnalytics(
+        config.analytics_dir,
+        steps=FUNNEL_STEPS,
+        snapshot_interval=float(os.getenv("ANALYTICS_SNAPSHOT_INTERVAL", "60")),
+    )
+
+    application = (
+        Application.builder()
+        .token(config.token)
+        .base_url(f"{TELEGRAM_API_BASE_URL}/bot")
+        .request(telegram_request)
+        .persistence(persistence)
+        .context_types(ContextTypes(user_data=UserState))
+        .build()
+    )
+    registration_entry = MenuRouter({catalog.current.registration_labels: start_registration})
+    conv_handler = ConversationHandler(
+        entry_points=[registration_entry],
+        states={
+            ASK_NAME: [MessageHandler(NEW_TEXT, ask_name)],
+            ASK_EMAIL: [MessageHandler(NEW_TEXT, ask_email)],
+        },
+        fallbacks=[],
+        name="registration",
+        persistent=True,
+    )
+    menu_router = MenuRouter(build_menu_routes(catalog.current))
+
+    # At most USER_STATE_MAX_USERS users' state in memory; the rest is read back from STATE_DB
+    user_states = UserStateCache(
+        application,
+        persistence,
+        conversations=[conv_handler],
+        max_users=int(os.getenv("USER_STATE_MAX_USERS", "10000")),
+        ttl=float(os.getenv("USER_STATE_TTL", "3600")),
+        conversation_timeout=float(os.getenv("CONVERSATION_TIMEOUT", "86400")),
+        metrics=bot_metrics,
+    )
+    shared_state_handlers = (TypeHandler(Update, load_shared_state), TypeHandler(Update, save_shared_state))
+    application.add_handler(shared_state_handlers[0], group=-1)
+    application.add_handler(conv_handler)
+    application.add_handler(CommandHandler("start", show_menu, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(CommandHandler("ping", ping, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(menu_router)
+    application.add_handler(shared_state_handlers[1], group=1)
+    instrument_handlers(application, bot_metrics)
+
+    # Acks update kinds no handler wants (edits, stickers, channel posts, ...) before de_json
+    update_prefilter = UpdatePrefilter(application, passive=shared_state_handlers, metrics=bot_metrics)
+
+    @catalog.on_reload
+    def rebuild_routes(content):
+        menu_router.replace(build_menu_routes(content))
+        registration_entry.replace({content.registration_labels: start_registration})
+        update_prefilter.invalidate()
+
+    # Announcements to every registered user, started from /admin/broadcasts
+    broadcaster = Broadcaster(
+        config.broadcast_dir,
+        application.bot,
+        lead_store,
+        rate=float(os.getenv("BROADCAST_RATE", "25")),
+        chat_rate=float(os.getenv("BROADCAST_CHAT_RATE", "1")),
+        concurrency=int(os.getenv("BROADCAST_CONCURRENCY", "8")),
+        metrics=bot_metrics,
+    )
+
+    bot = HostedBot(
+        config,
+        application,
+        lead_store=lead_store,
+        sheet_outbox=sheet_outbox,
+        sheet_reconciler=sheet_reconciler,
+        persistence=persistence,
+        catalog=catalog,
+        media_cache=media_cache,
+        analytics=analytics,
+        conv_handler=conv_handler,
+        menu_router=menu_router,
+        user_states=user_states,
+        update_prefilter=update_prefilter,
+        broadcaster=broadcaster,
+        health=(
+            "lead_store", "sheet_outbox", "sheet_reconciler", "persistence", "media_cache", "user_states", "broadcaster"
+        ),
+    )
+    for service in (sheet_outbox, sheet_reconciler, catalog, analytics, broadcaster):
+        bot.on_startup(service.start)
+        bot.on_shutdown(service.stop)
+    return bot
+
+
+# ========== BOTS ==========
+# The TELEGRAM_TOKEN bot, configured from the environment as before
+default_config = BotConfig(
+    DEFAULT_BOT,
+    TELEGRAM_TOKEN,
+    CONTENT_FILE,
+    leads_dir=LEADS_DIR,
+    outbox_dir=SHEET_OUTBOX_DIR,
+    analytics_dir=os.getenv("ANALYTICS_DIR", "analytics"),
+    broadcast_dir=os.getenv("BROADCAST_DIR", "broadcasts"),
+    sheet_url=GOOGLE_SHEET_WEBAPP_URL,
+    support_username=SUPPORT_USERNAME,
+    legacy_leads_file=LEADS_FILE,
+)
+default_bot = build_bot(default_config)
+
+# Its parts under the names they had when it was the only bot
+application = default_bot.application
+catalog = default_bot.catalog
+media_cache = default_bot.media_cache
+lead_store = default_bot.lead_store
+sheet_outbox = default_bot.sheet_outbox
+sheet_reconciler = default_bot.sheet_reconciler
+persistence = default_bot.persistence
+analytics = default_bot.analytics
+conv_handler = default_bot.conv_handler
+user_states = default_bot.user_states
+update_prefilter = default_bot.update_prefilter
+broadcaster = default_bot.broadcaster
+UPDATE_PREFILTER = os.getenv("UPDATE_PREFILTER", "1") == "1"
+
+# One long-lived event loop per worker; webhook threads hand updates to it.
+runtime = BotRuntime(application)
+runtime.on_shutdown(http_client.aclose)
+runtime.on_startup(profiler_control.start)
+runtime.on_shutdown(profiler_control.stop)
+
+# Bots from BOTS_FILE are built and started on their first update, on the same loop
+bots = BotRegistry(runtime, build_bot)
+bots.add(default_config, default_bot)
+for bot_config in load_bot_configs(BOTS_FILE, BOTS_DATA_DIR) if BOTS_FILE else ():
+    bots.add(bot_config)
+runtime.on_startup(default_bot.start_services)
+runtime.on_shutdown(default_bot.stop_services)
+
+
+async def process_raw_update(data: dict, bot: HostedBot, profile: bool = False):
+    with log_context(update_id=data["update_id"]):
+        update = Update.de_json(data, bot.application.bot)
+        coro = bot.application.process_update(update)
+        await (profiler.follow(coro) if profile else coro)
+
+
+update_queue = None
+if WEBHOOK_MODE == "queue":
+    update_queue = UpdateQueue(process_raw_update, workers=UPDATE_WORKERS, maxsize=UPDATE_QUEUE_SIZE)
+    runtime.on_startup(update_queue.start)
+    runtime.on_shutdown(update_queue.stop)
+    metrics.gauge_callback(
+        "update_queue_depth", "Updates waiting in the webhook queue.", lambda: update_queue.stats()["depth"]
+    )
 
 
 # ========== FLASK & WEBHOOK ==========
 flask_app = Flask(__name__)
 
-@flask_app.route(f"/webhook/{TELEGRAM_TOKEN}", methods=["POST"])
-def webhook():
+# Cold-start cost, reported on /healthz
+startup_timing = {"import_seconds": None, "runtime_start_seconds": None, "first_request_seconds": None}
+
+
+def ensure_runtime_started():
+    if runtime.started:
+        return
+    started = time.monotonic()
+    runtime.start()
+    profiler.watch(runtime.thread_id, "loop")
+    if startup_timing["runtime_start_seconds"] is None:
+        startup_timing["runtime_start_seconds"] = round(time.monotonic() - started, 4)
+        log.info("✅ Bot runtime started", extra={"seconds": startup_timing["runtime_start_seconds"]})
+
+
+@flask_app.after_request
+def record_first_request(response):
+    if startup_timing["first_request_seconds"] is None:
+        startup_timing["first_request_seconds"] = round(time.monotonic() - IMPORT_STARTED, 4)
+    return response
+
+# Per-user/per-chat limits checked on the raw payload; 0 disables a scope
+flood_guard = FloodGuard(
+    rate=float(os.getenv("FLOOD_RATE", "1")),
+    burst=float(os.getenv("FLOOD_BURST", "8")),
+    chat_rate=float(os.getenv("FLOOD_CHAT_RATE", "3")),
+    chat_burst=float(os.getenv("FLOOD_CHAT_BURST", "20")),
+    max_keys=int(os.getenv("FLOOD_MAX_KEYS", "50000")),
+    warn=os.getenv("FLOOD_WARN", "1") == "1",
+    metrics=metrics,
+)
+
+
+def screen_update(bot: HostedBot, data: dict):
+    """``(wanted, warning)`` for one raw update, the same for the webhook and polling.
+
+    The flood guard goes first, so a flood of updates the bot ignores still
+    counts against the sender, then the prefilter. ``wanted`` is False for an
+    update to skip; ``warning`` is ``(chat_id, reply)`` when it is the first
+    dropped update of a flood and the sender should be told to slow down.
+    """
+    verdict = flood_guard.check(data)
+    if verdict is not ALLOW:
+        reply = bot.catalog.current.replies.get("flood_warning")
+        chat_id = extract_chat_id(data)
+        if verdict is WARN and reply is not None and chat_id is not None:
+            return False, (chat_id, reply)
+        return False, None
+    if UPDATE_PREFILTER and not bot.update_prefilter.wanted(data):
+        return False, None
+    return True, None
+
+
+webhook_seconds = metrics.histogram("webhook_request_seconds", "Webhook request handling time.", ("status",))
+webhook_in_flight = metrics.gauge("webhook_in_flight", "Webhook requests being handled.")
+
+
+@flask_app.route("/webhook/<token>", methods=["POST"])
+def webhook(token):
+    bot = bots.get(token)
+    if bot is None:
+        return "not found", 404
+    webhook_in_flight.inc()
+    started = time.perf_counter()
+    status = 500
     try:
-        data = flask_request.get_json(force=True)
-        update = Update.de_json(data, application.bot)
-        asyncio.run(application.process_update(update))
+        request_id = flask_request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12]
+        profile = profiler.enabled and profiler.sample()
+        with log_context(request_id=request_id, bot=bot.name), profiler.profile() if profile else contextlib.nullcontext():
+            response = handle_webhook(bot)
+        status = response[1]
+        return response
+    finally:
+        webhook_in_flight.dec()
+        webhook_seconds.observe(time.perf_counter() - started, str(status))
+
+
+def handle_webhook(bot: HostedBot):
+    data = parse_update(flask_request.get_data())
+    if not is_valid_update(data):
+        return "bad update", 400
+    with log_context(update_id=data["update_id"]):
+        log.debug("📦 Raw update", extra={"event": "raw_update", "update": data})
+        try:
+            return dispatch_update(bot, data)
+        except Exception as e:
+            log.exception("❌ Webhook error: %s", e)
+            return "error", 500
+
+
+def run_on_loop(coro):
+    """Run ``coro`` on the bot loop; in a profiled request, also sample where it waits."""
+    if profiler.enabled and profiler.profiling():
+        coro = profiler.follow(coro)
+    return runtime.run(coro)
+
+
+def dispatch_update(bot: HostedBot, data: dict):
+    wanted, warning = screen_update(bot, data)
+    if not wanted:
+        if warning is not None:  # sent back as the webhook reply
+            chat_id, reply = warning
+            return jsonify(reply.webhook_body(chat_id)), 200
+        return "ok", 200
+    ensure_runtime_started()
+    bots.ensure_started(bot)
+    if update_queue is not None:
+        if not update_queue.put(data, bot, profiler.enabled and profiler.profiling()):
+            # Full: make Telegram redeliver later instead of piling up work
+            return "busy", 503, {"Retry-After": "1"}
         return "ok", 200
-    except Exception as e:
-        print("❌ Webhook error:", e)
-        return "error", 500
+    update = Update.de_json(data, bot.application.bot)
+    if INLINE_REPLIES:
+        reply = run_on_loop(process_update_inline(bot.application, update))
+        if reply is not None:
+            return jsonify(reply), 200
+    else:
+        run_on_loop(bot.application.process_update(update))
+    return "ok", 200
 
 
 @flask_app.route("/", methods=["GET"])
@@ -263,21 +648,238 @@ def index():
 
 @flask_app.route("/healthz", methods=["GET"])
 def health_check():
-    return {"status": "ok", "service": "digitalmarketingacademy-bot"}, 200
-
-
-def set_webhook():
+    body = {"status": "ok", "service": "digitalmarketingacademy-bot", "webhook_mode": WEBHOOK_MODE}
+    body["startup"] = startup_timing
+    if update_queue is not None:
+        body["update_queue"] = update_queue.stats()
+    body["lead_store"] = lead_store.stats()
+    body["sheet_outbox"] = sheet_outbox.stats()
+    body["sheet_reconcile"] = sheet_reconciler.stats()
+    body["persistence"] = persistence.stats()
+    body["media"] = media_cache.stats()
+    body["user_state"] = user_states.stats()
+    body["broadcast"] = broadcaster.stats()
+    body["flood_guard"] = flood_guard.stats()
+    body["update_prefilter"] = update_prefilter.stats()
+    body["logging"] = log_pipeline.stats()
+    body["bots"] = bots.stats()
+    body["profiler"] = profiler_control.stats()
+    if pollers:
+        body["polling"] = {name: poller.stats() for name, poller in pollers.items()}
+    return body, 200
+
+
+def require_admin():
+    """Return an error response unless the request carries ADMIN_TOKEN."""
+    if not ADMIN_TOKEN:
+        return "not found", 404
+    supplied = flask_request.headers.get("Authorization", "").removeprefix("Bearer ").strip()
+    supplied = supplied or flask_request.args.get("token", "")
+    if not hmac.compare_digest(supplied.encode(), ADMIN_TOKEN.encode()):
+        return "forbidden", 403
+    return None
+
+
+def admin_bot():
+    """The bot named by ``?bot=`` (default: the TELEGRAM_TOKEN one), or None if there is none."""
+    return bots.by_name(flask_request.args.get("bot") or DEFAULT_BOT)
+
+
+@flask_app.route("/admin/stats", methods=["GET"])
+def admin_stats():
+    denied = require_admin()
+    if denied:
+        return denied
+    bot = admin_bot()
+    if bot is None:
+        return "unknown bot", 404
     try:
-        asyncio.run(application.initialize())
-        webhook_url = f"{ROOT_URL.rstrip('/')}/webhook/{TELEGRAM_TOKEN}"
-        asyncio.run(application.bot.set_webhook(webhook_url))
-        print(f"✅ Webhook set to {webhook_url}")
-    except Exception as e:
-        print("⚠️ Webhook setup failed:", e)
-
-
-set_webhook()
+        hours = max(1, min(int(flask_request.args.get("hours", 24)), bot.analytics.hour_retention))
+        days = max(1, min(int(flask_request.args.get("days", 7)), bot.analytics.day_retention))
+    except ValueError:
+        return "bad hours/days", 400
+    return jsonify(bot.analytics.stats(hours=hours, days=days)), 200
+
+
+@flask_app.route("/admin/leads/export", methods=["GET"])
+def admin_export_leads():
+    denied = require_admin()
+    if denied:
+        return denied
+    bot = admin_bot()
+    if bot is None:
+        return "unknown bot", 404
+    try:
+        query = ExportQuery.from_args(flask_request.args, max_limit=EXPORT_MAX_ROWS)
+    except ValueError as e:
+        return str(e), 400
+    if not export_slots.acquire(blocking=False):
+        return "export already running", 429, {"Retry-After": "10"}
+    try:
+        bot.lead_store.refresh()  # leads other workers wrote since this one last did
+        compress = flask_request.accept_encodings["gzip"] > 0
+        response = Response(export_leads(bot.lead_store, query, compress=compress), mimetype=FORMATS[query.format])
+    except BaseException:
+        export_slots.release()
+        raise
+    response.call_on_close(export_slots.release)
+    filename = "leads" if bot.name == DEFAULT_BOT else f"leads-{bot.name}"
+    response.headers["Content-Disposition"] = f"attachment; filename={filename}.{query.format}"
+    # Rows past this seq did not exist when the export started
+    response.headers["X-Last-Seq"] = str(bot.lead_store.last_seq)
+    response.headers["Vary"] = "Accept-Encoding"
+    if compress:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+@flask_app.route("/admin/broadcasts", methods=["GET", "POST"])
+def admin_broadcasts():
+    denied = require_admin()
+    if denied:
+        return denied
+    bot = admin_bot()
+    if bot is None:
+        return "unknown bot", 404
+    if flask_request.method == "GET":
+        return jsonify(bot.broadcaster.recent()), 200
+    data = flask_request.get_json(force=True, silent=True) or {}
+    text = str(data.get("text") or "").strip()
+    if not text or len(text) > 4096:
+        return "text must be 1-4096 characters", 400
+    ensure_runtime_started()
+    bots.ensure_started(bot)
+    try:
+        state = runtime.run(
+            bot.broadcaster.launch(text, parse_mode=data.get("parse_mode"), dry_run=bool(data.get("dry_run"))),
+            timeout=10,
+        )
+    except BroadcastBusy as e:
+        return str(e), 409
+    return jsonify(state), 202
+
+
+@flask_app.route("/admin/broadcasts/<broadcast_id>", methods=["GET"])
+def admin_broadcast_status(broadcast_id):
+    denied = require_admin()
+    if denied:
+        return denied
+    bot = admin_bot()
+    if bot is None:
+        return "unknown bot", 404
+    state = bot.broadcaster.status(broadcast_id)
+    if state is None:
+        return "not found", 404
+    return jsonify(state), 200
+
+
+@flask_app.route("/admin/broadcasts/<broadcast_id>/cancel", methods=["POST"])
+def admin_broadcast_cancel(broadcast_id):
+    denied = require_admin()
+    if denied:
+        return denied
+    bot = admin_bot()
+    if bot is None:
+        return "unknown bot", 404
+    if not bot.broadcaster.cancel(broadcast_id):
+        return "not found", 404
+    return "cancelling", 202
+
+
+@flask_app.route("/admin/profile", methods=["GET", "POST"])
+def admin_profile():
+    """GET: collapsed stacks (``?reset=1`` clears them). POST: ``{"enabled", "every", "interval_ms", "reset"}``.
+
+    Both act on every worker through ``profiler_control``; other workers apply a
+    change and report their samples within ``poll_interval`` seconds.
+    """
+    denied = require_admin()
+    if denied:
+        return denied
+    if flask_request.method == "GET":
+        body = profiler_control.collapsed()
+        if flask_request.args.get("reset") == "1":
+            profiler_control.publish(reset=True)
+        return Response(body, mimetype="text/plain")
+    data = flask_request.get_json(force=True, silent=True) or {}
+    try:
+        every = int(data["every"]) if "every" in data else None
+        interval = float(data["interval_ms"]) / 1000 if "interval_ms" in data else None
+    except (TypeError, ValueError):
+        return "bad every/interval_ms", 400
+    enabled = bool(data["enabled"]) if "enabled" in data else None
+    profiler_control.publish(enabled=enabled, every=every, interval=interval, reset=bool(data.get("reset")))
+    return jsonify(profiler_control.stats()), 200
+
+
+@flask_app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# ========== POLLING ==========
+pollers = {}  # bot name -> UpdatePoller, when started with --polling
+
+
+async def poll_update(bot: HostedBot, data: dict):
+    """The webhook's filters and handlers for one update fetched with getUpdates."""
+    with log_context(bot=bot.name):
+        wanted, warning = screen_update(bot, data)
+        if not wanted:
+            if warning is not None:  # no webhook reply to carry it
+                chat_id, reply = warning
+                await bot.application.bot.send_message(
+                    chat_id, reply.text, parse_mode=reply.parse_mode, api_kwargs=reply.api_kwargs
+                )
+            return
+        await process_raw_update(data, bot)
+
+
+def start_polling():
+    """Delete every bot's webhook and fetch its updates with getUpdates instead."""
+    ensure_runtime_started()
+    for token in bots.tokens():
+        bot = bots.get(token)
+        bots.ensure_started(bot)
+        # Own connection per bot: a long poll holds it for up to POLL_TIMEOUT seconds
+        registrar = WebhookRegistrar(
+            token,
+            http_client=SharedHTTPClient(max_connections=1, timeout=POLL_TIMEOUT + 10),
+            api_base_url=TELEGRAM_API_BASE_URL,
+        )
+        poller = UpdatePoller(
+            registrar,
+            functools.partial(poll_update, bot),
+            limit=POLL_LIMIT,
+            timeout=POLL_TIMEOUT,
+            concurrency=POLL_CONCURRENCY,
+            name=bot.name,
+        )
+        runtime.run(poller.start())
+        runtime.on_shutdown(poller.stop)  # runs before the bots stop
+        pollers[bot.name] = poller
+
+
+# Importing does no network I/O: the runtime (getMe, background services) starts
+# on the first webhook request, and the webhook itself is registered once per
+# deploy by `python reset_webhook.py ensure`, not by every worker.
+atexit.register(runtime.stop)
+startup_timing["import_seconds"] = round(time.monotonic() - IMPORT_STARTED, 4)
 
 if __name__ == "__main__":
-    print("🚀 Starting Digital Marketing Academy Bot ...")
+    parser = argparse.ArgumentParser(description="Digital Marketing Academy Bot")
+    parser.add_argument(
+        "--polling", action="store_true", help="delete the webhooks and fetch updates with getUpdates"
+    )
+    args = parser.parse_args()
+    log.info("🚀 Starting Digital Marketing Academy Bot ...")
+    if args.polling:
+        start_polling()  # Flask still serves /healthz, /metrics and /admin
+    else:
+        for token in bots.tokens():
+            try:
+                webhook_url = webhook_url_for(ROOT_URL, token)
+                log.info("✅ Webhook %s", ensure_webhook(token, webhook_url, api_base_url=TELEGRAM_API_BASE_URL))
+            except Exception as e:
+                log.warning("⚠️ Webhook setup failed: %s", e)
     flask_app.run(host="0.0.0.0", port=PORT)
@@ -0,0 +1,123 @@
+"""Broadcast to every lead against a fake Bot API that enforces flood limits.
+
+The fake answers 429 (retry_after=1) above ``--api-rate`` messages/s overall
+or 1 message/s per chat, and 403 for the chats in ``--blocked``. Two runs:
+
+- ``full``: one uninterrupted broadcast.
+- ``resume``: the worker is stopped half-way and a new Broadcaster resumes
+  from the checkpoint.
+
+Reported: wall time, achieved rate, 429s received, blocked users pruned, and
+chats that got the message more than once.
+
+    python benchmarks/bench_broadcast.py --leads 2000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from broadcast import Broadcaster
+from lead_store import LeadStore
+
+TOKEN = "123:BROADCAST"
+
+
+def seed(store: LeadStore, leads: int):
+    for i in range(leads):
+        store.append({"name": f"u{i}", "email": f"u{i}@example.com", "user_id": 1000 + i, "status": "Validated"})
+    # A user who registered twice is messaged once
+    store.append({"name": "again", "email": "again@example.com", "user_id": 1000, "status": "Validated"})
+    store.flush()
+
+
+async def broadcast(workdir: str, api: FakeBotAPI, store: LeadStore, args, stop_after: float = None):
+    bot = Bot(TOKEN, base_url=api.base_url, request=HTTPXRequest(connection_pool_size=16))
+    await bot.initialize()
+    broadcaster = Broadcaster(
+        os.path.join(workdir, "broadcasts"), bot, store,
+        rate=args.rate, concurrency=args.concurrency, checkpoint_interval=0.2, idle_interval=0.1,
+    )
+    await broadcaster.start()
+    try:
+        running = broadcaster.recent()
+        if not running or running[0]["status"] != "running":
+            state = await broadcaster.launch("📣 announcement")
+        else:
+            state = running[0]
+            await asyncio.sleep(0.3)  # the watcher picks the run up
+        while True:
+            await asyncio.sleep(0.05)
+            current = broadcaster.status(state["id"])
+            if current["status"] != "running":
+                return current
+            if stop_after is not None and time.monotonic() >= stop_after:
+                return current
+    finally:
+        await broadcaster.stop()
+        await bot.shutdown()
+
+
+def run(mode: str, args) -> dict:
+    blocked = {1000 + i for i in range(0, args.leads, max(1, args.leads // max(1, args.blocked)))}
+    with FakeBotAPI(latency=args.latency, blocked_chats=blocked, rate_limit=args.api_rate,
+                    chat_rate_limit=1) as api, tempfile.TemporaryDirectory() as workdir:
+        store = LeadStore(os.path.join(workdir, "leads"))
+        seed(store, args.leads)
+        started = time.monotonic()
+        if mode == "resume":
+            halfway = started + args.leads / args.rate / 2
+            asyncio.run(broadcast(workdir, api, store, args, stop_after=halfway))
+        state = asyncio.run(broadcast(workdir, api, store, args))
+        elapsed = time.monotonic() - started
+        pruned = sum(1 for r in store.iter_records() if r.get("status") == "Blocked")
+        store.close()
+        return {
+            "mode": mode,
+            "status": state["status"],
+            "seconds": round(elapsed, 2),
+            "sent": state["sent"],
+            "rate_per_s": round(sum(api.delivered.values()) / elapsed, 1),
+            "flood_429s": api.flood_errors,
+            "blocked_pruned": pruned,
+            "failed": state["failed"],
+            "duplicates": sum(n - 1 for n in api.delivered.values() if n > 1),
+            "missing": args.leads - len(blocked) - len(api.delivered),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--leads", type=int, default=2000)
+    parser.add_argument("--blocked", type=int, default=50, help="users who blocked the bot")
+    parser.add_argument("--rate", type=float, default=25.0, help="broadcast rate limit (msg/s)")
+    parser.add_argument("--api-rate", type=float, default=30.0, help="fake Bot API flood limit (msg/s)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Bot API latency per call (s)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [run(mode, args) for mode in ("full", "resume")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['mode']:<6} {r['status']:<9} {r['seconds']:>7} s  {r['rate_per_s']:>6} msg/s  "
+            f"sent {r['sent']}  429s {r['flood_429s']}  blocked {r['blocked_pruned']}  "
+            f"failed {r['failed']}  duplicates {r['duplicates']}  missing {r['missing']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Per-update latency: asyncio.run() per update vs. the persistent BotRuntime loop.
+
+The ``inline`` mode additionally defers the reply into the webhook response
+(INLINE_REPLIES=1), so it makes no outbound sendMessage call per update.
+
+Mirrors render.yaml's ``gunicorn --worker-class gthread --threads 2`` by
+driving updates from a 2-thread pool against a local fake Bot API.
+
+    python benchmarks/bench_event_loop.py --updates 500 --threads 2
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Update
+from telegram.ext import Application, CommandHandler
+from telegram.request import HTTPXRequest
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from bot_runtime import BotRuntime
+from inline_reply import InlineReplyRequest, process_update_inline
+
+TOKEN = "123456:BENCH"
+
+
+async def ping(update, context):
+    await update.message.reply_text("pong")
+
+
+def build_application(base_url: str, errors: list, request_class=HTTPXRequest) -> Application:
+    request = request_class(connect_timeout=10, read_timeout=20, write_timeout=10, pool_timeout=10)
+    application = Application.builder().token(TOKEN).base_url(base_url).request(request).build()
+    application.add_handler(CommandHandler("ping", ping))
+
+    async def count_error(update, context):
+        errors.append(repr(context.error))
+
+    application.add_error_handler(count_error)
+    return application
+
+
+def make_update(i: int) -> dict:
+    chat_id = 1000 + i % 50
+    return {
+        "update_id": i,
+        "message": {
+            "message_id": i,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+            "text": "/ping",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 5}],
+        },
+    }
+
+
+def run_mode(mode: str, api: FakeBotAPI, updates: int, threads: int) -> dict:
+    errors = []
+    request_class = InlineReplyRequest if mode == "inline" else HTTPXRequest
+    application = build_application(api.base_url, errors, request_class)
+    if mode == "asyncio_run":
+        asyncio.run(application.initialize())
+
+        def handle(data):
+            update = Update.de_json(data, application.bot)
+            asyncio.run(application.process_update(update))
+    elif mode == "inline":
+        runtime = BotRuntime(application)
+        runtime.start()
+
+        def handle(data):
+            update = Update.de_json(data, application.bot)
+            json.dumps(runtime.run(process_update_inline(application, update)))
+    else:
+        runtime = BotRuntime(application)
+        runtime.start()
+
+        def handle(data):
+            update = Update.de_json(data, application.bot)
+            runtime.process_update(update)
+
+    def timed(i):
+        start = time.perf_counter()
+        handle(make_update(i))
+        return time.perf_counter() - start
+
+    sent_before = api.calls.get("sendMessage", 0)
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        latencies = sorted(pool.map(timed, range(updates)))
+    wall = time.perf_counter() - wall
+
+    if mode != "asyncio_run":
+        runtime.stop()
+
+    return {
+        "mode": mode,
+        "updates": updates,
+        "threads": threads,
+        "errors": len(errors),
+        "outbound_send_message": api.calls.get("sendMessage", 0) - sent_before,
+        "throughput_per_s": round(updates / wall, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake Bot API latency (s)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    with FakeBotAPI(latency=args.latency) as api:
+        for mode in ("asyncio_run", "runtime", "inline"):
+            results.append(run_mode(mode, api, args.updates, args.threads))
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['mode']:<12} {r['throughput_per_s']:>8} upd/s  mean {r['mean_ms']:>7} ms  "
+            f"p50 {r['p50_ms']:>7} ms  p95 {r['p95_ms']:>7} ms  errors {r['errors']}  "
+            f"sendMessage calls {r['outbound_send_message']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Outbound POST cost: requests.post in run_in_executor vs. the shared pooled httpx client.
+
+    python benchmarks/bench_http_client.py --requests 500 --concurrency 8 --tls
+
+Use ``--tls`` to serve the stand-in over HTTPS; that is where per-call
+connection setup really costs (the Apps Script endpoint is HTTPS-only).
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fake_sheet import FakeSheet, self_signed_context
+from http_client import SharedHTTPClient
+
+LEAD = {"name": "Bench", "email": "bench@example.com", "status": "Validated"}
+
+
+async def executor_post(url: str, _client, verify):
+    # The old post_to_sheet_async path: a fresh connection per call on the default executor
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(
+        None, lambda: requests.post(url, json=LEAD, timeout=(5, 10), verify=verify)
+    )
+
+
+async def shared_post(url: str, client: SharedHTTPClient, _verify):
+    await client.post(url, json=LEAD)
+
+
+async def run_mode(name, post, url, total, concurrency, verify):
+    client = SharedHTTPClient(verify=verify)
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await post(url, client, verify)
+            latencies.append(time.perf_counter() - start)
+
+    wall = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    wall = time.perf_counter() - wall
+    await client.aclose()
+    latencies.sort()
+    return {
+        "mode": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "throughput_per_s": round(total / wall, 1),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+    }
+
+
+async def main_async(args):
+    results = []
+    ssl_context, verify = self_signed_context() if args.tls else (None, True)
+    for name, post in (("executor_requests", executor_post), ("shared_httpx", shared_post)):
+        with FakeSheet(latency=args.latency, ssl_context=ssl_context) as sheet:
+            result = await run_mode(name, post, sheet.url, args.requests, args.concurrency, verify)
+            result["tls"] = args.tls
+            result["server_connections"] = sheet.connections
+            results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake sheet latency (s)")
+    parser.add_argument("--tls", action="store_true", help="serve the fake sheet over HTTPS")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['mode']:<18} {r['throughput_per_s']:>8} req/s  mean {r['mean_ms']:>7} ms  "
+            f"p95 {r['p95_ms']:>7} ms  connections {r['server_connections']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
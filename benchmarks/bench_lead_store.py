@@ -0,0 +1,93 @@
+"""Signup write cost as the lead store grows: legacy leads.json rewrite vs. LeadStore.
+
+    python benchmarks/bench_lead_store.py --sizes 1000 10000 100000
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lead_store import LeadStore
+
+
+def make_lead(i: int) -> dict:
+    return {
+        "name": f"User {i}",
+        "email": f"user{i}@example.com",
+        "user_id": 100000 + i,
+        "username": f"user{i}",
+        "status": "Validated",
+        "created_at": "2024-01-01T00:00:00+00:00",
+    }
+
+
+def bench_legacy(directory: str, size: int, samples: int) -> list:
+    path = os.path.join(directory, "leads.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([make_lead(i) for i in range(size)], f, ensure_ascii=False, indent=2)
+    timings = []
+    for i in range(samples):
+        start = time.perf_counter()
+        with open(path, "r", encoding="utf-8") as f:
+            leads = json.load(f)
+        leads.append(make_lead(size + i))
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(leads, f, ensure_ascii=False, indent=2)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_store(directory: str, size: int, samples: int) -> list:
+    store = LeadStore(os.path.join(directory, "leads"))
+    futures = [store.append(make_lead(i)) for i in range(size)]
+    for future in futures:
+        future.result()
+    timings = []
+    for i in range(samples):
+        start = time.perf_counter()
+        store.append(make_lead(size + i)).result()
+        timings.append(time.perf_counter() - start)
+    store.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--skip-legacy-above", type=int, default=100000)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for name, fn in (("legacy_json", bench_legacy), ("lead_store", bench_store)):
+            if name == "legacy_json" and size > args.skip_legacy_above:
+                continue
+            directory = tempfile.mkdtemp(prefix="bench-leads-")
+            try:
+                timings = sorted(fn(directory, size, args.samples))
+            finally:
+                shutil.rmtree(directory, ignore_errors=True)
+            results.append({
+                "store": name,
+                "existing_leads": size,
+                "mean_ms": round(statistics.mean(timings) * 1000, 3),
+                "p95_ms": round(timings[int(len(timings) * 0.95)] * 1000, 3),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['store']:<12} {r['existing_leads']:>8} leads  mean {r['mean_ms']:>9} ms  p95 {r['p95_ms']:>9} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Lesson media: first upload vs. cached file_id, and streamed vs. in-memory uploads.
+
+A fresh interpreter imports app.py with a content file whose first learning
+step carries a ``--size-mb`` video, against a local fake Bot API, and taps
+that step ``--requests`` times through ``flask_app``. Reported per mode:
+
+- ``cached``: MediaCache; the first tap uploads (streamed from disk), the
+  rest send the file_id.
+- ``in_memory``: the same video sent on every tap as PTB reads it,
+  ``reply_video(open(path, "rb"))``, i.e. the file fully in memory per send.
+
+MB sent is what the Bot API received over all taps; RSS is the process peak
+growth over the taps (Linux).
+
+    python benchmarks/bench_media.py --size-mb 50 --requests 20
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+CHILD = r"""
+import gc, json, sys, time
+import app
+requests, mode, video = int(sys.argv[1]), sys.argv[2], sys.argv[3]
+client = app.flask_app.test_client()
+url = f"/webhook/{app.TELEGRAM_TOKEN}"
+step = app.catalog.current.steps[0]
+label = step.labels[0] if isinstance(step.labels, tuple) else step.labels
+if mode == "in_memory":
+    step.media = ()
+    async def send_video(update, context):
+        await update.message.reply_video(open(video, "rb"), write_timeout=120)
+    app.application.add_handler(app.MessageHandler(app.filters.Text([label]), send_video), group=2)
+
+def rss():
+    # VmHWM, not ru_maxrss: the latter keeps the parent's peak across exec
+    gc.collect()
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("VmHWM")) * 1024
+
+def tap(update_id):
+    client.post(url, json={"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": label, "chat": {"id": update_id, "type": "private"},
+        "from": {"id": update_id, "is_bot": False, "first_name": "u"}}})
+
+client.post(url, json={"update_id": 1, "message": {"message_id": 1, "date": 0, "text": "/ping",
+    "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "u"},
+    "entities": [{"type": "bot_command", "offset": 0, "length": 5}]}})
+before = rss()
+latencies = []
+for i in range(requests):
+    started = time.perf_counter()
+    tap(1000 + i)
+    latencies.append(time.perf_counter() - started)
+print(json.dumps({"latencies": latencies, "rss_growth": rss() - before}), flush=True)
+"""
+
+
+def make_content(workdir: str, size_mb: int) -> tuple:
+    video = os.path.join(workdir, "lesson.mp4")
+    with open(video, "wb") as f:
+        for _ in range(size_mb):
+            f.write(os.urandom(2**20))
+    with open(os.path.join(ROOT, "content.json"), encoding="utf-8") as f:
+        content = json.load(f)
+    content["learning"][0]["media"] = [{"type": "video", "path": "lesson.mp4"}]
+    path = os.path.join(workdir, "content.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(content, f, ensure_ascii=False)
+    return path, video
+
+
+def run(api, mode: str, args, workdir: str) -> dict:
+    content_file, video = make_content(workdir, args.size_mb)
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN="123456:BENCH",
+        TELEGRAM_API_BASE_URL=api.root_url,
+        ROOT_URL="https://bench.invalid",
+        CONTENT_FILE=content_file,
+        STATE_DB=os.path.join(workdir, "state.db"),
+        FLOOD_RATE="0",
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=ROOT,
+    )
+    received, uploads = api.bytes_received, api.uploads
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, str(args.requests), mode, video],
+        cwd=workdir, env=env, stdout=subprocess.PIPE, text=True, check=True,
+    ).stdout
+    result = json.loads(next(line for line in out.splitlines() if line.startswith("{")))
+    latencies = result["latencies"]
+    return {
+        "mode": mode,
+        "first_ms": round(latencies[0] * 1000, 2),
+        "later_ms": round(sum(latencies[1:]) / max(1, len(latencies) - 1) * 1000, 2),
+        "uploads": api.uploads - uploads,
+        "mb_sent": round((api.bytes_received - received) / 2**20, 2),
+        "rss_growth_mb": round(result["rss_growth"] / 2**20, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-mb", type=int, default=50, help="size of the lesson video")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    with FakeBotAPI() as api:
+        for mode in ("cached", "in_memory"):
+            with tempfile.TemporaryDirectory() as workdir:
+                results.append(run(api, mode, args, workdir))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['mode']:<10} first {r['first_ms']:>8} ms  later {r['later_ms']:>8} ms  "
+            f"{r['uploads']:>3} uploads  {r['mb_sent']:>7} MB sent  RSS +{r['rss_growth_mb']} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
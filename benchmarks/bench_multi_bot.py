@@ -0,0 +1,118 @@
+"""What each extra bot costs when one process serves several (BOTS_FILE).
+
+A fresh interpreter imports app.py with ``--bots`` extra bots configured
+against a local fake Bot API (inline replies, so no API round trips), then
+sends one /start to each. Reported:
+
+- ``process``: peak RSS of a one-bot process after its first update, i.e. what a
+  separate service per bot would cost each time.
+- ``configured``: RSS added by configuring the bots, before they get updates.
+- ``per_bot``: RSS added per bot by building and starting it on its first update.
+- first-update latency of a bot (build + getMe + handlers) vs. a later update.
+
+    python benchmarks/bench_multi_bot.py --bots 10
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+CHILD = r"""
+import gc, json, os, resource, sys, time
+
+def rss():
+    gc.collect()
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def start(update_id):
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "text": "/start",
+            "chat": {"id": 7, "type": "private"}, "from": {"id": 7, "is_bot": False, "first_name": "u"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}
+
+import app
+client = app.flask_app.test_client()
+client.post(f"/webhook/{app.TELEGRAM_TOKEN}", json=start(1))
+process = rss()
+tokens = [t for t in app.bots.tokens() if t != app.TELEGRAM_TOKEN]
+first, later = [], []
+for i, token in enumerate(tokens):
+    started = time.perf_counter()
+    client.post(f"/webhook/{token}", json=start(10 + i))
+    first.append(time.perf_counter() - started)
+started_all = rss()
+for i, token in enumerate(tokens):
+    started = time.perf_counter()
+    client.post(f"/webhook/{token}", json=start(1000 + i))
+    later.append(time.perf_counter() - started)
+print(json.dumps({"process": process, "started_all": started_all,
+                  "first": first, "later": later}), flush=True)
+"""
+
+
+def run(api, bots: int, workdir: str, configured: bool) -> dict:
+    bots_file = os.path.join(workdir, "bots.json")
+    with open(bots_file, "w", encoding="utf-8") as f:
+        specs = [
+            {"name": f"bot{i}", "token": f"{1000 + i}:BENCH", "content_file": os.path.join(ROOT, "content.json")}
+            for i in range(bots if configured else 0)
+        ]
+        json.dump({"bots": specs}, f)
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN="123456:BENCH",
+        TELEGRAM_API_BASE_URL=api.root_url,
+        ROOT_URL="https://bench.invalid",
+        CONTENT_FILE=os.path.join(ROOT, "content.json"),
+        BOTS_FILE=bots_file,
+        INLINE_REPLIES="1",
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=ROOT,
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=workdir, env=env, stdout=subprocess.PIPE, text=True, check=True
+    ).stdout
+    return json.loads(next(line for line in out.splitlines() if line.startswith("{")))
+
+
+def mean_ms(values) -> float:
+    return round(sum(values) / len(values) * 1000, 2) if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bots", type=int, default=10, help="extra bots in BOTS_FILE")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    with FakeBotAPI() as api:
+        with tempfile.TemporaryDirectory() as workdir:
+            alone = run(api, args.bots, workdir, configured=False)
+        with tempfile.TemporaryDirectory() as workdir:
+            shared = run(api, args.bots, workdir, configured=True)
+    mb = 2**20
+    result = {
+        "bots": args.bots,
+        "process_mb": round(alone["process"] / mb, 2),
+        "configured_mb": round((shared["process"] - alone["process"]) / mb, 2),
+        "per_bot_mb": round((shared["started_all"] - shared["process"]) / args.bots / mb, 2),
+        "first_update_ms": mean_ms(shared["first"]),
+        "later_update_ms": mean_ms(shared["later"]),
+    }
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return
+    print(f"one process after its first update:  {result['process_mb']:>7} MB")
+    print(f"{args.bots} bots configured, idle:           +{result['configured_mb']:>6} MB")
+    print(f"per bot once started:               +{result['per_bot_mb']:>6} MB")
+    print(f"first update to a bot {result['first_update_ms']:>7} ms, later updates {result['later_update_ms']:>6} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Throughput of long polling (``python app.py --polling``) vs. the webhook.
+
+``--updates`` menu taps from ``--chats`` chats go through app.py in a fresh
+interpreter against a local fake Bot API with ``--api-latency`` per call:
+
+- ``webhook``: posted to ``flask_app`` from ``--connections`` threads, like
+  Telegram's max_connections; each chat's updates come from one thread, in
+  order.
+- ``webhook-queue``: the same with WEBHOOK_MODE=queue (UPDATE_WORKERS consumers).
+- ``polling``: queued on the fake API, then fetched with getUpdates by
+  ``start_polling()`` (POLL_LIMIT, POLL_CONCURRENCY).
+
+    python benchmarks/bench_polling.py --updates 5000 --chats 500
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+TAP = "🎓 آموزش رایگان"
+
+CHILD = r"""
+import json, sys, time
+from concurrent.futures import ThreadPoolExecutor
+import app
+mode, count, connections = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+updates = json.loads(sys.stdin.read())
+started = time.perf_counter()
+if mode == "polling":
+    app.start_polling()
+    poller = app.pollers["default"]
+    while poller.stats()["updates"] < count:
+        time.sleep(0.002)
+else:
+    url = f"/webhook/{app.TELEGRAM_TOKEN}"
+    lanes = [[] for _ in range(connections)]
+    for update in updates:
+        lanes[update["message"]["chat"]["id"] % connections].append(update)
+    def deliver(lane):
+        client = app.flask_app.test_client()
+        for update in lane:
+            while client.post(url, json=update).status_code == 503:
+                time.sleep(0.01)  # queue full: Telegram would redeliver
+    with ThreadPoolExecutor(connections) as pool:
+        list(pool.map(deliver, lanes))
+    if app.update_queue is not None:
+        while app.update_queue.stats()["processed"] < count:
+            time.sleep(0.002)
+elapsed = time.perf_counter() - started
+app.runtime.stop()
+print(json.dumps({"seconds": elapsed}), flush=True)
+"""
+
+
+def make_updates(count: int, chats: int) -> list:
+    return [
+        {
+            "update_id": i + 1,
+            "message": {
+                "message_id": i + 1, "date": 0, "text": TAP,
+                "chat": {"id": 1 + i % chats, "type": "private"},
+                "from": {"id": 1 + i % chats, "is_bot": False, "first_name": "u"},
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def run(api, mode: str, args, workdir: str) -> dict:
+    updates = make_updates(args.updates, args.chats)
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN="123456:BENCH",
+        TELEGRAM_API_BASE_URL=api.root_url,
+        ROOT_URL="https://bench.invalid",
+        CONTENT_FILE=os.path.join(ROOT, "content.json"),
+        WEBHOOK_MODE="queue" if mode == "webhook-queue" else "sync",
+        UPDATE_QUEUE_SIZE=str(args.updates),  # measure the queue, not redeliveries
+        POLL_LIMIT=str(args.limit),
+        POLL_CONCURRENCY=str(args.concurrency),
+        FLOOD_RATE="0",
+        FLOOD_CHAT_RATE="0",
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=ROOT,
+    )
+    if mode == "polling":
+        api.push_updates(updates)
+    sends = api.calls.get("sendMessage", 0)
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, mode, str(args.updates), str(args.connections)],
+        input=json.dumps(updates), cwd=workdir, env=env, stdout=subprocess.PIPE, text=True, check=True,
+    ).stdout
+    seconds = json.loads(next(line for line in out.splitlines() if line.startswith("{")))["seconds"]
+    return {
+        "mode": mode,
+        "seconds": round(seconds, 3),
+        "updates_per_s": round(args.updates / seconds, 1),
+        "replies": api.calls.get("sendMessage", 0) - sends,
+        "get_updates_calls": api.calls.get("getUpdates", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--connections", type=int, default=40, help="concurrent webhook deliveries")
+    parser.add_argument("--limit", type=int, default=100, help="POLL_LIMIT")
+    parser.add_argument("--concurrency", type=int, default=32, help="POLL_CONCURRENCY")
+    parser.add_argument("--api-latency", type=float, default=0.005, help="fake Bot API latency, seconds")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for mode in ("webhook", "webhook-queue", "polling"):
+        with FakeBotAPI(latency=args.api_latency) as api, tempfile.TemporaryDirectory() as workdir:
+            results.append(run(api, mode, args, workdir))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['mode']:<14} {r['seconds']:>7} s  {r['updates_per_s']:>8} updates/s  "
+            f"{r['replies']} replies  {r['get_updates_calls']} getUpdates calls"
+        )
+
+
+if __name__ == "__main__":
+    main()
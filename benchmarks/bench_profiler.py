@@ -0,0 +1,102 @@
+"""Webhook latency with the sampling profiler off and on.
+
+Runs app.py in a fresh interpreter against a local fake Bot API and sends
+``--requests`` menu taps through ``flask_app`` one after another, in each of:
+
+- ``off``: profiler disabled (the default).
+- ``every=N``: 1 in ``--every`` requests profiled.
+- ``every=1``: every request profiled.
+
+    python benchmarks/bench_profiler.py --requests 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+CHILD = r"""
+import json, sys, time
+import app
+requests, every = int(sys.argv[1]), int(sys.argv[2])
+client = app.flask_app.test_client()
+url = f"/webhook/{app.TELEGRAM_TOKEN}"
+
+def tap(update_id):
+    client.post(url, json={"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": "🎓 آموزش رایگان", "chat": {"id": update_id, "type": "private"},
+        "from": {"id": update_id, "is_bot": False, "first_name": "u"}}})
+
+for i in range(50):
+    tap(i + 1)  # warm up: runtime, pool, caches
+if every:
+    app.profiler.enable(every=every)
+latencies = []
+for i in range(requests):
+    started = time.perf_counter()
+    tap(1000 + i)
+    latencies.append(time.perf_counter() - started)
+stats = app.profiler.stats()
+app.profiler.disable()
+print(json.dumps({"latencies": latencies, "samples": stats["samples"], "stacks": stats["stacks"]}), flush=True)
+"""
+
+
+def run(api, every: int, args, workdir: str) -> dict:
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN="123456:BENCH",
+        TELEGRAM_API_BASE_URL=api.root_url,
+        ROOT_URL="https://bench.invalid",
+        CONTENT_FILE=os.path.join(ROOT, "content.json"),
+        FLOOD_RATE="0",
+        LOG_LEVEL="WARNING",
+        PYTHONPATH=ROOT,
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, str(args.requests), str(every)],
+        cwd=workdir, env=env, stdout=subprocess.PIPE, text=True, check=True,
+    ).stdout
+    result = json.loads(next(line for line in out.splitlines() if line.startswith("{")))
+    latencies = sorted(result["latencies"])
+    return {
+        "mode": f"every={every}" if every else "off",
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 3),
+        "samples": result["samples"],
+        "stacks": result["stacks"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--every", type=int, default=20, help="PROFILE_EVERY of the sampled run")
+    parser.add_argument("--api-latency", type=float, default=0.005, help="fake Bot API latency, seconds")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    with FakeBotAPI(latency=args.api_latency) as api:
+        for every in (0, args.every, 1):
+            with tempfile.TemporaryDirectory() as workdir:
+                results.append(run(api, every, args, workdir))
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['mode']:<9} mean {r['mean_ms']:>7} ms  p50 {r['p50_ms']:>7} ms  p99 {r['p99_ms']:>7} ms  "
+            f"{r['samples']:>6} samples in {r['stacks']} stacks"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Cost of one Sheet reconciliation run as the lead store grows.
+
+For each size, the store holds that many leads already reconciled, then
+``--new`` more arrive, half of which never reach the outbox. Compared:
+
+- ``full``: the old manual way, hashing every stored lead.
+- ``incremental``: SheetReconciler.reconcile(), which reads from its
+  high-water mark.
+
+    python benchmarks/bench_reconcile.py --sizes 10000 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lead_store import LeadStore
+from sheet_outbox import SheetOutbox
+from sheet_reconcile import SheetReconciler, content_hash
+
+
+def seed(store: LeadStore, start: int, count: int):
+    futures = [
+        store.append({"name": f"u{i}", "email": f"u{i}@example.com", "user_id": i, "status": "Validated"})
+        for i in range(start, start + count)
+    ]
+    store.flush()
+    return [f.result() for f in futures]
+
+
+def run(size: int, new: int) -> dict:
+    with tempfile.TemporaryDirectory() as workdir:
+        store = LeadStore(os.path.join(workdir, "leads"), compact_interval=1e9)
+        outbox = SheetOutbox(os.path.join(workdir, "outbox"), None, None)
+        reconciler = SheetReconciler(store, outbox, os.path.join(workdir, "outbox", "reconcile.json"))
+        seed(store, 0, size)
+        reconciler.reconcile()  # first run: everything stored so far counts as delivered
+
+        leads = seed(store, size, new)
+        outbox.enqueue_many(leads[::2])
+
+        started = time.perf_counter()
+        hashes = {r["lead_id"]: content_hash(r) for r in store.iter_records()}
+        full = time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = reconciler.reconcile()
+        incremental = time.perf_counter() - started
+        store.close()
+        return {
+            "leads": size + new,
+            "full_ms": round(full * 1000, 2),
+            "full_scanned": len(hashes),
+            "incremental_ms": round(incremental * 1000, 2),
+            "incremental_scanned": result["scanned"],
+            "resent": result["resent"],
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--new", type=int, default=200, help="leads since the last run")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = [run(size, args.new) for size in args.sizes]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['leads']:>8} leads  full {r['full_ms']:>9} ms ({r['full_scanned']} read)  "
+            f"incremental {r['incremental_ms']:>7} ms ({r['incremental_scanned']} read, {r['resent']} re-sent)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Per-message dispatch overhead: regex MessageHandler chain vs. MenuRouter.
+
+Replays the handler scan Application.process_update does for each text
+message (first handler whose check_update() matches wins), without network.
+
+    python benchmarks/bench_router.py --rounds 20000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from telegram import Bot, Update
+from telegram.ext import CommandHandler, ConversationHandler, MessageHandler, filters
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from menu_router import MenuRouter
+
+LABELS = {
+    "^(🏁 شروع|🏁 منو اصلی)$": ("🏁 شروع", "🏁 منو اصلی"),
+    "^(📘 درباره ما)$": ("📘 درباره ما",),
+    "^(🎓 آموزش رایگان|🎓 بریم سراغ آموزش)$": ("🎓 آموزش رایگان", "🎓 بریم سراغ آموزش"),
+    "^(➡️ مرحله ۲)$": ("➡️ مرحله ۲",),
+    "^(➡️ مرحله ۳)$": ("➡️ مرحله ۳",),
+    "^(💼 فرانچایز)$": ("💼 فرانچایز",),
+    "^(📅 رزرو جلسه)$": ("📅 رزرو جلسه",),
+    "^(💬 پشتیبانی)$": ("💬 پشتیبانی",),
+}
+ENTRY = ("📥 دریافت اطلاعات", "دریافت اطلاعات")
+
+
+async def noop(update, context):
+    return None
+
+
+def conversation(entry):
+    return ConversationHandler(
+        entry_points=[entry],
+        states={0: [MessageHandler(filters.TEXT & ~filters.COMMAND, noop)]},
+        fallbacks=[],
+    )
+
+
+def regex_handlers():
+    entry = MessageHandler(filters.Regex("^(📥 دریافت اطلاعات|دریافت اطلاعات)$"), noop)
+    handlers = [conversation(entry), CommandHandler("start", noop), CommandHandler("ping", noop)]
+    handlers += [MessageHandler(filters.Regex(pattern), noop) for pattern in LABELS]
+    return handlers
+
+
+def router_handlers():
+    entry = MenuRouter({ENTRY: noop})
+    router = MenuRouter({labels: noop for labels in LABELS.values()})
+    return [conversation(entry), CommandHandler("start", noop), CommandHandler("ping", noop), router]
+
+
+def make_updates(bot):
+    texts = [label for labels in LABELS.values() for label in labels] + ["hello there", "/start"]
+    updates = []
+    for i, text in enumerate(texts):
+        message = {
+            "message_id": i,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "u"},
+            "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        updates.append(Update.de_json({"update_id": i, "message": message}, bot))
+    return updates
+
+
+def dispatch(handlers, update):
+    for handler in handlers:
+        check = handler.check_update(update)
+        if not (check is None or check is False):
+            return handler
+    return None
+
+
+def bench(handlers, updates, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for update in updates:
+            dispatch(handlers, update)
+    elapsed = time.perf_counter() - start
+    return elapsed / (rounds * len(updates))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20000)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    with FakeBotAPI() as api:
+        bot = Bot("123456:BENCH", base_url=api.base_url)
+        asyncio.run(bot.initialize())  # CommandHandler needs bot.username
+    updates = make_updates(bot)
+    results = [
+        {"dispatch": name, "handlers": len(handlers), "us_per_message": round(bench(handlers, updates, args.rounds) * 1e6, 3)}
+        for name, handlers in (("regex_chain", regex_handlers()), ("menu_router", router_handlers()))
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['dispatch']:<12} {r['handlers']:>3} handlers  {r['us_per_message']:>8} µs/message")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Cold start: time from importing app.py to the first answered webhook request.
+
+Each run starts a fresh interpreter against a local fake Bot API.
+
+- ``lazy``: the current import path, which makes no network calls.
+- ``eager``: the previous behaviour, where every worker started the runtime and
+  called setWebhook while importing.
+
+    python benchmarks/bench_startup.py --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+CHILD = r"""
+import json, sys, time
+started = time.monotonic()
+import app
+if sys.argv[1] == "eager":
+    app.ensure_runtime_started()
+    app.runtime.run(app.application.bot.set_webhook(app.webhook_url_for(app.ROOT_URL, app.TELEGRAM_TOKEN)))
+imported = time.monotonic()
+print("imported", flush=True)
+sys.stdin.readline()
+update = {"update_id": 1, "message": {"message_id": 1, "date": 0, "text": "/start",
+          "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "u"},
+          "entities": [{"type": "bot_command", "offset": 0, "length": 6}]}}
+before = time.monotonic()
+status = app.flask_app.test_client().post(f"/webhook/{app.TELEGRAM_TOKEN}", json=update).status_code
+done = time.monotonic()
+print(json.dumps({"status": status, "import_s": imported - started, "first_request_s": done - before,
+                  "import_to_first_request_s": done - started}), flush=True)
+"""
+
+
+def cold_start(api, mode: str, workdir: str) -> dict:
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN="123456:BENCH",
+        TELEGRAM_API_BASE_URL=api.root_url,
+        ROOT_URL="https://bench.invalid",
+        CONTENT_FILE=os.path.join(ROOT, "content.json"),
+        PYTHONPATH=ROOT,
+    )
+    child = subprocess.Popen(
+        [sys.executable, "-c", CHILD, mode],
+        cwd=workdir, env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True,
+    )
+    while child.stdout.readline().strip() != "imported":
+        pass
+    calls_at_import = sum(api.calls.values())
+    child.stdin.write("go\n")
+    child.stdin.flush()
+    line = child.stdout.readline()
+    while not line.startswith("{"):  # skip the app's own log lines
+        line = child.stdout.readline()
+    result = json.loads(line)
+    child.stdin.close()
+    child.wait()
+    result["api_calls_at_import"] = calls_at_import
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake Bot API latency per call (s)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for mode in ("eager", "lazy"):
+        runs = []
+        for _ in range(args.runs):
+            with FakeBotAPI(latency=args.latency) as api, tempfile.TemporaryDirectory() as workdir:
+                runs.append(cold_start(api, mode, workdir))
+        results.append({
+            "mode": mode,
+            "import_ms": round(statistics.median(r["import_s"] for r in runs) * 1000, 1),
+            "first_request_ms": round(statistics.median(r["first_request_s"] for r in runs) * 1000, 1),
+            "import_to_first_request_ms": round(
+                statistics.median(r["import_to_first_request_s"] for r in runs) * 1000, 1
+            ),
+            "api_calls_at_import": max(r["api_calls_at_import"] for r in runs),
+        })
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['mode']:<6} import {r['import_ms']:>7} ms  first request {r['first_request_ms']:>7} ms  "
+            f"import→first request {r['import_to_first_request_ms']:>7} ms  "
+            f"API calls at import {r['api_calls_at_import']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
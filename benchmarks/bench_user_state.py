@@ -0,0 +1,126 @@
+"""Memory held per user after many users abandon registration at ASK_EMAIL.
+
+Each run starts a fresh interpreter that imports app.py against a local fake
+Bot API (inline replies, so no API round trips) and sends, for every user,
+"📥 دریافت اطلاعات" and a name, then nothing more. Memory is the growth of
+the process's peak RSS from after the first update until the last.
+
+- ``unbounded``: no limit on users in memory (the previous behaviour).
+- ``bounded``: ``USER_STATE_MAX_USERS=--max-users``.
+
+Also reported: the size of one user_data record as a dict and as UserState.
+
+    python benchmarks/bench_user_state.py --users 20000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from user_state import UserState
+
+CHILD = r"""
+import gc, json, resource, sys, time
+import app
+users = int(sys.argv[1])
+client = app.flask_app.test_client()
+url = f"/webhook/{app.TELEGRAM_TOKEN}"
+
+def send(update_id, user_id, text):
+    client.post(url, json={"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "text": text, "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "is_bot": False, "first_name": "u"}}})
+
+send(1, 1, "/start")
+gc.collect()
+before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+started = time.monotonic()
+for i in range(users):
+    send(10 + 2 * i, 1000 + i, "📥 دریافت اطلاعات")
+    send(11 + 2 * i, 1000 + i, f"user {i}")
+app.runtime.run(app.persistence.flush())
+elapsed = time.monotonic() - started
+held = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024 - before
+print(json.dumps({
+    "held_bytes": held, "seconds": elapsed,
+    "user_data": len(app.application.user_data),
+    "conversations": len(app.conv_handler._conversations),
+}), flush=True)
+"""
+
+
+def run(api, mode: str, args, workdir: str) -> dict:
+    env = dict(
+        os.environ,
+        TELEGRAM_TOKEN="123456:BENCH",
+        TELEGRAM_API_BASE_URL=api.root_url,
+        ROOT_URL="https://bench.invalid",
+        CONTENT_FILE=os.path.join(ROOT, "content.json"),
+        INLINE_REPLIES="1",
+        FLOOD_RATE="0",
+        LOG_LEVEL="WARNING",
+        USER_STATE_MAX_USERS=str(args.max_users if mode == "bounded" else 10**9),
+        USER_STATE_TTL="0",
+        PYTHONPATH=ROOT,
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, str(args.users)],
+        cwd=workdir, env=env, stdout=subprocess.PIPE, text=True, check=True,
+    ).stdout
+    result = json.loads(next(line for line in out.splitlines() if line.startswith("{")))
+    return {
+        "mode": mode,
+        "users": args.users,
+        "user_data_in_memory": result["user_data"],
+        "conversations_in_memory": result["conversations"],
+        "rss_growth_mb": round(result["held_bytes"] / 2**20, 2),
+        "mb_per_10k_users": round(result["held_bytes"] / args.users * 10_000 / 2**20, 2),
+        "updates_per_s": round(2 * args.users / result["seconds"]),
+    }
+
+
+def record_bytes(factory, n: int = 10_000) -> int:
+    """Bytes per record holding a name and a timestamp."""
+    tracemalloc.start()
+    records = [factory() for _ in range(n)]
+    for i, record in enumerate(records):
+        record["name"] = "name"
+        record["seen"] = 1_700_000_000 + i
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return round(size / n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--max-users", type=int, default=1000, help="USER_STATE_MAX_USERS of the bounded run")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    for mode in ("unbounded", "bounded"):
+        with FakeBotAPI() as api, tempfile.TemporaryDirectory() as workdir:
+            results.append(run(api, mode, args, workdir))
+    records = {"dict": record_bytes(dict), "UserState": record_bytes(UserState)}
+    if args.json:
+        print(json.dumps({"runs": results, "record_bytes": records}, indent=2))
+        return
+    for r in results:
+        print(
+            f"{r['mode']:<9} {r['users']} users  in memory: user_data {r['user_data_in_memory']:>6}  "
+            f"conversations {r['conversations_in_memory']:>6}  RSS +{r['rss_growth_mb']:>7} MB  "
+            f"{r['mb_per_10k_users']:>6} MB/10k users  {r['updates_per_s']:>5} updates/s"
+        )
+    print(f"user_data record: dict {records['dict']} B, UserState {records['UserState']} B")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Minimal local stand-in for api.telegram.org used by the benchmarks.
+
+Serves ``/bot<token>/<method>`` with canned Bot API responses and an optional
+artificial latency so benchmarks can run without network access. It can also
+play Telegram's flood control (``rate_limit`` sends per second overall,
+``chat_rate_limit`` per chat, answered with 429 and ``retry_after``) and
+users who blocked the bot (``blocked_chats``, answered with 403).
+Media sends (multipart uploads or a ``file_id``) are answered with a
+message carrying the media and a ``file_id``; ``bytes_received`` counts
+request body bytes. Updates given to ``push_updates`` are served by
+``getUpdates`` (long polling, offsets, 409 while a webhook is set).
+"""
+import json
+import threading
+import time
+from collections import deque
+from email import policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "BenchBot", "username": "bench_bot"}
+MEDIA_KINDS = ("photo", "video", "document", "audio", "animation")
+UPLOADED = object()  # a multipart field that carried a file
+
+
+class FakeBotAPI:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        blocked_chats=(),
+        rate_limit: float = None,
+        chat_rate_limit: float = None,
+    ):
+        self.latency = latency
+        self.blocked_chats = set(blocked_chats)
+        self.rate_limit = rate_limit
+        self.chat_rate_limit = chat_rate_limit
+        self.calls = {}
+        self.delivered = {}  # chat_id -> messages accepted
+        self.flood_errors = 0
+        self.bytes_received = 0
+        self.uploads = 0
+        self._recent_sends = deque()
+        self._chat_last_send = {}
+        self._lock = threading.Lock()
+        self._updates_ready = threading.Condition(self._lock)
+        self._updates = []  # pushed and not yet confirmed by a getUpdates offset
+        self._message_id = 0
+        self.webhook_url = ""
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/bot"
+
+    @property
+    def root_url(self) -> str:
+        """Server root, as expected by ``TELEGRAM_API_BASE_URL``."""
+        return self.base_url[: -len("/bot")]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def push_updates(self, updates):
+        with self._updates_ready:
+            self._updates.extend(updates)
+            self._updates_ready.notify_all()
+
+    def _get_updates(self, params: dict):
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        deadline = time.monotonic() + float(params.get("timeout") or 0)
+        with self._updates_ready:
+            if self.webhook_url:
+                raise _APIError(409, "Conflict: can't use getUpdates method while webhook is active")
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates and deadline > time.monotonic():
+                self._updates_ready.wait(deadline - time.monotonic())
+            return self._updates[:limit]
+
+    def _record(self, method: str):
+        with self._lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+            self._message_id += 1
+            return self._message_id
+
+    def _result(self, method: str, params: dict):
+        message_id = self._record(method)
+        if method == "getMe":
+            return BOT_USER
+        if method == "getWebhookInfo":
+            return {"url": self.webhook_url, "has_custom_certificate": False, "pending_update_count": 0}
+        if method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+        if method == "deleteWebhook":
+            self.webhook_url = ""
+        if method == "getUpdates":
+            return self._get_updates(params)
+        if method.startswith("send"):
+            chat_id = int(params.get("chat_id", 0))
+            self._check_send(chat_id)
+            message = {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": BOT_USER,
+                "text": params.get("text", ""),
+            }
+            for kind in MEDIA_KINDS:
+                if kind in params:
+                    message[kind] = self._media(kind, params[kind], message_id)
+            return message
+        return True
+
+    def _media(self, kind: str, value, message_id: int):
+        if value is UPLOADED:
+            with self._lock:
+                self.uploads += 1
+            value = f"fake-{kind}-{message_id}"
+        media = {"file_id": value, "file_unique_id": value, "width": 1, "height": 1, "duration": 1}
+        return [media] if kind == "photo" else media
+
+    def _check_send(self, chat_id: int):
+        if chat_id in self.blocked_chats:
+            raise _APIError(403, "Forbidden: bot was blocked by the user")
+        now = time.monotonic()
+        with self._lock:
+            while self._recent_sends and now - self._recent_sends[0] >= 1.0:
+                self._recent_sends.popleft()
+            last = self._chat_last_send.get(chat_id)
+            if (self.rate_limit and len(self._recent_sends) >= self.rate_limit) or (
+                self.chat_rate_limit and last is not None and now - last < 1.0 / self.chat_rate_limit
+            ):
+                self.flood_errors += 1
+                raise _APIError(429, "Too Many Requests: retry after 1", {"retry_after": 1})
+            self._recent_sends.append(now)
+            self._chat_last_send[chat_id] = now
+            self.delivered[chat_id] = self.delivered.get(chat_id, 0) + 1
+
+    def _make_handler(self):
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            wbufsize = 1 << 16
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                with api._lock:
+                    api.bytes_received += len(body)
+                content_type = self.headers.get("Content-Type", "")
+                if "json" in content_type and body:
+                    params = json.loads(body)
+                elif "urlencoded" in content_type:
+                    params = dict(parse_qsl(body.decode()))
+                elif "multipart" in content_type:
+                    params = _multipart_params(content_type, body)
+                else:
+                    params = {}
+                method = self.path.rsplit("/", 1)[-1]
+                if api.latency:
+                    time.sleep(api.latency)
+                try:
+                    status, body = 200, {"ok": True, "result": api._result(method, params)}
+                except _APIError as e:
+                    status, body = e.code, {"ok": False, "error_code": e.code, "description": e.description}
+                    if e.parameters:
+                        body["parameters"] = e.parameters
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            do_GET = do_POST
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _multipart_params(content_type: str, body: bytes) -> dict:
+    message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    params = {}
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        params[name] = UPLOADED if part.get_filename() else part.get_content()
+    return params
+
+
+class _APIError(Exception):
+    def __init__(self, code: int, description: str, parameters: dict = None):
+        super().__init__(description)
+        self.code = code
+        self.description = description
+        self.parameters = parameters
@@ -0,0 +1,111 @@
+"""Local stand-in for the Google Sheet Web App (Apps Script ``doPost``).
+
+Accepts a single lead or ``{"leads": [...]}`` per POST, records what it got,
+and can inject latency or a failure rate.
+"""
+import json
+import os
+import random
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def self_signed_context():
+    """Server SSL context with a throwaway self-signed cert (needs the openssl CLI)."""
+    directory = tempfile.mkdtemp(prefix="fake-sheet-tls-")
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+         "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", key, "-out", cert],
+        check=True, capture_output=True,
+    )
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert, key)
+    return context, cert
+
+
+class FakeSheet:
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        ssl_context=None,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rows = []
+        self.posts = 0
+        self.connections = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self.server.daemon_threads = True
+        self.scheme = "http"
+        if ssl_context is not None:
+            # Handshake lazily so it runs in the per-connection thread, not in accept()
+            self.server.socket = ssl_context.wrap_socket(
+                self.server.socket, server_side=True, do_handshake_on_connect=False
+            )
+            self.scheme = "https"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{self.scheme}://{host}:{port}/exec"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _make_handler(self):
+        sheet = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+            wbufsize = 1 << 16
+
+            def setup(self):
+                super().setup()
+                with sheet._lock:
+                    sheet.connections += 1
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                if sheet.latency:
+                    time.sleep(sheet.latency)
+                failed = sheet.failure_rate and random.random() < sheet.failure_rate
+                if not failed:
+                    rows = body["leads"] if isinstance(body, dict) and "leads" in body else [body]
+                    now = time.time()
+                    with sheet._lock:
+                        sheet.posts += 1
+                        sheet.rows.extend((now, row) for row in rows)
+                payload = b'{"result":"error"}' if failed else b'{"result":"success"}'
+                self.send_response(500 if failed else 200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
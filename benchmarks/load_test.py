@@ -0,0 +1,349 @@
+"""Load test: replay synthetic update streams against the real ``flask_app``.
+
+Starts a local fake Bot API and a fake Google Sheet, imports ``app`` against
+them (state goes to a temporary directory) and serves it on a local threaded
+WSGI server. Virtual users then post webhook updates over keep-alive
+connections, each user's messages in order, with exponential think time so the
+offered load averages ``--rate`` updates/s. The update stream mixes:
+
+- ``menu``: button taps and /start.
+- ``registration``: full sign-ups, sometimes with an invalid e-mail first.
+- ``junk``: free text, stickers, edited messages and malformed bodies.
+
+The report covers throughput, webhook latency percentiles per kind, lead-write
+latency (append to fsync) and Google Sheet delivery lag (lead creation to
+receipt by the fake sheet). Write it with ``--out`` and compare a later run
+with ``--baseline`` to catch regressions.
+
+    python benchmarks/load_test.py --rate 200 --duration 20 --out before.json
+    python benchmarks/load_test.py --rate 200 --duration 20 --baseline before.json
+"""
+import argparse
+import contextlib
+import http.client
+import itertools
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks.fake_bot_api import FakeBotAPI
+from benchmarks.fake_sheet import FakeSheet
+
+TOKEN = "123456:BENCH"
+DEFAULT_MIX = "menu=0.6,registration=0.25,junk=0.15"
+# Latency metrics compared against --baseline; higher is worse
+BASELINE_METRICS = (
+    ("webhook_ms", "all", "p95"),
+    ("webhook_ms", "all", "p99"),
+    ("lead_write_ms", None, "p95"),
+    ("sheet_lag_ms", None, "p95"),
+)
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    values = sorted(values)
+
+    def rank(p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3)
+
+    return {"count": len(values), "p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": rank(1.0)}
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight)
+    unknown = set(mix) - {"menu", "registration", "junk"}
+    if unknown:
+        raise SystemExit(f"unknown stream kinds: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class Streams:
+    """Builds webhook bodies for each kind of traffic from the live content catalog."""
+
+    def __init__(self, catalog):
+        self.menu_labels = [label for labels in catalog.routes.values() for label in labels]
+        self.menu_labels += [label for step in catalog.steps for label in step.labels]
+        self.registration_label = catalog.registration_labels[0]
+        self._update_ids = itertools.count(1)
+        self._emails = itertools.count(1)
+
+    def message(self, user_id: int, text: str = None, **extra) -> bytes:
+        update_id = next(self._update_ids)
+        message = {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            **extra,
+        }
+        if text is not None:
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text)}]
+        return json.dumps({"update_id": update_id, "message": message}).encode()
+
+    def menu(self, user_id: int, rng: random.Random):
+        if rng.random() < 0.1:
+            return [self.message(user_id, "/start")]
+        return [self.message(user_id, rng.choice(self.menu_labels))]
+
+    def registration(self, user_id: int, rng: random.Random):
+        steps = [self.message(user_id, self.registration_label), self.message(user_id, f"User {user_id}")]
+        if rng.random() < 0.2:
+            steps.append(self.message(user_id, "not-an-email"))
+        steps.append(self.message(user_id, f"load{next(self._emails)}@example.com"))
+        return steps
+
+    def junk(self, user_id: int, rng: random.Random):
+        choice = rng.randrange(4)
+        if choice == 0:
+            return [self.message(user_id, "".join(rng.choice("abc xyz!؟") for _ in range(rng.randint(1, 40))))]
+        if choice == 1:
+            sticker = {"file_id": "x", "file_unique_id": "x", "width": 1, "height": 1,
+                       "is_animated": False, "is_video": False, "type": "regular"}
+            return [self.message(user_id, sticker=sticker)]
+        if choice == 2:
+            body = json.loads(self.message(user_id, rng.choice(self.menu_labels)))
+            body["edited_message"] = body.pop("message")
+            body["edited_message"]["edit_date"] = int(time.time())
+            return [json.dumps(body).encode()]
+        return [b'{"not": "an update"']
+
+
+class LoadGenerator:
+    def __init__(self, url: str, streams: Streams, mix: dict, users: int, rate: float, duration: float, seed: int):
+        parts = urlsplit(url)
+        self.host, self.port, self.path = parts.hostname, parts.port, parts.path
+        self.streams = streams
+        self.kinds, self.weights = zip(*mix.items())
+        self.users = users
+        self.think = users / rate  # mean pause between one user's messages
+        self.duration = duration
+        self.seed = seed
+        self.latencies = {kind: [] for kind in self.kinds}
+        self.statuses = {}
+        self.transport_errors = 0
+        self.first_sent = None
+        self.last_answered = None
+        self._lock = threading.Lock()
+
+    def run(self) -> float:
+        """Run all users until the deadline; returns seconds from first request to last answer."""
+        deadline = time.monotonic() + self.duration
+        threads = [
+            threading.Thread(target=self._user, args=(i, deadline), name=f"vu-{i}", daemon=True)
+            for i in range(self.users)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return (self.last_answered - self.first_sent) if self.first_sent else 0.0
+
+    def _user(self, index: int, deadline: float):
+        rng = random.Random(self.seed * 100003 + index)
+        user_id = 10_000 + index
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        time.sleep(rng.uniform(0, self.think))  # spread the first arrivals
+        while time.monotonic() < deadline:
+            kind = rng.choices(self.kinds, self.weights)[0]
+            for body in getattr(self.streams, kind)(user_id, rng):
+                conn = self._post(conn, kind, body)
+                time.sleep(rng.expovariate(1 / self.think))
+                if time.monotonic() >= deadline:
+                    break
+        conn.close()
+
+    def _post(self, conn, kind: str, body: bytes):
+        started = time.perf_counter()
+        try:
+            conn.request("POST", self.path, body, {"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            with self._lock:
+                self.transport_errors += 1
+            return http.client.HTTPConnection(self.host, self.port, timeout=60)
+        finished = time.perf_counter()
+        with self._lock:
+            self.latencies[kind].append(finished - started)
+            if self.first_sent is None or started < self.first_sent:
+                self.first_sent = started
+            self.last_answered = max(self.last_answered or finished, finished)
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        return conn
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def configure_app(workdir: str, api: FakeBotAPI, sheet: FakeSheet, args):
+    os.environ.update(
+        TELEGRAM_TOKEN=TOKEN,
+        TELEGRAM_API_BASE_URL=api.root_url,
+        GOOGLE_SHEET_WEBAPP_URL=sheet.url,
+        ROOT_URL="https://loadtest.invalid",
+        CONTENT_FILE=os.path.join(ROOT, "content.json"),
+        LEADS_DIR=os.path.join(workdir, "leads"),
+        SHEET_OUTBOX_DIR=os.path.join(workdir, "outbox"),
+        STATE_DB=os.path.join(workdir, "state.db"),
+        ANALYTICS_DIR=os.path.join(workdir, "analytics"),
+        FLOOD_RATE="1000",  # virtual users type faster than people; keep the guard's cost, not its drops
+        WEBHOOK_MODE=args.mode,
+        INLINE_REPLIES="1" if args.inline else "0",
+        SHEET_BATCH_SIZE=str(args.sheet_batch),
+    )
+    os.chdir(workdir)  # the legacy leads.json path is relative
+    import app
+
+    write_latencies = []
+    append = app.lead_store.append
+
+    def timed_append(lead):
+        started = time.perf_counter()
+        future = append(lead)
+        future.add_done_callback(lambda _: write_latencies.append(time.perf_counter() - started))
+        return future
+
+    app.lead_store.append = timed_append
+    return app, write_latencies
+
+
+def wait_for_delivery(app, sheet: FakeSheet, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if app.sheet_outbox.stats()["pending"] == 0 and len(sheet.rows) >= app.lead_store.appended:
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def sheet_lags(sheet: FakeSheet):
+    lags = []
+    for received_at, row in sheet.rows:
+        created_at = row.get("created_at")
+        if created_at:
+            lags.append(received_at - datetime.fromisoformat(created_at).timestamp())
+    return lags
+
+
+def compare(report: dict, baseline: dict, threshold: float):
+    regressions = []
+    for section, key, stat in BASELINE_METRICS:
+        new = report[section][key] if key else report[section]
+        old = baseline[section][key] if key else baseline[section]
+        if new.get(stat) is None or not old.get(stat):
+            continue
+        ratio = new[stat] / old[stat]
+        name = f"{section}.{key + '.' if key else ''}{stat}"
+        print(f"{name:<28} {old[stat]:>10} -> {new[stat]:>10} ms  x{ratio:.2f}", file=sys.stderr)
+        if ratio > 1 + threshold:
+            regressions.append(name)
+    ratio = report["throughput_per_s"] / baseline["throughput_per_s"] if baseline["throughput_per_s"] else 1
+    print(f"{'throughput_per_s':<28} {baseline['throughput_per_s']:>10} -> {report['throughput_per_s']:>10}     x{ratio:.2f}", file=sys.stderr)
+    if ratio < 1 - threshold:
+        regressions.append("throughput_per_s")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=float, default=100, help="offered load, updates/s")
+    parser.add_argument("--duration", type=float, default=15, help="seconds of load")
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"stream weights (default {DEFAULT_MIX})")
+    parser.add_argument("--mode", choices=("sync", "queue"), default="sync", help="WEBHOOK_MODE")
+    parser.add_argument("--inline", action="store_true", help="INLINE_REPLIES=1 (sync mode)")
+    parser.add_argument("--api-latency", type=float, default=0.02, help="fake Bot API latency (s)")
+    parser.add_argument("--sheet-latency", type=float, default=0.3, help="fake Google Sheet latency (s)")
+    parser.add_argument("--sheet-batch", type=int, default=1, help="SHEET_BATCH_SIZE")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="max wait for sheet delivery (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--baseline", help="earlier JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed regression vs. baseline")
+    parser.add_argument("--json", action="store_true", help="print the JSON report")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    with FakeBotAPI(latency=args.api_latency) as api, FakeSheet(latency=args.sheet_latency) as sheet:
+        # Keep the app's own log lines out of the report on stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            app, write_latencies = configure_app(workdir, api, sheet, args)
+            server = make_server("127.0.0.1", 0, app.flask_app, threaded=True, request_handler=QuietHandler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            url = f"http://127.0.0.1:{server.server_port}/webhook/{TOKEN}"
+
+            generator = LoadGenerator(
+                url, Streams(app.catalog.current), parse_mix(args.mix),
+                args.users, args.rate, args.duration, args.seed,
+            )
+            elapsed = generator.run()
+            delivered = wait_for_delivery(app, sheet, args.drain_timeout)
+            server.shutdown()
+            app.runtime.stop()
+
+        all_latencies = [x for values in generator.latencies.values() for x in values]
+        report = {
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "json")},
+            "requests": len(all_latencies),
+            "elapsed_s": round(elapsed, 3),
+            "throughput_per_s": round(len(all_latencies) / elapsed, 1) if elapsed else 0.0,
+            "statuses": {str(k): v for k, v in sorted(generator.statuses.items())},
+            "transport_errors": generator.transport_errors,
+            "webhook_ms": {
+                "all": percentiles(all_latencies),
+                **{kind: percentiles(values) for kind, values in generator.latencies.items()},
+            },
+            "lead_write_ms": percentiles(write_latencies),
+            "sheet_lag_ms": percentiles(sheet_lags(sheet)),
+            "leads": app.lead_store.appended,
+            "leads_delivered": len(sheet.rows),
+            "delivery_complete": delivered,
+            "bot_api_calls": dict(api.calls),
+        }
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['requests']} requests in {report['elapsed_s']} s  ({report['throughput_per_s']} req/s)  "
+              f"statuses {report['statuses']}  transport errors {report['transport_errors']}")
+        for name, stats in [*(("webhook " + k, v) for k, v in report["webhook_ms"].items()),
+                            ("lead write", report["lead_write_ms"]), ("sheet lag", report["sheet_lag_ms"])]:
+            print(f"{name:<22} n={stats['count']:<6} p50 {stats['p50']} ms  p95 {stats['p95']} ms  "
+                  f"p99 {stats['p99']} ms  max {stats['max']} ms")
+        print(f"leads {report['leads']}  delivered {report['leads_delivered']}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print("❌ Regressions: " + ", ".join(regressions), file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,9 @@
 import os
 import re
+import sys
 import json
+import uuid
+import logging
 import requests
 import asyncio
 from datetime import datetime, timezone
@@ -16,6 +19,10 @@ from telegram.ext import (
 )
 from telegram.request import HTTPXRequest
 
+# The logging pipeline is shared with the main app one directory up
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from structured_logging import log_context, setup_logging  # noqa: E402
+
 
 # ========== ENV CONFIG ==========
 TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
@@ -28,6 +35,17 @@ if not TELEGRAM_TOKEN:
     raise RuntimeError("❌ TELEGRAM_TOKEN is not set!")
 
 
+# ========== LOGGING ==========
+# Same pipeline, settings and context fields as the main app's app.py
+log_pipeline = setup_logging(
+    level=os.getenv("LOG_LEVEL", "INFO").upper(),
+    queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    sample=os.getenv("LOG_SAMPLE", "raw_update=100"),
+    fmt=os.getenv("LOG_FORMAT", "json"),
+)
+log = logging.getLogger("bot")
+
+
 # ========== STORAGE ==========
 LEADS_FILE = "leads.json"
 
@@ -58,14 +76,14 @@ def is_valid_email(email: str) -> bool:
 def post_to_sheet(payload: dict, timeout: int = 10) -> bool:
     """Send lead data to Google Sheet Web App."""
     if not GOOGLE_SHEET_WEBAPP_URL:
-        print("⚠️ GOOGLE_SHEET_WEBAPP_URL not set")
+        log.warning("⚠️ GOOGLE_SHEET_WEBAPP_URL not set")
         return False
     try:
         r = requests.post(GOOGLE_SHEET_WEBAPP_URL, json=payload, timeout=timeout)
-        print(f"📤 POST Sheet → {r.status_code}: {r.text[:200]}")
+        log.info("📤 POST Sheet → %s", r.status_code, extra={"body": r.text[:200]})
         return r.status_code == 200
     except Exception as e:
-        print("❌ post_to_sheet error:", e)
+        log.error("❌ post_to_sheet error: %s", e)
         return False
 
 
@@ -86,13 +104,12 @@ ASK_NAME, ASK_EMAIL = range(2)
 
 # ========== TELEGRAM HANDLERS ==========
 async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    print("📩 show_menu triggered!")
     await update.message.reply_text(
         "👋 سلام! به ربات دیجیتال مارکتینگ خوش آمدید.\n\n"
         "از منوی زیر انتخاب کنید:",
         reply_markup=MAIN_MENU,
     )
-    print(f"✅ Menu shown to user {update.effective_user.id}")
+    log.debug("✅ Menu shown", extra={"user_id": update.effective_user.id})
 
 
 async def about(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -248,24 +265,26 @@ asyncio.set_event_loop(loop)
 @flask_app.route(f"/webhook/{TELEGRAM_TOKEN}", methods=["POST"])
 def webhook():
     """Main Telegram webhook endpoint (synchronous to ensure delivery)."""
-    try:
-        data = flask_request.get_json(force=True)
-        print("📦 RAW UPDATE:", json.dumps(data, ensure_ascii=False))
-        update = Update.de_json(data, application.bot)
-
-        # ✅ Run synchronously with a 60s timeout safety
+    request_id = flask_request.headers.get("X-Request-ID") or uuid.uuid4().hex[:12]
+    with log_context(request_id=request_id):
         try:
-            loop.run_until_complete(
-                asyncio.wait_for(application.process_update(update), timeout=60)
-            )
-        except asyncio.TimeoutError:
-            print("⚠️ Telegram update took too long — skipped.")
-
-        print("✅ Processed update successfully.")
-        return "ok", 200
-    except Exception as e:
-        print("❌ Webhook error:", e)
-        return "error", 500
+            data = flask_request.get_json(force=True)
+            with log_context(update_id=data.get("update_id")):
+                log.debug("📦 Raw update", extra={"event": "raw_update", "update": data})
+                update = Update.de_json(data, application.bot)
+
+                # ✅ Run synchronously with a 60s timeout safety
+                try:
+                    loop.run_until_complete(
+                        asyncio.wait_for(application.process_update(update), timeout=60)
+                    )
+                except asyncio.TimeoutError:
+                    log.warning("⚠️ Telegram update took too long — skipped.")
+
+            return "ok", 200
+        except Exception as e:
+            log.exception("❌ Webhook error: %s", e)
+            return "error", 500
 
 
 @flask_app.route("/", methods=["GET"])
@@ -286,12 +305,11 @@ def set_webhook():
         loop.run_until_complete(
             asyncio.wait_for(application.bot.set_webhook(webhook_url), timeout=60)
         )
-        print(f"✅ Webhook set to {webhook_url}")
-        print("✅ Bot started successfully — ready to receive messages.")
+        log.info("✅ Webhook set — ready to receive messages.")
     except asyncio.TimeoutError:
-        print("⚠️ Webhook setup timed out — retrying may be needed.")
+        log.warning("⚠️ Webhook setup timed out — retrying may be needed.")
     except Exception as e:
-        print("⚠️ Webhook setup failed:", e)
+        log.warning("⚠️ Webhook setup failed: %s", e)
 
 
     
@@ -300,5 +318,5 @@ def set_webhook():
 set_webhook()
 
 if __name__ == "__main__":
-    print("🚀 Starting Digital Marketing Academy Bot ...")
+    log.info("🚀 Starting Digital Marketing Academy Bot ...")
     flask_app.run(host="0.0.0.0", port=PORT)
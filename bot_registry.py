@@ -0,0 +1,259 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BOT = "default"
+_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]{0,31}$")
+
+
+class BotConfig:
+    """One bot served by this process: its token, content and where its data lives."""
+
+    def __init__(
+        self,
+        name: str,
+        token: str,
+        content_file: str,
+        leads_dir: str,
+        outbox_dir: str,
+        analytics_dir: str,
+        broadcast_dir: str,
+        sheet_url: str = None,
+        support_username: str = "@support",
+        state_namespace: str = "",
+        legacy_leads_file: str = None,
+    ):
+        self.name = name
+        self.token = token
+        self.content_file = content_file
+        self.leads_dir = leads_dir
+        self.outbox_dir = outbox_dir
+        self.analytics_dir = analytics_dir
+        self.broadcast_dir = broadcast_dir
+        self.sheet_url = sheet_url
+        self.support_username = support_username
+        self.state_namespace = state_namespace  # key prefix in the shared STATE_DB
+        self.legacy_leads_file = legacy_leads_file
+
+    @classmethod
+    def from_spec(cls, spec: dict, data_dir: str) -> "BotConfig":
+        """Config for one entry of a bots file; its data goes under ``data_dir/<name>``."""
+        name = spec.get("name", "")
+        if not _NAME_RE.match(name) or name == DEFAULT_BOT:
+            raise ValueError(f"bad bot name {name!r}: use 1-32 of a-z, 0-9, '_' and '-'")
+        token = spec.get("token") or os.getenv(spec.get("token_env", ""), "")
+        if not token:
+            raise ValueError(f"bot {name}: no token (set 'token' or 'token_env')")
+        if "content_file" not in spec:
+            raise ValueError(f"bot {name}: no content_file")
+        root = os.path.join(data_dir, name)
+        return cls(
+            name,
+            token,
+            spec["content_file"],
+            leads_dir=os.path.join(root, "leads"),
+            outbox_dir=os.path.join(root, "outbox"),
+            analytics_dir=os.path.join(root, "analytics"),
+            broadcast_dir=os.path.join(root, "broadcasts"),
+            sheet_url=spec.get("sheet_url"),
+            support_username=spec.get("support_username", "@support"),
+            state_namespace=name,
+        )
+
+
+def load_bot_configs(path: str, data_dir: str = "bots") -> list:
+    """Read a bots file: ``{"bots": [{"name", "token" or "token_env", "content_file", ...}]}``."""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    configs = [BotConfig.from_spec(spec, data_dir) for spec in data.get("bots", [])]
+    names = [c.name for c in configs]
+    duplicates = {n for n in names if names.count(n) > 1}
+    if duplicates:
+        raise ValueError(f"duplicate bot names in {path}: {', '.join(sorted(duplicates))}")
+    return configs
+
+
+class SharedRequest:
+    """Bot API request that several ``Bot`` instances use as their connection pool.
+
+    Each bot initializes and shuts down its request; the pool is only closed
+    when the last bot using it shuts down. Put it first in the bases.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._holders = 0
+
+    async def initialize(self):
+        self._holders += 1
+        await super().initialize()
+
+    async def shutdown(self):
+        self._holders -= 1
+        if self._holders <= 0:
+            await super().shutdown()
+
+
+class HostedBot:
+    """A bot's ``Application`` plus the services (stores, catalog, ...) that belong to it.
+
+    Services are passed as keyword arguments and become attributes; those
+    named in ``health`` report their ``stats()`` in :meth:`stats`. Hooks
+    registered with :meth:`on_startup` / :meth:`on_shutdown` start and stop
+    them; :meth:`start` / :meth:`stop` also run the application's lifecycle.
+    A start that fails part way can be retried: hooks that already ran are
+    not run again, so their background tasks are not started twice.
+    """
+
+    def __init__(self, config: BotConfig, application, health=(), **services):
+        self.config = config
+        self.name = config.name
+        self.application = application
+        self._health = {key: services[key] for key in health}
+        for key, value in services.items():
+            setattr(self, key, value)
+        self._startup_hooks = []
+        self._shutdown_hooks = []
+        self._hooks_started = 0  # startup hooks that have run since the last stop
+        application.bot_data["hosted_bot"] = self
+
+    @property
+    def started(self) -> bool:
+        return self.application.running
+
+    def on_startup(self, hook):
+        self._startup_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook):
+        self._shutdown_hooks.append(hook)
+        return hook
+
+    async def start_services(self):
+        while self._hooks_started < len(self._startup_hooks):
+            await self._startup_hooks[self._hooks_started]()
+            self._hooks_started += 1
+
+    async def stop_services(self):
+        self._hooks_started = 0
+        for hook in reversed(self._shutdown_hooks):
+            try:
+                await hook()
+            except Exception as e:
+                log.warning("⚠️ Bot %s shutdown hook failed: %s", self.name, e)
+
+    async def start(self):
+        # application.start() last: ``started`` then means the services run too
+        await self.application.initialize()
+        await self.start_services()
+        await self.application.start()
+
+    async def stop(self):
+        await self.stop_services()
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
+
+    def stats(self) -> dict:
+        body = {"started": self.started}
+        for key, service in self._health.items():
+            body[key] = service.stats()
+        return body
+
+
+class BotRegistry:
+    """The bots a process serves, looked up by the token in their webhook path.
+
+    Bots are built by ``factory(config)`` on the first update for their token,
+    and started (``getMe``, background services) on the runtime's loop when an
+    update first gets past the filters, so a configured bot that receives
+    nothing costs only its config. All bots run on the one loop of ``runtime``.
+    A bot whose start fails is retried on its next update.
+    """
+
+    def __init__(self, runtime, factory):
+        self.runtime = runtime
+        self.factory = factory
+        self._configs = {}  # token -> BotConfig
+        self._locks = {}  # token -> lock held while building/starting that bot
+        self._bots = {}  # token -> HostedBot, once built
+        self._owned = set()  # tokens whose bot the runtime starts and stops itself
+        self.start_failures = 0
+        runtime.on_shutdown(self.stop)
+
+    def add(self, config: BotConfig, bot: HostedBot = None):
+        """Register ``config``; ``bot`` is an already built bot the runtime owns."""
+        if config.token in self._configs:
+            raise ValueError(f"bot {config.name}: token already registered")
+        if any(c.name == config.name for c in self._configs.values()):
+            raise ValueError(f"bot {config.name}: name already registered")
+        self._configs[config.token] = config
+        self._locks[config.token] = threading.Lock()
+        if bot is not None:
+            self._bots[config.token] = bot
+            self._owned.add(config.token)
+
+    def __len__(self):
+        return len(self._configs)
+
+    def tokens(self) -> list:
+        return list(self._configs)
+
+    def get(self, token: str):
+        """The bot for ``token``, built if needed (but not started); None if unknown."""
+        bot = self._bots.get(token)
+        if bot is not None or token not in self._configs:
+            return bot
+        with self._locks[token]:
+            bot = self._bots.get(token)
+            if bot is None:
+                bot = self._bots[token] = self.factory(self._configs[token])
+                log.info("🤖 Bot %s built", bot.name)
+        return bot
+
+    def by_name(self, name: str):
+        for token, config in self._configs.items():
+            if config.name == name:
+                return self.get(token)
+        return None
+
+    def ensure_started(self, bot: HostedBot):
+        """Start ``bot`` on the runtime loop unless it runs already (runtime must be started)."""
+        if bot.started or bot.config.token in self._owned:
+            return
+        with self._locks[bot.config.token]:
+            if bot.started:
+                return
+            try:
+                # Not runtime.run(): the bot's background tasks must not inherit
+                # the log context of the update that happened to start it
+                asyncio.run_coroutine_threadsafe(bot.start(), self.runtime.loop).result()
+            except Exception:
+                self.start_failures += 1
+                raise
+            log.info("✅ Bot %s started", bot.name)
+
+    async def stop(self):
+        for token, bot in list(self._bots.items()):
+            if token not in self._owned and bot.started:
+                try:
+                    await bot.stop()
+                except Exception as e:
+                    log.warning("⚠️ Bot %s failed to stop: %s", bot.name, e)
+
+    def stats(self) -> dict:
+        bots = {}
+        for token, config in self._configs.items():
+            bot = self._bots.get(token)
+            if bot is None:
+                bots[config.name] = {"started": False}
+            elif token in self._owned:
+                bots[config.name] = {"started": bot.started}  # reported at the top level of /healthz
+            else:
+                bots[config.name] = bot.stats()
+        return {"configured": len(self._configs), "start_failures": self.start_failures, "bots": bots}
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+
+from structured_logging import current_context, run_in_context
+
+log = logging.getLogger(__name__)
+
+
+class BotRuntime:
+    """Long-lived asyncio loop that owns the Telegram application in one worker.
+
+    Flask/gunicorn request threads are synchronous, so they hand coroutines to
+    this loop instead of calling ``asyncio.run`` per update. The loop (and with
+    it the HTTPXRequest connection pool and any ``create_task`` background work)
+    lives for as long as the worker does.
+    """
+
+    def __init__(self, application, name: str = "telegram-loop"):
+        self.application = application
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run_loop, name=name, daemon=True)
+        self._lock = threading.Lock()
+        self._started = False
+        self._startup_hooks = []
+        self._shutdown_hooks = []
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    @property
+    def started(self) -> bool:
+        return self._started
+
+    @property
+    def thread_id(self) -> int:
+        return self._thread.ident
+
+    def start(self):
+        """Start the loop thread and run application.initialize()/start() once."""
+        with self._lock:
+            if self._started:
+                return
+            if not self._thread.is_alive():
+                self._thread.start()
+            # Not self.run(): background tasks started here must not inherit
+            # the log context of the request that happened to start the runtime
+            asyncio.run_coroutine_threadsafe(self._startup(), self.loop).result()
+            self._started = True
+
+    def on_startup(self, hook):
+        """Register ``async hook()`` to run on the loop after application.start()."""
+        self._startup_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook):
+        """Register ``async hook()`` to run on the loop before application.stop()."""
+        self._shutdown_hooks.append(hook)
+        return hook
+
+    async def _startup(self):
+        await self.application.initialize()
+        await self.application.start()
+        for hook in self._startup_hooks:
+            await hook()
+
+    def submit(self, coro) -> Future:
+        """Schedule ``coro`` on the loop from any thread, keeping the caller's log context."""
+        fields = current_context()
+        if fields:
+            coro = run_in_context(coro, **fields)
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro, timeout: float = None):
+        """Run ``coro`` on the loop and block the calling thread for its result."""
+        return self.submit(coro).result(timeout)
+
+    def process_update(self, update, timeout: float = None):
+        return self.run(self.application.process_update(update), timeout)
+
+    def stop(self):
+        """Stop the application (awaiting pending create_task work) and the loop."""
+        with self._lock:
+            if not self._started:
+                return
+            try:
+                self.run(self._shutdown())
+            finally:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self._thread.join()
+                self._started = False
+
+    async def _shutdown(self):
+        for hook in reversed(self._shutdown_hooks):
+            try:
+                await hook()
+            except Exception as e:
+                log.warning("⚠️ Runtime shutdown hook failed: %s", e)
+        if self.application.running:
+            await self.application.stop()
+        await self.application.shutdown()
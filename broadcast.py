@@ -0,0 +1,415 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import time
+import uuid
+
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter, TelegramError
+
+log = logging.getLogger(__name__)
+
+BLOCKED_STATUS = "Blocked"
+
+
+class BroadcastBusy(RuntimeError):
+    """Another broadcast is already running (in this or another worker)."""
+
+
+class TokenBucket:
+    """Token bucket that hands out reservations, so concurrent waiters queue in order.
+
+    ``reserve()`` always takes a token and returns how long to wait before
+    using it; tokens may go negative, which is the queue of waiters.
+    ``pause()`` holds everyone back, e.g. after Telegram answers RetryAfter.
+    """
+
+    __slots__ = ("rate", "burst", "_tokens", "_updated", "paused_until")
+
+    def __init__(self, rate: float, burst: float = 1.0):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self, now: float = None) -> float:
+        now = time.monotonic() if now is None else now
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def pause(self, seconds: float, now: float = None):
+        now = time.monotonic() if now is None else now
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def idle(self, now: float) -> bool:
+        """True once the bucket has refilled, i.e. it is as good as a new one."""
+        return self._tokens + (now - self._updated) * self.rate >= self.burst and now >= self.paused_until
+
+    async def acquire(self):
+        ready_at = time.monotonic() + self.reserve()
+        while True:
+            wait = max(ready_at, self.paused_until) - time.monotonic()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+
+class ChatLimiter:
+    """One TokenBucket per chat, dropped again once it has refilled."""
+
+    def __init__(self, rate: float, burst: float = 1.0, prune_above: int = 1024):
+        self.rate = rate
+        self.burst = burst
+        self.prune_above = prune_above
+        self._buckets = {}
+
+    def bucket(self, chat_id) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.prune_above:
+                now = time.monotonic()
+                self._buckets = {c: b for c, b in self._buckets.items() if not b.idle(now)}
+            bucket = self._buckets[chat_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    async def acquire(self, chat_id):
+        await self.bucket(chat_id).acquire()
+
+
+class Broadcaster:
+    """Sends one message to every lead's ``user_id`` within Telegram's flood limits.
+
+    Messages go through the application's bot, so they share its HTTPXRequest
+    connection pool; ``concurrency`` senders pull recipients from the lead
+    store in seq order and each send waits on a global and a per-chat token
+    bucket. RetryAfter pauses the global bucket and the message is retried;
+    users who blocked the bot (or whose chat is gone) get their lead updated to
+    status ``Blocked`` and are skipped from then on.
+
+    Progress is checkpointed to ``<directory>/<id>.json`` every
+    ``checkpoint_interval`` seconds. ``cursor`` is the seq below which every
+    recipient has been handled, so a resumed run re-sends at most the messages
+    that were in flight. One broadcast runs at a time across all workers: the
+    worker sending holds an flock on ``.lock``; if it dies, another worker
+    resumes the run within ``idle_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        bot,
+        lead_store,
+        rate: float = 25.0,
+        chat_rate: float = 1.0,
+        concurrency: int = 8,
+        max_attempts: int = 5,
+        checkpoint_interval: float = 1.0,
+        idle_interval: float = 30.0,
+        metrics=None,
+    ):
+        self.directory = directory
+        self.bot = bot
+        self.lead_store = lead_store
+        self.rate = rate
+        self.chat_rate = chat_rate
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.checkpoint_interval = checkpoint_interval
+        self.idle_interval = idle_interval
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = None
+        self._watcher = None
+        self._task = None
+        self._state = None
+        self._in_flight = set()
+        self._messages = None
+        if metrics is not None:
+            self._messages = metrics.counter(
+                "broadcast_messages_total", "Broadcast sends by outcome.", ("outcome",)
+            )
+
+    # ----- lifecycle (runtime hooks) -----
+    async def start(self):
+        self._watcher = asyncio.create_task(self._watch(), name="broadcast-watcher")
+
+    async def stop(self):
+        for task in (self._watcher, self._task):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(t for t in (self._watcher, self._task) if t is not None), return_exceptions=True)
+        self._watcher = self._task = None
+
+    async def _watch(self):
+        """Resume a broadcast whose worker went away."""
+        while True:
+            if self._task is None:
+                for state in self.recent():
+                    if state["status"] == "running" and self._try_lock():
+                        state = self._load(state["id"])  # re-read under the lock
+                        if state is not None and state["status"] == "running":
+                            if os.path.exists(self._path(state["id"], ".cancel")):
+                                state.update(status="cancelled", finished_at=time.time())
+                                await asyncio.to_thread(self._save, state)
+                            else:
+                                log.info("📣 Resuming broadcast %s after seq %s", state["id"], state["cursor"])
+                                self._begin(state)
+                                break
+                        self._unlock()
+            await asyncio.sleep(self.idle_interval)
+
+    # ----- control -----
+    async def launch(self, text: str, parse_mode: str = None, dry_run: bool = False) -> dict:
+        """Start a broadcast on the running loop; raises BroadcastBusy if one is running."""
+        await asyncio.to_thread(self.lead_store.refresh)  # leads other workers wrote
+        if self._task is not None or not self._try_lock():
+            raise BroadcastBusy("a broadcast is already running")
+        now = time.time()
+        state = {
+            "id": time.strftime("%Y%m%d-%H%M%S", time.gmtime(now)) + "-" + uuid.uuid4().hex[:6],
+            "text": text,
+            "parse_mode": parse_mode,
+            "dry_run": dry_run,
+            "status": "running",
+            "created_at": now,
+            "updated_at": now,
+            "finished_at": None,
+            "leads_at_start": self.lead_store.count,
+            "cursor": 0,
+            "sent": 0,
+            "blocked": 0,
+            "failed": 0,
+            "retried": 0,
+            "last_error": None,
+        }
+        self._save(state)
+        self._begin(state)
+        return dict(state)
+
+    def cancel(self, broadcast_id: str) -> bool:
+        """Ask the worker running ``broadcast_id`` to stop; works from any worker."""
+        state = self._load(broadcast_id)
+        if state is None:
+            return False
+        with open(self._path(broadcast_id, ".cancel"), "w"):
+            pass
+        return True
+
+    def status(self, broadcast_id: str):
+        if self._state is not None and self._state["id"] == broadcast_id:
+            return dict(self._state)
+        return self._load(broadcast_id)
+
+    def recent(self) -> list:
+        """All broadcasts, newest first."""
+        states = []
+        for name in sorted(os.listdir(self.directory), reverse=True):
+            if name.endswith(".json"):
+                state = self.status(name[: -len(".json")])
+                if state is not None:
+                    states.append(state)
+        return states
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "running": state["id"] if state else None,
+            "sent": state["sent"] if state else 0,
+            "in_flight": len(self._in_flight),
+        }
+
+    # ----- sending -----
+    def _begin(self, state: dict):
+        self._state = state
+        self._task = asyncio.create_task(self._run(state), name=f"broadcast-{state['id']}")
+
+    async def _run(self, state: dict):
+        # No burst: an even spacing keeps every 1 s window under the limit
+        global_bucket = TokenBucket(self.rate)
+        chats = ChatLimiter(self.chat_rate)
+        queue = asyncio.Queue(self.concurrency * 4)
+        self._in_flight = set()
+        dispatched = state["cursor"]
+
+        async def sender():
+            while True:
+                record = await queue.get()
+                if record is None:
+                    return
+                try:
+                    if state["status"] == "running":
+                        await self._deliver(record, state, global_bucket, chats)
+                finally:
+                    self._in_flight.discard(record["seq"])
+
+        senders = [asyncio.create_task(sender()) for _ in range(self.concurrency)]
+        checkpoints = asyncio.create_task(self._checkpoint_loop(state, lambda: dispatched))
+        try:
+            async for record in self._recipients(state["cursor"]):
+                if state["status"] != "running":
+                    break
+                self._in_flight.add(record["seq"])
+                dispatched = record["seq"]
+                await queue.put(record)
+            for _ in senders:
+                await queue.put(None)
+            await asyncio.gather(*senders)
+            if state["status"] == "running":
+                state["status"] = "done"
+        except asyncio.CancelledError:
+            # Worker shutting down: keep "running" so the run resumes later
+            for task in senders:
+                task.cancel()
+            raise
+        except Exception as e:
+            state["status"] = "failed"
+            state["last_error"] = repr(e)
+            log.exception("❌ Broadcast failed: %s", e)
+        finally:
+            checkpoints.cancel()
+            if state["status"] != "running":
+                state["finished_at"] = time.time()
+            state["cursor"] = self._cursor(dispatched)
+            await asyncio.to_thread(self._save, state)
+            self._state = None
+            self._task = None
+            self._unlock()
+            if state["status"] != "running":
+                log.info(
+                    "📣 Broadcast %s %s: %d sent, %d blocked, %d failed",
+                    state["id"], state["status"], state["sent"], state["blocked"], state["failed"],
+                    extra={"event": "broadcast_finished", "broadcast_id": state["id"]},
+                )
+
+    async def _recipients(self, after_seq: int):
+        """Yield the newest lead of each reachable user, reading the store off the loop."""
+        # Another worker may have written leads, or be resuming a run it did not start
+        await asyncio.to_thread(self.lead_store.refresh)
+        records = self.lead_store.iter_records(after_seq=after_seq)
+        while True:
+            batch = await asyncio.to_thread(_take, records, 256)
+            if not batch:
+                return
+            for record in batch:
+                user_id = record.get("user_id")
+                if user_id is None or record.get("status") == BLOCKED_STATUS:
+                    continue
+                if self.lead_store.find_by_user(user_id) != record["lead_id"]:
+                    continue  # the user has a newer lead; message them once
+                yield record
+
+    async def _deliver(self, record: dict, state: dict, global_bucket: TokenBucket, chats: ChatLimiter):
+        chat_id = record["user_id"]
+        for attempt in range(1, self.max_attempts + 1):
+            await chats.acquire(chat_id)
+            await global_bucket.acquire()
+            try:
+                if not state["dry_run"]:
+                    await self.bot.send_message(chat_id, state["text"], parse_mode=state["parse_mode"])
+            except RetryAfter as e:
+                retry_after = getattr(e.retry_after, "total_seconds", lambda: e.retry_after)()
+                global_bucket.pause(float(retry_after))
+                state["retried"] += 1
+                self._count("retry_after")
+                continue
+            except Forbidden as e:
+                await self._prune(record, e.message)
+                state["blocked"] += 1
+                self._count("blocked")
+                return
+            except BadRequest as e:
+                if "chat not found" in e.message.lower():
+                    await self._prune(record, e.message)
+                    state["blocked"] += 1
+                    self._count("blocked")
+                    return
+                state["last_error"] = e.message
+                break
+            except NetworkError as e:
+                state["last_error"] = e.message
+                state["retried"] += 1
+                self._count("network_error")
+                await asyncio.sleep(random.uniform(0, min(30.0, 2 ** attempt)))
+                continue
+            except TelegramError as e:
+                state["last_error"] = e.message
+                break
+            state["sent"] += 1
+            self._count("sent")
+            return
+        state["failed"] += 1
+        self._count("failed")
+
+    async def _prune(self, record: dict, reason: str):
+        lead = {k: v for k, v in record.items() if k != "seq"}
+        lead.update(status=BLOCKED_STATUS, blocked_at=time.time(), blocked_reason=reason)
+        await asyncio.wrap_future(self.lead_store.update(record["lead_id"], lead))
+
+    def _count(self, outcome: str):
+        if self._messages is not None:
+            self._messages.inc(outcome)
+
+    # ----- checkpoints -----
+    def _cursor(self, dispatched: int) -> int:
+        return min(self._in_flight) - 1 if self._in_flight else dispatched
+
+    async def _checkpoint_loop(self, state: dict, dispatched):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            state["cursor"] = self._cursor(dispatched())
+            if os.path.exists(self._path(state["id"], ".cancel")):
+                state["status"] = "cancelled"
+            await asyncio.to_thread(self._save, state)
+
+    def _path(self, broadcast_id: str, suffix: str = ".json") -> str:
+        if not broadcast_id or "/" in broadcast_id or broadcast_id.startswith("."):
+            raise ValueError("bad broadcast id")
+        return os.path.join(self.directory, broadcast_id + suffix)
+
+    def _load(self, broadcast_id: str):
+        try:
+            with open(self._path(broadcast_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _save(self, state: dict):
+        state = dict(state, updated_at=time.time())
+        path = self._path(state["id"])
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _try_lock(self) -> bool:
+        if self._lock_fd is not None:
+            return True
+        fd = os.open(os.path.join(self.directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._lock_fd = fd
+        return True
+
+    def _unlock(self):
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+
+def _take(iterator, n: int) -> list:
+    batch = []
+    for item in iterator:
+        batch.append(item)
+        if len(batch) >= n:
+            break
+    return batch
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+
+from telegram import ReplyKeyboardMarkup, ReplyKeyboardRemove
+
+from menu_router import normalize_label
+
+try:
+    import yaml  # optional: only needed for a .yaml/.yml catalog
+except ImportError:
+    yaml = None
+
+log = logging.getLogger(__name__)
+
+
+class _KeepMissing(dict):
+    """format_map() mapping that leaves unknown ``{placeholders}`` for send time."""
+
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+
+class Media:
+    """A local file sent after a learning step's text (see ``media_cache.MediaCache``)."""
+
+    __slots__ = ("kind", "path", "caption", "parse_mode")
+    KINDS = ("photo", "video", "document", "audio", "animation")
+
+    def __init__(self, spec: dict, base_dir: str, variables: dict):
+        self.kind = spec.get("type", "document")
+        if self.kind not in self.KINDS:
+            raise ValueError(f"media type must be one of {', '.join(self.KINDS)}, not {self.kind!r}")
+        self.path = os.path.join(base_dir, spec["path"])
+        if not os.path.isfile(self.path):
+            raise ValueError(f"media file {self.path} not found")
+        caption = spec.get("caption")
+        self.caption = caption.format_map(_KeepMissing(variables)) if caption else None
+        self.parse_mode = spec.get("parse_mode")
+
+
+class Reply:
+    """One outgoing message, fully prepared when the catalog is loaded.
+
+    Catalog variables are substituted into the text once, and the keyboard is
+    serialized to JSON once; sending only fills per-user fields such as
+    ``{name}``. The keyboard JSON goes out via ``api_kwargs`` so it is not
+    rebuilt and re-serialized on every reply.
+    """
+
+    __slots__ = ("key", "event", "labels", "text", "parse_mode", "markup_json", "api_kwargs", "media")
+
+    def __init__(self, key: str, spec: dict, keyboards: dict, variables: dict, base_dir: str = "."):
+        self.key = key
+        self.event = spec.get("event", key)  # funnel analytics step name
+        self.labels = tuple(spec.get("labels", ()))
+        self.text = spec["text"].format_map(_KeepMissing(variables))
+        self.parse_mode = spec.get("parse_mode")
+
+        keyboard = spec.get("keyboard")
+        if keyboard == "remove":
+            markup = ReplyKeyboardRemove()
+        elif keyboard:
+            rows = keyboards[keyboard] if isinstance(keyboard, str) else keyboard
+            markup = ReplyKeyboardMarkup(rows, resize_keyboard=True)
+        else:
+            markup = None
+        self.markup_json = json.dumps(markup.to_dict(), ensure_ascii=False) if markup else None
+        self.api_kwargs = {"reply_markup": self.markup_json} if markup else None
+        self.media = tuple(Media(item, base_dir, variables) for item in spec.get("media", ()))
+
+    def webhook_body(self, chat_id, **fields) -> dict:
+        """This reply as a sendMessage call in a webhook response body."""
+        body = {"method": "sendMessage", "chat_id": chat_id, "text": self.text.format(**fields) if fields else self.text}
+        if self.parse_mode:
+            body["parse_mode"] = self.parse_mode
+        if self.markup_json:
+            body["reply_markup"] = json.loads(self.markup_json)
+        return body
+
+    async def send(self, message, **fields):
+        text = self.text.format(**fields) if fields else self.text
+        return await message.reply_text(text, parse_mode=self.parse_mode, api_kwargs=self.api_kwargs)
+
+
+class ContentCatalog:
+    """Menu texts, learning steps, keyboards and links loaded from one file."""
+
+    def __init__(self, data: dict, variables: dict = None, base_dir: str = "."):
+        variables = {**data.get("variables", {}), **(variables or {})}
+        keyboards = data.get("keyboards", {})
+        for key, spec in data.get("replies", {}).items():
+            if spec.get("media"):
+                raise ValueError(f"reply '{key}': media is only supported on learning steps")
+        self.replies = {
+            key: Reply(key, spec, keyboards, variables) for key, spec in data.get("replies", {}).items()
+        }
+        self.steps = [
+            Reply(step["id"], step, keyboards, variables, base_dir) for step in data.get("learning", [])
+        ]
+        self.routes = {key: tuple(labels) for key, labels in data.get("routes", {}).items()}
+        self.registration_labels = tuple(data.get("registration_labels", ()))
+        self._step_by_label = {
+            normalize_label(label): step for step in self.steps for label in step.labels
+        }
+
+        for key in self.routes:
+            if key not in self.replies:
+                raise ValueError(f"route '{key}' has no reply")
+
+    def step_for(self, text: str):
+        return self._step_by_label.get(normalize_label(text))
+
+    @classmethod
+    def load(cls, path: str, variables: dict = None) -> "ContentCatalog":
+        with open(path, "r", encoding="utf-8") as f:
+            if path.endswith((".yaml", ".yml")):
+                if yaml is None:
+                    raise RuntimeError("PyYAML is required for a YAML content catalog")
+                data = yaml.safe_load(f)
+            else:
+                data = json.load(f)
+        # Media paths are relative to the catalog file
+        return cls(data, variables, base_dir=os.path.dirname(os.path.abspath(path)))
+
+
+class CatalogStore:
+    """Holds the current catalog and swaps in a new one when the file changes.
+
+    A watcher task on the runtime loop stats the file every ``check_interval``
+    seconds. A new catalog is fully built before it replaces the old one, so
+    readers always see a complete catalog; if the file fails to load, the old
+    one is kept.
+    """
+
+    def __init__(self, path: str, variables: dict = None, check_interval: float = 2.0):
+        self.path = path
+        self.variables = variables or {}
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._mtime = os.stat(path).st_mtime_ns
+        self._current = ContentCatalog.load(path, self.variables)
+        self._task = None
+        self.reloads = 0
+
+    @property
+    def current(self) -> ContentCatalog:
+        return self._current
+
+    async def start(self):
+        self._task = asyncio.create_task(self._watch(), name="content-catalog-watcher")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            self.check_for_changes()
+
+    def on_reload(self, listener):
+        """Call ``listener(catalog)`` after each successful reload."""
+        self._listeners.append(listener)
+        return listener
+
+    def check_for_changes(self) -> bool:
+        with self._lock:
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except FileNotFoundError:
+                return False
+            if mtime == self._mtime:
+                return False
+            self._mtime = mtime
+            try:
+                catalog = ContentCatalog.load(self.path, self.variables)
+            except Exception as e:
+                log.warning("⚠️ Content catalog reload failed, keeping the previous one: %s", e)
+                return False
+            self._current = catalog
+            self.reloads += 1
+        for listener in self._listeners:
+            listener(catalog)
+        log.info("🔄 Content catalog reloaded from %s", self.path)
+        return True
@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+
+from update_queue import extract_chat_id, extract_sender_id
+
+ALLOW = "allow"
+DROP = "drop"
+WARN = "warn"  # drop, and tell the user once per flood
+
+
+class FloodGuard:
+    """Per-user and per-chat token buckets checked on the raw webhook payload.
+
+    Runs before ``Update.de_json`` and handler dispatch, so an update over the
+    limit costs a couple of dict lookups instead of a full round through the
+    bot. Buckets live in one LRU of at most ``max_keys`` entries; entries idle
+    for ``ttl`` seconds are evicted as new traffic comes in, so memory stays
+    bounded however many users write. A bucket that has refilled is the same as
+    a new one, which makes eviction lossless once ``ttl`` covers refill time.
+
+    With ``warn`` the first dropped update of a flood is reported as
+    :data:`WARN` (the caller tells the user to slow down); the flag resets once
+    the user's bucket has refilled.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        burst: float = 8.0,
+        chat_rate: float = 3.0,
+        chat_burst: float = 20.0,
+        max_keys: int = 50_000,
+        ttl: float = 600.0,
+        warn: bool = True,
+        metrics=None,
+    ):
+        self.rate = rate
+        self.burst = burst
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_keys = max_keys
+        self.ttl = max(ttl, burst / rate if rate else 0, chat_burst / chat_rate if chat_rate else 0)
+        self.warn = warn
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # (scope, id) -> [tokens, updated, warned]
+        self.checked = 0
+        self.dropped = {"user": 0, "chat": 0}
+        self.warnings = 0
+        self.evicted = 0
+        self._dropped_total = self._warnings_total = None
+        if metrics is not None:
+            self._dropped_total = metrics.counter(
+                "flood_dropped_total", "Updates dropped by the flood guard.", ("scope",)
+            )
+            self._warnings_total = metrics.counter("flood_warnings_total", "Slow-down warnings sent.")
+            metrics.gauge_callback("flood_tracked_keys", "Buckets held by the flood guard.", lambda: len(self._buckets))
+
+    def check(self, data: dict, now: float = None) -> str:
+        """ALLOW, DROP or WARN for one raw update dict."""
+        now = time.monotonic() if now is None else now
+        user_id = extract_sender_id(data)
+        chat_id = extract_chat_id(data)
+        with self._lock:
+            self.checked += 1
+            self._evict_idle(now)
+            if self.rate and user_id is not None:
+                verdict = self._take(("user", user_id), self.rate, self.burst, now)
+                if verdict is not ALLOW:
+                    return self._count("user", verdict)
+            if self.chat_rate and chat_id is not None and chat_id != user_id:
+                verdict = self._take(("chat", chat_id), self.chat_rate, self.chat_burst, now)
+                if verdict is not ALLOW:
+                    return self._count("chat", verdict)
+        return ALLOW
+
+    def _take(self, key, rate: float, burst: float, now: float) -> str:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now, False]
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            if bucket[0] >= burst:
+                bucket[2] = False  # the flood is over; warn again next time
+        bucket[1] = now
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return ALLOW
+        if self.warn and not bucket[2]:
+            bucket[2] = True
+            return WARN
+        return DROP
+
+    def _evict_idle(self, now: float):
+        # Least recently used first, so stop at the first entry still in use
+        while self._buckets:
+            key, bucket = next(iter(self._buckets.items()))
+            if now - bucket[1] < self.ttl:
+                return
+            del self._buckets[key]
+            self.evicted += 1
+
+    def _count(self, scope: str, verdict: str) -> str:
+        self.dropped[scope] += 1
+        if self._dropped_total is not None:
+            self._dropped_total.inc(scope)
+        if verdict is WARN:
+            self.warnings += 1
+            if self._warnings_total is not None:
+                self._warnings_total.inc()
+        return verdict
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "checked": self.checked,
+                "dropped": dict(self.dropped),
+                "warnings": self.warnings,
+                "tracked": len(self._buckets),
+                "evicted": self.evicted,
+            }
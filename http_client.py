@@ -0,0 +1,86 @@
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (optional: pip install "httpx[http2]")
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def parse_host_timeouts(spec: str) -> dict:
+    """Parse ``"host=seconds,host=seconds"`` into ``{host: seconds}``."""
+    timeouts = {}
+    for part in (spec or "").split(","):
+        host, sep, seconds = part.strip().partition("=")
+        if sep and host:
+            timeouts[host.strip().lower()] = float(seconds)
+    return timeouts
+
+
+class SharedHTTPClient:
+    """One pooled ``httpx.AsyncClient`` for all outbound non-Telegram calls.
+
+    Keeps connections (and TLS sessions) alive between calls, negotiates HTTP/2
+    when ``h2`` is installed, and applies per-host timeouts. The client is
+    created lazily on first use so it binds to the loop that uses it, i.e. the
+    worker's runtime loop.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 5.0,
+        timeout: float = 10.0,
+        host_timeouts: dict = None,
+        http2: bool = True,
+        verify=True,
+    ):
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.connect_timeout = connect_timeout
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.host_timeouts = {
+            host: httpx.Timeout(seconds, connect=min(connect_timeout, seconds))
+            for host, seconds in (host_timeouts or {}).items()
+        }
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self.verify = verify
+        self._client = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                http2=self.http2,
+                verify=self.verify,
+                # Apps Script answers POSTs with a redirect to googleusercontent.com
+                follow_redirects=True,
+            )
+        return self._client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        if "timeout" not in kwargs:
+            host = (urlsplit(url).hostname or "").lower()
+            if host in self.host_timeouts:
+                kwargs["timeout"] = self.host_timeouts[host]
+        return await self.client.request(method, url, **kwargs)
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
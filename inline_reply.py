@@ -0,0 +1,113 @@
+import contextvars
+import json
+import logging
+import time
+
+from telegram.request import HTTPXRequest
+
+log = logging.getLogger(__name__)
+
+# Methods whose call may be moved into the webhook HTTP response body.
+INLINE_METHODS = frozenset({"sendMessage"})
+
+_current_capture = contextvars.ContextVar("inline_reply_capture", default=None)
+
+
+class InlineReplyCapture:
+    """Holds back the first reply of one update so it can ride on the webhook response.
+
+    Only a single method call fits in a webhook response. If a handler makes a
+    second Bot API call, the held reply is sent normally first (to keep message
+    order) and the capture closes, so everything after it goes out as usual.
+    """
+
+    __slots__ = ("url", "request_data", "is_open")
+
+    def __init__(self):
+        self.url = None
+        self.request_data = None
+        self.is_open = True
+
+    def release(self):
+        """Close the capture and return the held call as a webhook response body, if any."""
+        self.is_open = False
+        if self.request_data is None:
+            return None
+        method = self.url.rsplit("/", 1)[-1]
+        body = {"method": method, **self.request_data.parameters}
+        if isinstance(body.get("reply_markup"), str):
+            # Pre-serialized keyboard passed through api_kwargs
+            body["reply_markup"] = json.loads(body["reply_markup"])
+        self.url = self.request_data = None
+        return body
+
+
+class InlineReplyRequest(HTTPXRequest):
+    """HTTPXRequest that can defer one sendMessage per update into the webhook reply.
+
+    Behaves exactly like HTTPXRequest unless a capture is active in the current
+    context, see :func:`process_update_inline`.
+    """
+
+    async def do_request(
+        self,
+        url,
+        method,
+        request_data=None,
+        read_timeout=HTTPXRequest.DEFAULT_NONE,
+        write_timeout=HTTPXRequest.DEFAULT_NONE,
+        connect_timeout=HTTPXRequest.DEFAULT_NONE,
+        pool_timeout=HTTPXRequest.DEFAULT_NONE,
+    ):
+        capture = _current_capture.get()
+        if capture is not None and capture.is_open:
+            if (
+                capture.request_data is None
+                and request_data is not None
+                and not request_data.contains_files
+                and url.rsplit("/", 1)[-1] in INLINE_METHODS
+            ):
+                capture.url = url
+                capture.request_data = request_data
+                return 200, _fake_message_result(request_data.parameters)
+
+            # A second call: flush the held reply first, then stop capturing.
+            capture.is_open = False
+            if capture.request_data is not None:
+                held_url, held_data = capture.url, capture.request_data
+                capture.url = capture.request_data = None
+                code, payload = await super().do_request(held_url, "POST", held_data)
+                if code != 200:
+                    log.warning("⚠️ Deferred reply failed (%s): %r", code, payload[:200])
+
+        return await super().do_request(
+            url,
+            method,
+            request_data,
+            read_timeout=read_timeout,
+            write_timeout=write_timeout,
+            connect_timeout=connect_timeout,
+            pool_timeout=pool_timeout,
+        )
+
+
+def _fake_message_result(params: dict) -> bytes:
+    """Minimal Message so reply_text() has something to return for a deferred call."""
+    result = {
+        "message_id": 0,
+        "date": int(time.time()),
+        "chat": {"id": params.get("chat_id", 0), "type": "private"},
+        "text": params.get("text", ""),
+    }
+    return json.dumps({"ok": True, "result": result}).encode("utf-8")
+
+
+async def process_update_inline(application, update):
+    """Process ``update`` and return the deferred reply as a webhook response body, or None."""
+    capture = InlineReplyCapture()
+    token = _current_capture.set(capture)
+    try:
+        await application.process_update(update)
+    finally:
+        _current_capture.reset(token)
+    return capture.release()
@@ -0,0 +1,131 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime, timezone
+
+FORMATS = {"csv": "text/csv; charset=utf-8", "jsonl": "application/x-ndjson; charset=utf-8"}
+CSV_FIELDS = ("seq", "lead_id", "created_at", "status", "name", "email", "user_id", "username")
+# Bytes buffered before a chunk is handed to the server
+CHUNK_BYTES = 64 * 1024
+
+
+class ExportQuery:
+    """Validated export parameters.
+
+    ``after`` is the seq cursor: a page holds the first ``limit`` matching
+    leads with ``seq > after``, and the last row's ``seq`` is the cursor for the
+    next page. A page with fewer than ``limit`` rows is the last one.
+    """
+
+    __slots__ = ("format", "after", "limit", "since", "until", "statuses")
+
+    def __init__(self, format="csv", after=0, limit=None, since=None, until=None, statuses=()):
+        self.format = format
+        self.after = after
+        self.limit = limit
+        self.since = since
+        self.until = until
+        self.statuses = frozenset(statuses)
+
+    @classmethod
+    def from_args(cls, args, max_limit: int = 100_000) -> "ExportQuery":
+        """Build a query from request args; raises ValueError with a readable message."""
+        fmt = args.get("format", "csv").lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+        try:
+            after = int(args.get("after", 0))
+            limit = int(args.get("limit", max_limit))
+        except ValueError:
+            raise ValueError("after and limit must be integers") from None
+        if after < 0 or not 1 <= limit <= max_limit:
+            raise ValueError(f"after must be >= 0 and limit between 1 and {max_limit}")
+        statuses = [s.strip() for value in args.getlist("status") for s in value.split(",") if s.strip()]
+        return cls(
+            format=fmt,
+            after=after,
+            limit=limit,
+            since=_parse_time(args.get("since"), "since"),
+            until=_parse_time(args.get("until"), "until"),
+            statuses=statuses,
+        )
+
+    def matches(self, record: dict) -> bool:
+        if self.statuses and record.get("status") not in self.statuses:
+            return False
+        if self.since is None and self.until is None:
+            return True
+        created = _record_time(record)
+        if created is None:
+            return False
+        if self.since is not None and created < self.since:
+            return False
+        return self.until is None or created < self.until
+
+
+def export_leads(store, query: ExportQuery, compress: bool = False):
+    """Yield the export as byte chunks, reading the store lazily.
+
+    Memory stays bounded by one chunk whatever the number of leads.
+    """
+    encoder = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    buffer = io.StringIO()
+    writer = None
+    if query.format == "csv":
+        writer = csv.writer(buffer, lineterminator="\n")
+        writer.writerow(CSV_FIELDS)
+
+    def drain(final=False):
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        if encoder is not None:
+            data = encoder.compress(data) + (encoder.flush() if final else b"")
+        return data
+
+    rows = 0
+    for record in store.iter_records(after_seq=query.after):
+        if not query.matches(record):
+            continue
+        if writer is not None:
+            writer.writerow([_csv_cell(record.get(field)) for field in CSV_FIELDS])
+        else:
+            buffer.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        rows += 1
+        if buffer.tell() >= CHUNK_BYTES:
+            chunk = drain()
+            if chunk:
+                yield chunk
+        if query.limit is not None and rows >= query.limit:
+            break
+    chunk = drain(final=True)
+    if chunk:
+        yield chunk
+
+
+def _csv_cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, str) and value[:1] in ("=", "+", "-", "@", "\t", "\r"):
+        # Names and usernames come from users; keep spreadsheets from running them as formulas
+        return "'" + value
+    return value
+
+
+def _parse_time(value, name: str):
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or datetime") from None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _record_time(record: dict):
+    try:
+        created = datetime.fromisoformat(record["created_at"])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return created if created.tzinfo else created.replace(tzinfo=timezone.utc)
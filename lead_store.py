@@ -0,0 +1,438 @@
+import bisect
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+SEGMENT_PREFIX = "seg-"
+SEGMENT_SUFFIX = ".jsonl"
+SEEK_MARK_BYTES = 64 * 1024  # spacing of the (seq, offset) marks iter_records() seeks with
+
+
+def _segment_name(number: int) -> str:
+    return f"{SEGMENT_PREFIX}{number:08d}{SEGMENT_SUFFIX}"
+
+
+def _segment_number(name: str) -> int:
+    return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+def _dumps(record: dict) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+class LeadStore:
+    """Append-only lead log made of JSONL segments, with an in-memory index.
+
+    Every record carries a ``lead_id`` and a store-wide ``seq``. Updating a lead
+    appends a new version with the same ``lead_id``; the highest ``seq`` wins.
+    Appends go through one background writer thread that writes and fsyncs
+    whatever is queued as a single batch, so signup cost does not depend on how
+    many leads are already stored.
+
+    Several gunicorn workers may share one directory: writes and compaction
+    hold an flock on ``.lock`` and first catch up on records appended by other
+    processes, which keeps ``seq`` unique and the index current.
+    """
+
+    def __init__(
+        self,
+        directory: str = "leads",
+        segment_max_bytes: int = 8 * 1024 * 1024,
+        batch_size: int = 512,
+        compact_interval: float = 600.0,
+        compact_min_segments: int = 4,
+        legacy_file: str = None,
+        metrics=None,
+    ):
+        self.directory = directory
+        self.segment_max_bytes = segment_max_bytes
+        self.batch_size = batch_size
+        self.compact_interval = compact_interval
+        self.compact_min_segments = compact_min_segments
+
+        self._lock = threading.Lock()
+        self._file_mutex = threading.Lock()  # this process's share of the .lock flock, see _file_lock()
+        self._queue = queue.Queue()
+        self._seq = 0
+        self._latest = {}  # lead_id -> seq of its newest version
+        self._by_email = {}  # email -> lead_id
+        self._by_user = {}  # user_id -> lead_id
+        self._segments = {}  # name -> [inode, offset, first_seq, last_seq]
+        self._marks = {}  # name -> [(seq, byte offset where records from seq on start)]
+        self.appended = 0
+        self.batches = 0
+        self.compactions = 0
+        self.last_batch_seconds = 0.0
+        self._write_seconds = None
+        if metrics is not None:
+            self._write_seconds = metrics.histogram(
+                "lead_store_write_seconds", "Time to write and fsync one batch of leads."
+            )
+            metrics.gauge_callback("lead_store_leads", "Leads in the store.", lambda: self.count)
+            metrics.gauge_callback("lead_store_pending", "Leads queued for the writer.", self._queue.qsize)
+
+        os.makedirs(directory, exist_ok=True)
+        self._lock_fd = os.open(os.path.join(directory, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        with self._file_lock():
+            self._catch_up()
+            if legacy_file:
+                self._migrate(legacy_file)
+
+        self._stopping = False
+        self._thread = threading.Thread(target=self._writer, name="lead-store-writer", daemon=True)
+        self._thread.start()
+
+    # ----- public API -----
+    def append(self, lead: dict) -> Future:
+        """Queue a new lead. The future resolves to the stored record once it is fsynced."""
+        record = {"lead_id": uuid.uuid4().hex, **lead}
+        return self._submit(record)
+
+    def update(self, lead_id: str, lead: dict) -> Future:
+        """Append a new version of an existing lead."""
+        return self._submit({**lead, "lead_id": lead_id})
+
+    def find_by_email(self, email: str):
+        with self._lock:
+            return self._by_email.get(email)
+
+    def find_by_user(self, user_id):
+        with self._lock:
+            return self._by_user.get(user_id)
+
+    @property
+    def count(self) -> int:
+        with self._lock:
+            return len(self._latest)
+
+    @property
+    def last_seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def iter_records(self, after_seq: int = 0, latest_only: bool = True):
+        """Yield stored records with ``seq > after_seq`` in seq order, reading segments lazily.
+
+        With ``latest_only`` superseded versions of a lead are skipped. Reading
+        starts near ``after_seq`` rather than at the start of its segment, so
+        the cost follows the number of records after it.
+        """
+        with self._lock:
+            segments = sorted(
+                (name, meta[3], meta[0], self._seek_offset(name, after_seq))
+                for name, meta in self._segments.items()
+                if meta[3] > after_seq
+            )
+        # Compaction may fold a segment we have not reached yet into a later one;
+        # tracking the last seq yielded keeps the output ordered and duplicate-free.
+        last = after_seq
+        for name, _, inode, start in segments:
+            path = os.path.join(self.directory, name)
+            try:
+                f = open(path, "r", encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with f:
+                if start and os.fstat(f.fileno()).st_ino == inode:  # not rewritten since
+                    f.seek(start)
+                for line in f:
+                    record = _parse(line)
+                    if record is None or record["seq"] <= last:
+                        continue
+                    last = record["seq"]
+                    if latest_only:
+                        with self._lock:
+                            if self._latest.get(record["lead_id"]) != record["seq"]:
+                                continue
+                    yield record
+
+    def refresh(self):
+        """Pick up records other processes have appended since our last write."""
+        with self._file_lock():
+            self._catch_up()
+
+    def flush(self, timeout: float = None):
+        """Block until everything queued so far is on disk."""
+        future = Future()
+        self._queue.put((None, future))
+        future.result(timeout)
+
+    def close(self):
+        if self._stopping:
+            return
+        self._stopping = True
+        self._queue.put(None)
+        self._thread.join()
+        os.close(self._lock_fd)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "leads": len(self._latest),
+                "last_seq": self._seq,
+                "segments": len(self._segments),
+                "appended": self.appended,
+                "batches": self.batches,
+                "compactions": self.compactions,
+                "pending": self._queue.qsize(),
+                "last_batch_ms": round(self.last_batch_seconds * 1000, 3),
+            }
+
+    # ----- writer thread -----
+    def _submit(self, record: dict) -> Future:
+        if self._stopping:
+            raise RuntimeError("LeadStore is closed")
+        future = Future()
+        self._queue.put((record, future))
+        return future
+
+    def _writer(self):
+        next_compaction = time.monotonic() + self.compact_interval
+        while True:
+            timeout = max(0.0, next_compaction - time.monotonic())
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = False
+            if item is None:
+                return
+            batch = [item] if item else []
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._write_batch(batch)
+                    return
+                batch.append(item)
+            if batch:
+                self._write_batch(batch)
+            if time.monotonic() >= next_compaction:
+                next_compaction = time.monotonic() + self.compact_interval
+                try:
+                    self.compact()
+                except Exception as e:
+                    log.warning("⚠️ Lead store compaction failed: %s", e)
+
+    def _write_batch(self, batch):
+        started = time.perf_counter()
+        records = [(r, f) for r, f in batch if r is not None]
+        try:
+            if records:
+                with self._file_lock():
+                    self._catch_up()
+                    self._append_locked([r for r, _ in records])
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        self.last_batch_seconds = time.perf_counter() - started
+        self.batches += 1
+        if self._write_seconds is not None and records:
+            self._write_seconds.observe(self.last_batch_seconds)
+        for record, future in batch:
+            future.set_result(record)
+
+    def _append_locked(self, records):
+        name = self._active_segment()
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_max_bytes:
+            name = _segment_name(_segment_number(name) + 1)
+            path = os.path.join(self.directory, name)
+        lines = []
+        for record in records:
+            self._seq += 1
+            record["seq"] = self._seq
+            lines.append(_dumps(record))
+        data = "".join(lines).encode("utf-8")
+        fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+            st = os.fstat(fd)
+        finally:
+            os.close(fd)
+        with self._lock:
+            meta = self._segments.get(name)
+            if meta is None or meta[0] != st.st_ino:
+                meta = self._segments[name] = [st.st_ino, 0, records[0]["seq"], 0]
+                self._marks.pop(name, None)
+            self._mark(name, records[0]["seq"], st.st_size - len(data))
+            meta[1] = st.st_size
+            for record in records:
+                self._index(record)
+            meta[3] = self._seq
+            self.appended += len(records)
+
+    # ----- index / catch-up -----
+    def _index(self, record: dict):
+        lead_id = record["lead_id"]
+        self._seq = max(self._seq, record["seq"])
+        if self._latest.get(lead_id, 0) > record["seq"]:
+            return  # an older version, e.g. read again from a compacted segment
+        self._latest[lead_id] = record["seq"]
+        if record.get("email"):
+            self._by_email[record["email"]] = lead_id
+        if record.get("user_id") is not None:
+            self._by_user[record["user_id"]] = lead_id
+
+    def _mark(self, name: str, seq: int, offset: int):
+        """Note that records from ``seq`` on start at ``offset`` in segment ``name`` (lock held)."""
+        marks = self._marks.setdefault(name, [])
+        if not marks or offset - marks[-1][1] >= SEEK_MARK_BYTES:
+            marks.append((seq, offset))
+
+    def _seek_offset(self, name: str, after_seq: int) -> int:
+        """Offset in segment ``name`` before which every record has ``seq <= after_seq`` (lock held)."""
+        marks = self._marks.get(name)
+        if not marks:
+            return 0
+        i = bisect.bisect_right(marks, (after_seq + 1, float("inf")))
+        return marks[i - 1][1] if i else 0
+
+    def _list_segments(self):
+        return sorted(
+            n for n in os.listdir(self.directory)
+            if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX)
+        )
+
+    def _active_segment(self) -> str:
+        names = self._list_segments()
+        return names[-1] if names else _segment_name(1)
+
+    def _catch_up(self):
+        """Read whatever other processes appended since we last looked (lock held)."""
+        names = self._list_segments()
+        with self._lock:
+            for gone in set(self._segments) - set(names):
+                del self._segments[gone]
+                self._marks.pop(gone, None)
+        for name in names:
+            path = os.path.join(self.directory, name)
+            st = os.stat(path)
+            with self._lock:
+                meta = self._segments.get(name)
+            if meta is not None and meta[0] != st.st_ino:
+                # Rewritten by compaction in another process. It also holds the
+                # records of the segments folded into it, which we may not have
+                # read to the end: read it again from the start (_index keeps
+                # the newest version of each lead).
+                with self._lock:
+                    meta = self._segments[name] = [st.st_ino, 0, 0, 0]
+                    self._marks.pop(name, None)
+            offset = meta[1] if meta else 0
+            if st.st_size <= offset:
+                continue
+            with open(path, "rb") as f:
+                f.seek(offset)
+                data = f.read()
+            complete = data[: data.rfind(b"\n") + 1]
+            with self._lock:
+                if meta is None:
+                    meta = self._segments[name] = [st.st_ino, 0, 0, 0]
+                position = offset
+                for line in complete.splitlines(keepends=True):
+                    record = _parse(line.decode("utf-8"))
+                    if record is not None:
+                        self._index(record)
+                        self._mark(name, record["seq"], position)
+                        if not meta[2]:
+                            meta[2] = record["seq"]
+                        meta[3] = max(meta[3], record["seq"])
+                    position += len(line)
+                meta[1] = offset + len(complete)
+
+    @contextmanager
+    def _file_lock(self):
+        """Hold the directory against writers and compaction, from other threads and workers.
+
+        The flock alone is not enough: all threads share ``_lock_fd``, and a
+        flock on a shared fd neither excludes them nor survives one of them
+        unlocking it. Without the mutex a ``refresh()`` could read segments
+        the writer thread's ``compact()`` is deleting.
+        """
+        with self._file_mutex:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    # ----- compaction -----
+    def compact(self):
+        """Merge closed segments into one, dropping superseded lead versions."""
+        with self._file_lock():
+            self._catch_up()
+            names = self._list_segments()[:-1]  # never touch the active segment
+            if len(names) < self.compact_min_segments:
+                return False
+            target = names[-1]
+            tmp_path = os.path.join(self.directory, target + ".tmp")
+            first_seq = last_seq = 0
+            with open(tmp_path, "w", encoding="utf-8") as out:
+                for name in names:
+                    with open(os.path.join(self.directory, name), "r", encoding="utf-8") as f:
+                        for line in f:
+                            record = _parse(line)
+                            if record is None:
+                                continue
+                            with self._lock:
+                                if self._latest.get(record["lead_id"]) != record["seq"]:
+                                    continue
+                            out.write(_dumps(record))
+                            first_seq = first_seq or record["seq"]
+                            last_seq = record["seq"]
+                out.flush()
+                os.fsync(out.fileno())
+            os.replace(tmp_path, os.path.join(self.directory, target))
+            for name in names[:-1]:
+                os.remove(os.path.join(self.directory, name))
+            st = os.stat(os.path.join(self.directory, target))
+            with self._lock:
+                for name in names[:-1]:
+                    self._segments.pop(name, None)
+                    self._marks.pop(name, None)
+                self._segments[target] = [st.st_ino, st.st_size, first_seq, last_seq]
+                self._marks.pop(target, None)
+                self.compactions += 1
+            return True
+
+    # ----- migration -----
+    def _migrate(self, legacy_file: str):
+        """One-time import of the old leads.json array (lock held)."""
+        marker = os.path.join(self.directory, ".migrated")
+        if os.path.exists(marker) or not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+        except Exception as e:
+            log.warning("⚠️ Could not read legacy leads file: %s", e)
+            legacy = []
+        records = [{"lead_id": uuid.uuid4().hex, **lead} for lead in legacy if isinstance(lead, dict)]
+        if records:
+            self._append_locked(records)
+        with open(marker, "w", encoding="utf-8") as f:
+            f.write(f"{legacy_file}: {len(records)} leads\n")
+        log.info("📦 Migrated %d leads from %s", len(records), legacy_file)
+
+
+def _parse(line: str):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    return record if isinstance(record, dict) and "seq" in record and "lead_id" in record else None
@@ -0,0 +1,210 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+from telegram import InputFile
+from telegram.error import BadRequest
+
+log = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS media_file_ids (
+    bot_id  TEXT NOT NULL,
+    digest  TEXT NOT NULL,
+    kind    TEXT NOT NULL,
+    file_id TEXT NOT NULL,
+    PRIMARY KEY (bot_id, digest, kind)
+) WITHOUT ROWID
+"""
+
+_CHUNK = 1 << 20
+
+# BadRequest messages that mean the cached file_id itself is no good, e.g.
+# "Wrong file identifier/HTTP URL specified" or "FILE_REFERENCE_EXPIRED".
+# Other errors (a bad caption, a blocked chat) say nothing about the id.
+_STALE_FILE_ID = re.compile(r"wrong (remote )?file identifier|file.reference", re.IGNORECASE)
+
+
+class StreamingInputFile(InputFile):
+    """``InputFile`` that uploads straight from disk.
+
+    PTB's ``InputFile`` reads the whole file into memory; this one hands the
+    open file to httpx, which sends the multipart body in chunks. Close it
+    once the request is done.
+    """
+
+    __slots__ = ("_file",)
+
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        super().__init__(b"", filename=os.path.basename(path))
+
+    @property
+    def field_tuple(self):
+        return self.filename, self._file, self.mimetype
+
+    def close(self):
+        self._file.close()
+
+
+class MediaCache:
+    """Sends lesson media, uploading each file once per bot and reusing its ``file_id``.
+
+    Telegram returns a ``file_id`` for every uploaded file; sending that id
+    instead of the file costs one small request. Ids are kept in STATE_DB,
+    shared by all workers and kept across restarts, keyed by the bot (ids only
+    work for the bot that uploaded the file), the media type and a BLAKE2b
+    hash of the file's content. Editing or replacing a file changes its hash,
+    so the next send uploads the new content. The hash is computed off the
+    loop and only again when the file's size or mtime changes.
+
+    An id Telegram rejects as unknown is dropped and the file uploaded again;
+    any other ``BadRequest`` is raised and the id kept.
+    Concurrent first sends of a file in one process share one upload.
+    """
+
+    def __init__(self, path: str, bot_id: str, upload_timeout: float = 120.0, busy_timeout: float = 5.0, metrics=None):
+        self.path = path
+        self.bot_id = bot_id
+        self.upload_timeout = upload_timeout
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(_SCHEMA)
+        self._digests = {}  # path -> (mtime_ns, size, digest)
+        self._file_ids = {}  # (digest, kind) -> file_id
+        self._uploads = {}  # (digest, kind) -> lock held while that file uploads
+        self.reused = 0
+        self.uploaded = 0
+        self.bytes_uploaded = 0
+        self.rejected = 0
+        self._sends = None
+        if metrics is not None:
+            self._sends = metrics.counter("media_sends_total", "Lesson media sent, by source.", ("source",))
+
+    # ----- content hashes -----
+    def _digest(self, path: str) -> str:
+        st = os.stat(path)
+        cached = self._digests.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        h = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as f:
+            while chunk := f.read(_CHUNK):
+                h.update(chunk)
+        digest = h.hexdigest()
+        self._digests[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    # ----- file_ids -----
+    async def _file_id(self, key):
+        """The known ``file_id`` for ``key``; STATE_DB is only read (off the loop) on a miss."""
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            file_id = await asyncio.to_thread(self._lookup, key)
+        return file_id
+
+    def _lookup(self, key) -> str:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_id FROM media_file_ids WHERE bot_id = ? AND digest = ? AND kind = ?",
+                (self.bot_id, *key),
+            ).fetchone()
+        if row is None:
+            return None
+        self._file_ids[key] = row[0]
+        return row[0]
+
+    def _store(self, key, file_id: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO media_file_ids (bot_id, digest, kind, file_id) VALUES (?, ?, ?, ?)",
+                (self.bot_id, *key, file_id),
+            )
+
+    def _forget(self, key):
+        self._file_ids.pop(key, None)
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM media_file_ids WHERE bot_id = ? AND digest = ? AND kind = ?", (self.bot_id, *key)
+            )
+
+    # ----- sending -----
+    async def send(self, message, media):
+        """Reply to ``message`` with each ``content_catalog.Media`` in ``media``, in order."""
+        for item in media:
+            await self.send_one(message, item)
+
+    async def send_one(self, message, item):
+        key = (await asyncio.to_thread(self._digest, item.path), item.kind)
+        file_id = await self._file_id(key)
+        if file_id is not None:
+            try:
+                sent = await self._reply(message, item, file_id)
+            except BadRequest as e:
+                if not _STALE_FILE_ID.search(e.message):
+                    raise
+                log.warning("⚠️ Cached file_id for %s rejected (%s); uploading again", item.path, e)
+                self.rejected += 1
+                await asyncio.to_thread(self._forget, key)
+            else:
+                self._count("file_id")
+                return sent
+
+        lock = self._uploads.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                file_id = await self._file_id(key)
+                if file_id is not None:  # another send uploaded it meanwhile
+                    self._count("file_id")
+                    return await self._reply(message, item, file_id)
+                return await self._upload(message, item, key)
+        finally:
+            self._uploads.pop(key, None)
+
+    async def _upload(self, message, item, key):
+        upload = StreamingInputFile(item.path)
+        try:
+            sent = await self._reply(message, item, upload, write_timeout=self.upload_timeout)
+        finally:
+            upload.close()
+        self.uploaded += 1
+        self.bytes_uploaded += os.path.getsize(item.path)
+        self._count("upload")
+        file_id = self._sent_file_id(sent)
+        if file_id is not None:
+            self._file_ids[key] = file_id
+            await asyncio.to_thread(self._store, key, file_id)
+        return sent
+
+    @staticmethod
+    async def _reply(message, item, media, **kwargs):
+        reply = getattr(message, f"reply_{item.kind}")
+        return await reply(media, caption=item.caption, parse_mode=item.parse_mode, **kwargs)
+
+    @staticmethod
+    def _sent_file_id(sent):
+        # Telegram may file a media differently than sent (e.g. a short video as an animation)
+        attachment = sent.effective_attachment if sent is not None else None
+        if isinstance(attachment, (tuple, list)):  # photo: every size; the largest comes last
+            attachment = attachment[-1] if attachment else None
+        return getattr(attachment, "file_id", None)
+
+    def _count(self, source: str):
+        if source == "file_id":
+            self.reused += 1
+        if self._sends is not None:
+            self._sends.inc(source)
+
+    def stats(self) -> dict:
+        return {
+            "reused": self.reused,
+            "uploaded": self.uploaded,
+            "bytes_uploaded": self.bytes_uploaded,
+            "rejected_file_ids": self.rejected,
+            "cached_file_ids": len(self._file_ids),
+        }
@@ -0,0 +1,74 @@
+from telegram import Update
+from telegram.ext import BaseHandler
+
+# Zero-width / direction marks that Persian keyboards and some clients insert
+INVISIBLE_CHARS = ("\u200c", "\u200f")
+
+
+def strip_invisible(raw: str) -> str:
+    for ch in INVISIBLE_CHARS:
+        raw = raw.replace(ch, "")
+    return raw
+
+
+def normalize_label(raw: str) -> str:
+    return strip_invisible(raw).strip() if raw else ""
+
+
+class MenuRouter(BaseHandler):
+    """Routes exact-match button texts to callbacks with a single dict lookup.
+
+    Replaces a chain of ``MessageHandler(filters.Regex("^(label)$"))`` handlers:
+    new menu entries are registered in the routing table instead of adding
+    another regex that every text message has to be checked against. Only
+    plain new messages are routed; edited messages and channel posts are not.
+
+    The matched callback's return value is passed through, so a router can also
+    serve as a ``ConversationHandler`` entry point.
+    """
+
+    def __init__(self, routes: dict = None, block: bool = True):
+        super().__init__(self._unrouted, block=block)
+        self.callback_wrapper = None
+        self.routes = {}
+        for labels, callback in (routes or {}).items():
+            self.add(labels, callback)
+
+    def add(self, labels, callback):
+        """Route one label, or each label of a tuple/list, to ``callback``."""
+        if isinstance(labels, str):
+            labels = (labels,)
+        if self.callback_wrapper is not None:
+            callback = self.callback_wrapper(callback)
+        for label in labels:
+            self.routes[normalize_label(label)] = callback
+
+    def replace(self, routes: dict):
+        """Swap in a whole new routing table at once (e.g. after a content reload)."""
+        fresh = MenuRouter()
+        fresh.callback_wrapper = self.callback_wrapper
+        for labels, callback in routes.items():
+            fresh.add(labels, callback)
+        self.routes = fresh.routes
+
+    def wrap_callbacks(self, wrapper):
+        """Apply ``wrapper`` to every route callback, now and on later add()/replace()."""
+        self.callback_wrapper = wrapper
+        self.routes = {label: wrapper(callback) for label, callback in self.routes.items()}
+
+    def probe_texts(self) -> list:
+        """A text this router accepts, for probes such as UpdatePrefilter's."""
+        return list(self.routes)[:1]
+
+    def check_update(self, update: object):
+        if not isinstance(update, Update) or update.message is None or not update.message.text:
+            return None
+        return self.routes.get(normalize_label(update.message.text))
+
+    async def handle_update(self, update, application, check_result, context):
+        self.collect_additional_context(context, update, application, check_result)
+        return await check_result(update, context)
+
+    @staticmethod
+    async def _unrouted(update, context):
+        return None
@@ -0,0 +1,411 @@
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from telegram.ext import ConversationHandler
+from telegram.request import HTTPXRequest
+
+# Seconds; suits handlers, Bot API calls and Sheet POSTs alike
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base for instruments whose values live in per-thread shards.
+
+    Each thread writes only to its own dict (label values -> value), so the hot
+    path takes no lock; a scrape sums the shards. Shards of finished threads
+    are folded into ``_retired`` so short-lived threads do not pile up.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []  # (thread, values)
+        self._retired = {}
+
+    def _shard(self) -> dict:
+        try:
+            return self._local.values
+        except AttributeError:
+            values = self._local.values = {}
+            with self._lock:
+                self._fold_dead_shards()
+                self._shards.append((threading.current_thread(), values))
+            return values
+
+    def _fold_dead_shards(self):
+        alive = []
+        for thread, values in self._shards:
+            if thread.is_alive():
+                alive.append((thread, values))
+            else:
+                for labels, value in values.items():
+                    self._merge(self._retired, labels, value)
+        self._shards = alive
+
+    def _collect(self) -> dict:
+        with self._lock:
+            self._fold_dead_shards()
+            total = {}
+            for labels, value in self._retired.items():
+                self._merge(total, labels, value)
+            for _, values in self._shards:
+                for labels, value in list(values.items()):
+                    self._merge(total, labels, value)
+        return total
+
+    @staticmethod
+    def _merge(into: dict, labels, value):
+        into[labels] = into.get(labels, 0) + value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, value in sorted(self._collect().items()):
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        values = self._shard()
+        values[labels] = values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    """Gauge that is moved with inc()/dec(), e.g. requests in flight."""
+
+    kind = "gauge"
+
+    def inc(self, *labels, amount=1):
+        values = self._shard()
+        values[labels] = values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class CallbackGauge:
+    """Gauge read at scrape time from ``callback()``: a number, or {label values: number}."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.labelnames = tuple(labelnames)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        value = self.callback()
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for labels, v in items:
+            if v is None:
+                continue
+            labels = labels if isinstance(labels, tuple) else (labels,)
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(v)}"
+
+
+class CallbackCounter(CallbackGauge):
+    """Counter read at scrape time, for totals another object already keeps (e.g. dropped records)."""
+
+    kind = "counter"
+
+
+class _LabeledCallbacks:
+    """Callback of a gauge shared by several ``LabeledMetrics``: each adds its own label values."""
+
+    def __init__(self):
+        self._callbacks = {}  # constant label values -> callback
+
+    def add(self, values: tuple, callback):
+        self._callbacks[values] = callback
+
+    def __call__(self) -> dict:
+        merged = {}
+        for values, callback in list(self._callbacks.items()):
+            value = callback()
+            items = value.items() if isinstance(value, dict) else [((), value)]
+            for labels, v in items:
+                merged[values + (labels if isinstance(labels, tuple) else (labels,))] = v
+        return merged
+
+
+class _Bound:
+    """An instrument with its leading label values filled in."""
+
+    __slots__ = ("metric", "values")
+
+    def __init__(self, metric, values: tuple):
+        self.metric = metric
+        self.values = values
+
+    def inc(self, *labels, amount=1):
+        self.metric.inc(*self.values, *labels, amount=amount)
+
+    def dec(self, *labels, amount=1):
+        self.metric.dec(*self.values, *labels, amount=amount)
+
+    def observe(self, value: float, *labels):
+        self.metric.observe(value, *self.values, *labels)
+
+    def time(self, *labels):
+        return self.metric.time(*self.values, *labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        values = self._shard()
+        counts = values.get(labels)
+        if counts is None:
+            # per-bucket counts, then +Inf, sum, count
+            counts = values[labels] = [0] * (len(self.buckets) + 3)
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-2] += value
+        counts[-1] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    @staticmethod
+    def _merge(into: dict, labels, value):
+        current = into.get(labels)
+        into[labels] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+
+    def render(self):
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.kind}"
+        for labels, counts in sorted(self._collect().items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(counts[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {counts[-1]}"
+
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+
+
+class MetricsRegistry:
+    """Named instruments rendered together in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"metric {metric.name} already registered as {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames=()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def gauge_callback(self, name: str, documentation: str, callback, labelnames=()) -> CallbackGauge:
+        return self._register(CallbackGauge(name, documentation, callback, labelnames))
+
+    def counter_callback(self, name: str, documentation: str, callback, labelnames=()) -> CallbackCounter:
+        return self._register(CallbackCounter(name, documentation, callback, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def labeled(self, **labels) -> "LabeledMetrics":
+        """This registry, with ``labels`` added to every instrument made through the result."""
+        return LabeledMetrics(self, labels)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# {metric.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+class LabeledMetrics:
+    """Registry view that puts constant labels first on every instrument, e.g. ``bot="default"``.
+
+    Several views with the same label names share each instrument, so one bot's
+    components export the same metrics as another's, told apart by the labels.
+    Takes the place of a ``MetricsRegistry`` wherever a component wants one.
+    """
+
+    def __init__(self, registry: MetricsRegistry, labels: dict):
+        self.registry = registry
+        self.names = tuple(labels)
+        self.values = tuple(str(v) for v in labels.values())
+
+    def counter(self, name: str, documentation: str, labelnames=()):
+        return _Bound(self.registry.counter(name, documentation, self.names + tuple(labelnames)), self.values)
+
+    def gauge(self, name: str, documentation: str, labelnames=()):
+        return _Bound(self.registry.gauge(name, documentation, self.names + tuple(labelnames)), self.values)
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = self.registry.histogram(name, documentation, self.names + tuple(labelnames), buckets)
+        return _Bound(metric, self.values)
+
+    def gauge_callback(self, name: str, documentation: str, callback, labelnames=()):
+        return self._callback(CallbackGauge, name, documentation, callback, labelnames)
+
+    def counter_callback(self, name: str, documentation: str, callback, labelnames=()):
+        return self._callback(CallbackCounter, name, documentation, callback, labelnames)
+
+    def _callback(self, cls, name, documentation, callback, labelnames):
+        metric = self.registry._register(cls(name, documentation, _LabeledCallbacks(), self.names + tuple(labelnames)))
+        if not isinstance(metric.callback, _LabeledCallbacks):
+            raise ValueError(f"metric {name} already registered without labels {self.names}")
+        metric.callback.add(self.values, callback)
+        return metric
+
+
+# ----- Telegram instrumentation -----
+def instrument_handlers(application, metrics):
+    """Time every handler callback registered on ``application``.
+
+    ``metrics`` is a ``MetricsRegistry``, or with several bots the bot's
+    ``LabeledMetrics`` so the series carry its ``bot`` label.
+
+    Recurses into ConversationHandlers; handlers that dispatch to several
+    callbacks themselves (e.g. MenuRouter) are asked to wrap them through their
+    ``wrap_callbacks(wrapper)`` method.
+    """
+    seconds = metrics.histogram(
+        "telegram_handler_seconds", "Time spent in a handler callback.", ("handler",)
+    )
+    errors = metrics.counter(
+        "telegram_handler_errors_total", "Handler callbacks that raised.", ("handler",)
+    )
+    wrapped = {}
+
+    def wrap(callback):
+        if getattr(callback, "__instrumented__", False):
+            return callback
+        if callback in wrapped:
+            return wrapped[callback]
+        name = getattr(callback, "__name__", type(callback).__name__)
+
+        @wraps(callback)
+        async def timed(update, context):
+            started = time.perf_counter()
+            try:
+                return await callback(update, context)
+            except Exception:
+                errors.inc(name)
+                raise
+            finally:
+                seconds.observe(time.perf_counter() - started, name)
+
+        timed.__instrumented__ = True
+        wrapped[callback] = timed
+        return timed
+
+    def visit(handler):
+        if isinstance(handler, ConversationHandler):
+            for inner in handler.entry_points + handler.fallbacks:
+                visit(inner)
+            for state_handlers in handler.states.values():
+                for inner in state_handlers:
+                    visit(inner)
+        elif hasattr(handler, "wrap_callbacks"):
+            handler.wrap_callbacks(wrap)
+        else:
+            handler.callback = wrap(handler.callback)
+
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            visit(handler)
+
+
+class TimedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest that records the latency and outcome of each Bot API call.
+
+    Put it after other request subclasses in the bases so only calls that
+    actually go over the network are timed.
+    """
+
+    def __init__(self, *args, metrics: MetricsRegistry = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._api_seconds = self._api_errors = None
+        if metrics is not None:
+            self._api_seconds = metrics.histogram(
+                "telegram_api_request_seconds", "Bot API call latency.", ("method", "outcome")
+            )
+            self._api_errors = metrics.counter(
+                "telegram_api_errors_total", "Bot API calls that failed.", ("method", "reason")
+            )
+
+    async def do_request(self, url, method, request_data=None, **timeouts):
+        if self._api_seconds is None:
+            return await super().do_request(url, method, request_data, **timeouts)
+        api_method = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, request_data, **timeouts)
+        except Exception as e:
+            self._api_seconds.observe(time.perf_counter() - started, api_method, "exception")
+            self._api_errors.inc(api_method, type(e).__name__)
+            raise
+        outcome = "ok" if code == 200 else str(code)
+        self._api_seconds.observe(time.perf_counter() - started, api_method, outcome)
+        if code != 200:
+            self._api_errors.inc(api_method, f"http_{code}")
+        return code, payload
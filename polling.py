@@ -0,0 +1,155 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from update_queue import extract_chat_id, is_valid_update
+from webhook_setup import WebhookError
+
+log = logging.getLogger(__name__)
+
+CONFLICT = 409
+
+
+class UpdatePoller:
+    """Long-polls ``getUpdates`` for one bot, as an alternative to the webhook.
+
+    ``start()`` deletes the bot's webhook (keeping updates Telegram has queued)
+    and starts polling on the calling loop. Each call asks for up to ``limit``
+    updates and waits up to ``timeout`` seconds for the first one. A batch is
+    processed before the next call: updates of different chats concurrently
+    (at most ``concurrency`` chats at a time), those of one chat in order.
+    ``handler(data)`` gets the raw update dict; an update whose handler fails
+    is logged and counted, not retried.
+
+    Telegram forgets updates once ``getUpdates`` is called with a higher
+    offset, and the offset only moves past a batch after all of it has been
+    processed, so a crash mid-batch means the batch is delivered again.
+    ``stop()`` lets the running batch finish and confirms it before returning.
+
+    ``registrar`` is a ``webhook_setup.WebhookRegistrar`` for the bot whose
+    HTTP client allows reads longer than ``timeout``.
+    """
+
+    def __init__(
+        self,
+        registrar,
+        handler,
+        limit: int = 100,
+        timeout: int = 50,
+        concurrency: int = 32,
+        allowed_updates=None,
+        name: str = "poller",
+    ):
+        self.registrar = registrar
+        self.handler = handler
+        self.limit = max(1, min(100, limit))  # the Bot API's maximum
+        self.timeout = timeout
+        self.concurrency = max(1, concurrency)
+        self.allowed_updates = allowed_updates
+        self.name = name
+        self.offset = None  # first update_id not yet processed
+        self._confirmed = None  # offset Telegram has been told about
+        self._task = None
+        self._idle = False  # waiting on getUpdates or a retry, not processing: safe to cancel
+        self._stopping = False
+        self.batches = 0
+        self.updates = 0
+        self.failed = 0
+        self.errors = 0
+        self.last_batch_size = 0
+        self.last_batch_ms = 0.0
+        self.last_error = None
+
+    # ----- lifecycle (runtime hooks) -----
+    async def start(self):
+        await self.registrar.delete(drop_pending_updates=False)
+        log.info("📥 Webhook deleted, polling for updates", extra={"bot": self.name})
+        self._stopping = False
+        self._task = asyncio.create_task(self._run(), name=f"{self.name}-poller")
+
+    async def stop(self):
+        self._stopping = True
+        if self._task is not None:
+            if self._idle:
+                self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self.offset is not None and self.offset != self._confirmed:
+            try:
+                await self._get_updates(timeout=0, limit=1)
+            except (WebhookError, httpx.HTTPError) as e:
+                log.warning("⚠️ Could not confirm processed updates: %s", e)
+        await self.registrar.aclose()
+
+    # ----- polling -----
+    async def _get_updates(self, timeout: int, limit: int) -> list:
+        params = {"timeout": timeout, "limit": limit}
+        if self.offset is not None:
+            params["offset"] = self.offset
+        if self.allowed_updates is not None:
+            params["allowed_updates"] = self.allowed_updates
+        updates = await self.registrar.call("getUpdates", **params)
+        self._confirmed = self.offset
+        return updates
+
+    async def _run(self):
+        backoff = 1.0
+        while not self._stopping:
+            self._idle = True
+            try:
+                updates = await self._get_updates(self.timeout, self.limit)
+            except (WebhookError, httpx.HTTPError) as e:
+                self.errors += 1
+                self.last_error = str(e)
+                if getattr(e, "error_code", None) == CONFLICT:
+                    # A webhook was set again, or another process polls this bot
+                    log.warning("⚠️ getUpdates conflict, retrying: %s", e, extra={"bot": self.name})
+                else:
+                    log.warning("⚠️ getUpdates failed: %s", e, extra={"bot": self.name})
+                await asyncio.sleep(getattr(e, "retry_after", None) or backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            self._idle = False
+            if updates:
+                await self._process(updates)
+                self.offset = updates[-1]["update_id"] + 1
+
+    async def _process(self, updates: list):
+        started = time.perf_counter()
+        chats = {}  # chat (or sender) id -> its updates, in order
+        for data in updates:
+            if not is_valid_update(data):
+                continue
+            key = extract_chat_id(data)
+            chats.setdefault(data["update_id"] if key is None else key, []).append(data)
+        slots = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._process_chat(chat, slots) for chat in chats.values()))
+        self.batches += 1
+        self.updates += len(updates)
+        self.last_batch_size = len(updates)
+        self.last_batch_ms = (time.perf_counter() - started) * 1000
+
+    async def _process_chat(self, updates: list, slots: asyncio.Semaphore):
+        async with slots:
+            for data in updates:
+                try:
+                    await self.handler(data)
+                except Exception as e:
+                    self.failed += 1
+                    log.exception("❌ Polled update %s failed: %s", data["update_id"], e)
+
+    def stats(self) -> dict:
+        return {
+            "polling": self._task is not None,
+            "offset": self.offset,
+            "batches": self.batches,
+            "updates": self.updates,
+            "failed": self.failed,
+            "errors": self.errors,
+            "last_batch_size": self.last_batch_size,
+            "last_batch_ms": round(self.last_batch_ms, 3),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,356 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+TRUNCATED = "[other stacks]"
+
+
+class SamplingProfiler:
+    """Samples the stacks of 1 in ``every`` webhook requests, for flamegraphs.
+
+    While a request is being profiled, a sampler thread records every
+    ``interval`` seconds the stack of the request's thread and of the threads
+    passed to :meth:`watch` (the bot loop, where the handlers run). A loop
+    thread only shows code that is running; for coroutines run through
+    :meth:`follow` it also records, while they are suspended, the chain of
+    awaits they wait in (e.g. a handler waiting for sendMessage). Samples
+    from all requests add up in one table of collapsed stacks, the input of
+    flamegraph.pl and speedscope. The table holds at most ``max_stacks``
+    distinct stacks (later new ones count as ``[other stacks]``) of at most
+    ``max_depth`` frames each.
+
+    Disabled, it costs one attribute check per request and has no thread.
+    The loop is shared, so its samples also include work for concurrent
+    requests that are not profiled.
+    """
+
+    def __init__(self, every: int = 10, interval: float = 0.005, max_stacks: int = 5000, max_depth: int = 64):
+        self.every = every
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.max_depth = max_depth
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._watched = {}  # thread id -> label, sampled alongside profiled requests
+        self._active = Counter()  # thread id -> profiled requests running on it
+        self._tasks = Counter()  # asyncio task -> profiled coroutines it runs
+        self._stacks = Counter()  # tuple of frame labels, root first -> samples
+        self._labels = {}  # code object -> "module:qualname"
+        self._seen = 0
+        self.profiled = 0
+        self.followed = 0
+        self.samples = 0
+        self.enabled_at = None
+
+    def watch(self, thread_id: int, label: str):
+        """Also sample ``thread_id`` while any profiled request runs."""
+        self._watched[thread_id] = label
+
+    # ----- control -----
+    def enable(self, every: int = None, interval: float = None):
+        with self._lock:
+            if every is not None:
+                self.every = max(1, every)
+            if interval is not None:
+                self.interval = max(0.001, interval)
+            if self.enabled:
+                return
+            self.enabled = True
+            self.enabled_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="profiler-sampler", daemon=True)
+            self._thread.start()
+        log.info("🔬 Profiling 1 in %d webhook requests", self.every)
+
+    def disable(self):
+        with self._lock:
+            if not self.enabled:
+                return
+            self.enabled = False
+            thread, self._thread = self._thread, None
+        self._wake.set()
+        thread.join()
+        log.info("🔬 Profiling stopped")
+
+    def reset(self):
+        with self._lock:
+            self._stacks.clear()
+            self.samples = 0
+            self.profiled = 0
+            self.followed = 0
+
+    # ----- requests -----
+    def sample(self) -> bool:
+        """True for 1 in ``every`` calls: profile this request."""
+        self._seen += 1
+        return self._seen % self.every == 0
+
+    @contextmanager
+    def profile(self):
+        """Sample the calling thread (and the watched ones) until the block exits."""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._active[thread_id] += 1
+            self.profiled += 1
+        self._wake.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active[thread_id] -= 1
+                if not self._active[thread_id]:
+                    del self._active[thread_id]
+
+    def profiling(self) -> bool:
+        """Whether the calling thread is inside :meth:`profile`."""
+        return threading.get_ident() in self._active
+
+    async def follow(self, coro):
+        """Await ``coro``, sampling where its task waits while it is suspended."""
+        task = asyncio.current_task()
+        with self._lock:
+            self._tasks[task] += 1
+            self.followed += 1
+        self._wake.set()
+        try:
+            return await coro
+        finally:
+            with self._lock:
+                self._tasks[task] -= 1
+                if not self._tasks[task]:
+                    del self._tasks[task]
+
+    # ----- sampling -----
+    def _run(self):
+        while self.enabled:
+            if not self._active and not self._tasks:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            self._take_sample()
+
+    def _take_sample(self):
+        own = threading.get_ident()
+        frames = sys._current_frames()
+        with self._lock:
+            threads = {tid: "request" for tid in self._active}
+            threads.update(self._watched)
+            for thread_id, label in threads.items():
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                self._count(self._stack(frame, label))
+            for task in self._tasks:
+                stack = self._awaiting(task)
+                if stack is not None:
+                    self._count(stack)
+
+    def _count(self, stack: tuple):
+        if stack in self._stacks or len(self._stacks) < self.max_stacks:
+            self._stacks[stack] += 1
+        else:
+            self._stacks[(stack[0], TRUNCATED)] += 1
+        self.samples += 1
+
+    def _label(self, frame) -> str:
+        code = frame.f_code
+        name = self._labels.get(code)
+        if name is None:
+            module = frame.f_globals.get("__name__", "?")
+            name = self._labels[code] = f"{module}:{getattr(code, 'co_qualname', code.co_name)}"
+        return name
+
+    def _stack(self, frame, label: str) -> tuple:
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame))
+            frame = frame.f_back
+        if len(labels) > self.max_depth:
+            labels = labels[: self.max_depth] + ["..."]  # keep the innermost frames
+        labels.append(label)
+        labels.reverse()
+        return tuple(labels)
+
+    def _awaiting(self, task):
+        """The await chain of a suspended task, outermost first; None while it runs."""
+        labels = ["await"]
+        coro = task.get_coro()
+        if getattr(coro, "cr_running", True):
+            return None  # the loop thread's own sample has it
+        while coro is not None and len(labels) <= self.max_depth:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+            if frame is not None:
+                labels.append(self._label(frame))
+            awaited = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+            coro = awaited.get_coro() if isinstance(awaited, asyncio.Task) else awaited
+        return tuple(labels)
+
+    # ----- output -----
+    def collapsed(self) -> str:
+        """``root;...;leaf count`` lines, most sampled first."""
+        with self._lock:
+            stacks = self._stacks.most_common()
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "every": self.every,
+                "interval_ms": round(self.interval * 1000, 3),
+                "profiled_requests": self.profiled,
+                "followed_tasks": self.followed,
+                "samples": self.samples,
+                "stacks": len(self._stacks),
+                "max_stacks": self.max_stacks,
+                "enabled_at": self.enabled_at,
+            }
+
+
+class SharedProfilerControl:
+    """Applies ``/admin/profile`` settings in every worker and merges their stacks.
+
+    A profiler lives in one worker, but the request switching it on reaches
+    only one of them. :meth:`publish` writes the settings to ``control.json``
+    in ``directory``; every worker polls that file from its bot loop each
+    ``poll_interval`` seconds and applies what changed, including a reset.
+    While its profiler has samples, a worker also writes them to
+    ``stacks-<pid>.txt`` on each poll, and :meth:`collapsed` adds up those
+    files with this worker's own samples, so other workers' latest samples
+    are at most ``poll_interval`` seconds old. A worker started later picks
+    up the current settings on its first poll.
+    """
+
+    def __init__(self, profiler: SamplingProfiler, directory: str, poll_interval: float = 2.0, worker: str = None):
+        self.profiler = profiler
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.worker = worker or str(os.getpid())
+        os.makedirs(directory, exist_ok=True)
+        self.control_path = os.path.join(directory, "control.json")
+        self.stacks_path = os.path.join(directory, f"stacks-{self.worker}.txt")
+        self._version = None  # control version applied here; None: none yet
+        self._reset_id = self._read_control().get("reset_id", 0)  # earlier resets predate our samples
+        self._dumped = None  # samples count last written to stacks_path
+        self._task = None
+
+    # ----- lifecycle (runtime hooks) -----
+    async def start(self):
+        self._task = asyncio.create_task(self._poll(), name="profiler-control")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self._dump)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await asyncio.to_thread(self.sync)
+            except OSError as e:
+                log.warning("⚠️ Profiler control check failed: %s", e)
+
+    # ----- control -----
+    def publish(self, enabled: bool = None, every: int = None, interval: float = None, reset: bool = False) -> dict:
+        """Change the settings of every worker; this one applies them at once."""
+        with open(os.path.join(self.directory, ".control.lock"), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            control = self._read_control()
+            control.setdefault("enabled", self.profiler.enabled)
+            for key, value in (("enabled", enabled), ("every", every), ("interval", interval)):
+                if value is not None:
+                    control[key] = value
+            control["version"] = control.get("version", 0) + 1
+            if reset:
+                control["reset_id"] = control.get("reset_id", 0) + 1
+                for path in glob.glob(os.path.join(self.directory, "stacks-*.txt")):
+                    os.remove(path)
+            tmp = f"{self.control_path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(control, f)
+            os.replace(tmp, self.control_path)
+        self._apply(control)
+        return control
+
+    def sync(self):
+        """Apply settings published by another worker, then write this worker's samples."""
+        control = self._read_control()
+        if control.get("version", 0) != self._version:
+            self._apply(control)
+        self._dump()
+
+    def _apply(self, control: dict):
+        self._version = control.get("version", 0)
+        if control.get("reset_id", 0) != self._reset_id:
+            self._reset_id = control.get("reset_id", 0)
+            self.profiler.reset()
+            self._dumped = None
+            try:
+                os.remove(self.stacks_path)  # in case we wrote it after publish() cleared the directory
+            except FileNotFoundError:
+                pass
+        if control.get("enabled"):
+            self.profiler.enable(every=control.get("every"), interval=control.get("interval"))
+        else:
+            self.profiler.disable()
+
+    def _read_control(self) -> dict:
+        try:
+            with open(self.control_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    # ----- output -----
+    def _dump(self):
+        samples = self.profiler.samples
+        if samples == self._dumped or (not samples and self._dumped is None):
+            return
+        tmp = self.stacks_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.profiler.collapsed())
+        os.replace(tmp, self.stacks_path)
+        self._dumped = samples
+
+    def collapsed(self) -> str:
+        """All workers' collapsed stacks added up, most sampled first."""
+        totals = Counter()
+        texts = [self.profiler.collapsed()]
+        for path in glob.glob(os.path.join(self.directory, "stacks-*.txt")):
+            if path == self.stacks_path:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    texts.append(f.read())
+            except FileNotFoundError:
+                continue  # reset meanwhile
+        for text in texts:
+            for line in text.splitlines():
+                stack, _, count = line.rpartition(" ")
+                if stack and count.isdigit():
+                    totals[stack] += int(count)
+        return "".join(f"{stack} {count}\n" for stack, count in totals.most_common())
+
+    def stats(self) -> dict:
+        workers = glob.glob(os.path.join(self.directory, "stacks-*.txt"))
+        return {
+            **self.profiler.stats(),
+            "pid": os.getpid(),
+            "control_version": self._version,
+            "workers_with_samples": len(set(workers) | ({self.stacks_path} if self.profiler.samples else set())),
+        }
@@ -0,0 +1,102 @@
+"""The PTB internals the bot relies on, in one place.
+
+PTB has no public API to read or replace one conversation's state, to drop one
+user's data from memory or to tell which users have changes not persisted yet.
+The persistence and ``user_state.UserStateCache`` need all three, so they
+reach into ``Application`` and ``ConversationHandler``. Those private names are
+only used through the functions below; they are checked on import, and
+``tests/test_ptb_compat.py`` runs them against the pinned release.
+"""
+import logging
+
+import telegram
+from telegram.ext import Application, ConversationHandler
+from telegram.ext._utils.trackingdict import TrackingDict
+
+log = logging.getLogger(__name__)
+
+TESTED_PTB_VERSION = "20.8"  # keep in step with requirements.txt
+
+_REQUIRED = (
+    (ConversationHandler, "_get_key"),
+    (ConversationHandler, "_conversations"),
+    (TrackingDict, "_write_access_keys"),
+    (TrackingDict, "update_no_track"),
+    (Application, "_user_data"),
+    (Application, "_chat_data"),
+    (Application, "_user_ids_to_be_updated_in_persistence"),
+    (Application, "_chat_ids_to_be_updated_in_persistence"),
+)
+
+
+def _check():
+    # Instance attributes are slots, so they show up on the class too
+    missing = [f"{cls.__name__}.{name}" for cls, name in _REQUIRED if not hasattr(cls, name)]
+    if missing:
+        raise RuntimeError(
+            f"python-telegram-bot {telegram.__version__} lacks {', '.join(missing)}; "
+            f"ptb_compat.py was written against {TESTED_PTB_VERSION}"
+        )
+    if telegram.__version__ != TESTED_PTB_VERSION:
+        log.warning(
+            "⚠️ python-telegram-bot %s is not the tested %s; check ptb_compat.py",
+            telegram.__version__, TESTED_PTB_VERSION,
+        )
+
+
+_check()
+
+
+# ----- conversations -----
+def conversation_key(handler, update):
+    """``handler``'s key for ``update``, or None if the update has no chat/user to key on."""
+    try:
+        return handler._get_key(update)
+    except RuntimeError:
+        return None
+
+
+def set_conversation_state(handler, key, state):
+    """Put ``key``'s state (None: no conversation) without marking it for persistence."""
+    # ConversationHandler keeps its states in a TrackingDict; the untracked
+    # write/pop keep a refresh from being persisted back.
+    conversations = handler._conversations
+    if state is None:
+        conversations.data.pop(key, None)
+    else:
+        conversations.update_no_track({key: state})
+
+
+def end_conversation(handler, key) -> bool:
+    """End ``key``'s conversation, also in the persistence; False if there was none."""
+    if key not in handler._conversations:
+        return False
+    del handler._conversations[key]  # tracked: update_persistence() deletes the row
+    return True
+
+
+def conversation_unsaved(handler, key) -> bool:
+    """Whether ``key``'s state changed since the last ``update_persistence()``."""
+    return key in handler._conversations._write_access_keys
+
+
+# ----- user and chat data -----
+def user_unsaved(application, user_id) -> bool:
+    return user_id in application._user_ids_to_be_updated_in_persistence
+
+
+def chat_unsaved(application, chat_id) -> bool:
+    return chat_id in application._chat_ids_to_be_updated_in_persistence
+
+
+def drop_user_from_memory(application, user_id):
+    application._user_data.pop(user_id, None)
+
+
+def drop_chat_from_memory(application, chat_id):
+    application._chat_data.pop(chat_id, None)
+
+
+def unmark_chat(application, chat_id):
+    """Forget that ``chat_id`` needs persisting (PTB only clears this when it persists chat_data)."""
+    application._chat_ids_to_be_updated_in_persistence.discard(chat_id)
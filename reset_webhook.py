@@ -1,15 +1,77 @@
+"""Manage the bot's Telegram webhook.
+
+    python reset_webhook.py              # same as "ensure"
+    python reset_webhook.py ensure       # set the webhook only if it is not already ours
+    python reset_webhook.py set [--drop-pending]
+    python reset_webhook.py info
+    python reset_webhook.py delete [--drop-pending]
+
+The URL is ``$ROOT_URL/webhook/$TELEGRAM_TOKEN`` unless ``--url`` is given.
+With ``--bot NAME`` the command is for that bot of ``$BOTS_FILE`` instead, and
+with ``--all`` for every bot the process serves.
+"""
+import argparse
+import asyncio
+import json
 import os
-import requests
 
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-ROOT_URL = os.getenv("ROOT_URL", "https://digitalmarketingacademy-bot.onrender.com")
+from bot_registry import DEFAULT_BOT, load_bot_configs
+from webhook_setup import TELEGRAM_API_BASE_URL, WebhookRegistrar, webhook_url_for
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Manage the Telegram webhook")
+    parser.add_argument("command", nargs="?", default="ensure", choices=("ensure", "set", "info", "delete"))
+    parser.add_argument("--url", help="webhook URL (default: $ROOT_URL/webhook/$TELEGRAM_TOKEN)")
+    parser.add_argument("--drop-pending", action="store_true", help="drop updates Telegram has queued")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--bot", default=DEFAULT_BOT, help="bot from $BOTS_FILE (default: $TELEGRAM_TOKEN's)")
+    target.add_argument("--all", action="store_true", help="$TELEGRAM_TOKEN's bot and every bot in $BOTS_FILE")
+    return parser.parse_args()
+
+
+def bot_tokens(args) -> dict:
+    """Name -> token of the bots the command is for."""
+    tokens = {}
+    if args.all or args.bot == DEFAULT_BOT:
+        token = os.getenv("TELEGRAM_TOKEN")
+        if not token:
+            raise SystemExit("❌ TELEGRAM_TOKEN not found in environment variables!")
+        tokens[DEFAULT_BOT] = token
+    if args.all or args.bot != DEFAULT_BOT:
+        bots_file = os.getenv("BOTS_FILE")
+        configs = load_bot_configs(bots_file) if bots_file else []
+        tokens.update((c.name, c.token) for c in configs if args.all or c.name == args.bot)
+        if args.bot not in tokens and not args.all:
+            raise SystemExit(f"❌ No bot named {args.bot} in BOTS_FILE")
+    if args.url and len(tokens) > 1:
+        raise SystemExit("❌ --url needs a single bot")
+    return tokens
+
 
-if not TELEGRAM_TOKEN:
-    raise RuntimeError("❌ TELEGRAM_TOKEN not found in environment variables!")
+async def main(args, token: str, url: str):
+    registrar = WebhookRegistrar(token, api_base_url=os.getenv("TELEGRAM_API_BASE_URL") or TELEGRAM_API_BASE_URL)
+    try:
+        if args.command == "info":
+            print(json.dumps(await registrar.info(), indent=2, ensure_ascii=False))
+        elif args.command == "delete":
+            await registrar.delete(drop_pending_updates=args.drop_pending)
+            print("🗑️ Webhook deleted")
+        elif args.command == "set":
+            print(f"Setting webhook to: {url}")
+            await registrar.set(url, drop_pending_updates=args.drop_pending)
+            print("✅ Webhook set")
+        else:
+            result = await registrar.ensure(url)
+            print(f"✅ Webhook {result}: {url}")
+    finally:
+        await registrar.aclose()
 
-webhook_url = f"{ROOT_URL.rstrip('/')}/webhook/{TELEGRAM_TOKEN}"
-api_url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/setWebhook?url={webhook_url}"
 
-print(f"Setting webhook to: {webhook_url}")
-response = requests.get(api_url)
-print("Response:", response.status_code, response.text)
+if __name__ == "__main__":
+    args = parse_args()
+    root_url = os.getenv("ROOT_URL", "https://digitalmarketingacademy-bot.onrender.com")
+    for name, token in bot_tokens(args).items():
+        if args.all:
+            print(f"== {name}")
+        asyncio.run(main(args, token, args.url or webhook_url_for(root_url, token)))
@@ -0,0 +1,466 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import httpx
+
+from structured_logging import current_context, log_context
+
+log = logging.getLogger(__name__)
+
+
+class SheetOutbox:
+    """Durable outbox between the bot and the Google Sheet Web App.
+
+    Leads are appended to ``pending.jsonl`` before anything goes over the
+    network. A background sender on the runtime loop drains the file in
+    batches (one POST per batch), retries failures with exponential backoff and
+    full jitter, and moves batches that keep failing to ``dead_letter.jsonl``.
+    Its read offset and retry count live in ``state.json`` so delivery resumes
+    after a restart.
+
+    Every gunicorn worker may enqueue; only the worker holding the
+    ``.sender.lock`` flock sends, so a batch is never posted twice by two
+    workers at once.
+
+    With ``batch_size == 1`` each POST body is the lead itself (the format the
+    Apps Script has always received); larger batches are sent as
+    ``{"leads": [...]}``.
+
+    A line of ``pending.jsonl`` that is not valid JSON goes straight to the
+    dead letter file. Any other error in the sender (e.g. ``state.json``
+    cannot be written) is logged and the sender tries again after a backoff,
+    so it never stops for good.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        url: str,
+        http_client,
+        batch_size: int = 1,
+        max_attempts: int = 8,
+        backoff_base: float = 1.0,
+        backoff_cap: float = 300.0,
+        idle_interval: float = 5.0,
+        metrics=None,
+    ):
+        self.directory = directory
+        self.url = url
+        self.http_client = http_client
+        self.batch_size = max(1, batch_size)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.idle_interval = idle_interval
+
+        os.makedirs(directory, exist_ok=True)
+        self.pending_path = os.path.join(directory, "pending.jsonl")
+        self.dead_letter_path = os.path.join(directory, "dead_letter.jsonl")
+        self.state_path = os.path.join(directory, "state.json")
+        self._append_lock_fd = os.open(os.path.join(directory, ".append.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        self._sender_lock_fd = None
+        self._lock = threading.Lock()
+        self._wakeup = None
+        self._task = None
+        self._delivered_hooks = []
+        self._state = self._load_state()
+        self._counted = None  # (generation, offset, size, lines between them) of the last pending_count()
+
+        self.enqueued = 0
+        self.sent = 0
+        self.batches_ok = 0
+        self.batches_failed = 0
+        self.dead_lettered = 0
+        self.sender_errors = 0
+        self.lag_seconds = 0.0
+        self.last_post_seconds = 0.0
+        self.last_error = None
+        self._recent = deque()  # (monotonic time, items sent) for throughput
+        self._post_seconds = self._dead_letters = None
+        if metrics is not None:
+            self._post_seconds = metrics.histogram(
+                "sheet_post_seconds", "Google Sheet POST latency.", ("outcome",)
+            )
+            self._dead_letters = metrics.counter(
+                "sheet_dead_lettered_total", "Leads moved to the dead letter file."
+            )
+            metrics.gauge_callback("sheet_outbox_pending", "Leads waiting for delivery.", self.pending_count)
+            metrics.gauge_callback("sheet_outbox_lag_seconds", "Age of the last batch sent.", lambda: self.lag_seconds)
+
+    # ----- producer side -----
+    def enqueue(self, payload: dict):
+        """Durably record ``payload`` for delivery. Safe to call from any thread/worker."""
+        self.enqueue_many([payload])
+
+    def enqueue_many(self, payloads):
+        """Like :meth:`enqueue`, for several payloads in one write."""
+        now = time.time()
+        context = current_context()
+        lines = []
+        for payload in payloads:
+            entry = {"queued_at": now, "payload": payload}
+            if context:
+                entry["log"] = context  # e.g. the update_id, so delivery logs can be matched up
+            lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+        if not lines:
+            return
+        with self._pending_locked():
+            fd = os.open(self.pending_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, "".join(lines).encode("utf-8"))
+            finally:
+                os.close(fd)
+            self.enqueued += len(lines)
+        if self._wakeup is not None:
+            self._wakeup.get_loop().call_soon_threadsafe(self._wakeup.set)
+
+    def on_delivered(self, hook):
+        """Register ``hook(payloads)``, run in a thread after each batch the Sheet accepted."""
+        self._delivered_hooks.append(hook)
+        return hook
+
+    # ----- sender side -----
+    @property
+    def sender(self) -> bool:
+        """Whether this process is the one delivering."""
+        return self._sender_lock_fd is not None
+
+    async def start(self):
+        if not self.url:
+            log.warning("⚠️ GOOGLE_SHEET_WEBAPP_URL not set — leads stay in the outbox")
+            return
+        self._wakeup = _LoopEvent(asyncio.get_running_loop())
+        self._task = asyncio.create_task(self._run(), name="sheet-outbox-sender")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._sender_lock_fd is not None:
+            os.close(self._sender_lock_fd)
+            self._sender_lock_fd = None
+
+    async def _run(self):
+        failures = 0
+        while True:
+            try:
+                await self._run_once()
+            except Exception as e:
+                failures += 1
+                self.sender_errors += 1
+                self.last_error = repr(e)
+                backoff = min(self.backoff_cap, self.backoff_base * 2 ** min(failures, 16))
+                log.exception("❌ Sheet outbox sender failed; retrying in %.1fs", backoff)
+                await asyncio.sleep(backoff)
+            else:
+                failures = 0
+
+    async def _run_once(self):
+        if not self._is_sender():
+            await self._wakeup.wait(self.idle_interval)
+            return
+        delay = self._state.get("next_attempt_at", 0) - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        lines, consumed = await asyncio.to_thread(self._read_batch)
+        if not lines:
+            await asyncio.to_thread(self._truncate_if_drained)
+            await self._wakeup.wait(self.idle_interval)
+            return
+        await self._deliver(lines, consumed)
+
+    def _is_sender(self) -> bool:
+        if self._sender_lock_fd is not None:
+            return True
+        fd = os.open(os.path.join(self.directory, ".sender.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        self._sender_lock_fd = fd
+        self._state = self._load_state()  # the previous sender may have advanced it
+        return True
+
+    async def _deliver(self, lines, consumed: int):
+        entries, good, corrupt = [], [], []
+        for line in lines:
+            entry = _parse_entry(line)
+            if entry is None:
+                corrupt.append(line)
+            else:
+                entries.append(entry)
+                good.append(line)
+        if corrupt:
+            await asyncio.to_thread(self._dead_letter, corrupt, "unparseable")
+            self.dead_lettered += len(corrupt)
+            if self._dead_letters is not None:
+                self._dead_letters.inc(amount=len(corrupt))
+            log.error("❌ %d unparseable line(s) of pending.jsonl moved to dead letter", len(corrupt))
+        if not entries:
+            await asyncio.to_thread(self._advance, consumed, 0)
+            return
+        with log_context(**_batch_context(entries)):
+            await self._deliver_entries(entries, good, consumed)
+
+    async def _deliver_entries(self, entries, lines, consumed: int):
+        payloads = [e["payload"] for e in entries]
+        self.lag_seconds = max(0.0, time.time() - entries[0]["queued_at"])
+        body = payloads[0] if self.batch_size == 1 else {"leads": payloads}
+
+        started = time.perf_counter()
+        ok, error = await self._post(body)
+        self.last_post_seconds = time.perf_counter() - started
+        if self._post_seconds is not None:
+            self._post_seconds.observe(self.last_post_seconds, _outcome(error))
+
+        if ok:
+            self.batches_ok += 1
+            self.sent += len(payloads)
+            self._recent.append((time.monotonic(), len(payloads)))
+            self._advance(consumed, attempts=0)
+            log.info("📤 %d lead(s) sent to Google Sheet.", len(payloads), extra={"event": "sheet_sent"})
+            for hook in self._delivered_hooks:
+                try:
+                    await asyncio.to_thread(hook, payloads)
+                except Exception:
+                    log.exception("❌ Sheet delivery hook failed")
+            return
+
+        self.batches_failed += 1
+        self.last_error = error
+        attempts = self._state.get("attempts", 0) + 1
+        if attempts >= self.max_attempts:
+            await asyncio.to_thread(self._dead_letter, lines, error)
+            self.dead_lettered += len(lines)
+            if self._dead_letters is not None:
+                self._dead_letters.inc(amount=len(lines))
+            self._advance(consumed, attempts=0)
+            log.error("❌ %d lead(s) moved to dead letter after %d attempts: %s", len(lines), attempts, error)
+            return
+        backoff = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempts))
+        self._state["attempts"] = attempts
+        self._state["next_attempt_at"] = time.time() + backoff
+        self._save_state()
+        log.warning("⚠️ Sheet delivery failed (%s); retry %d in %.1fs", error, attempts, backoff)
+
+    async def _post(self, body):
+        try:
+            r = await self.http_client.post(self.url, json=body)
+        except httpx.TimeoutException:
+            return False, "timeout"
+        except Exception as e:
+            return False, repr(e)
+        if 200 <= r.status_code < 300:
+            return True, None
+        return False, f"HTTP {r.status_code}"
+
+    # ----- file handling -----
+    @contextmanager
+    def _pending_locked(self):
+        """Hold pending.jsonl against appends and truncation, from other threads and workers.
+
+        The flock alone is not enough: all threads of a process share
+        ``_append_lock_fd``, and a flock on a shared fd neither excludes them
+        nor survives one of them unlocking it.
+        """
+        with self._lock:
+            fcntl.flock(self._append_lock_fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._append_lock_fd, fcntl.LOCK_UN)
+
+    def _read_batch(self):
+        offset = self._state.get("offset", 0)
+        lines, consumed = [], 0
+        try:
+            with open(self.pending_path, "rb") as f:
+                f.seek(offset)
+                while len(lines) < self.batch_size:
+                    raw = f.readline()
+                    if not raw.endswith(b"\n"):
+                        break  # nothing more, or a line still being written
+                    consumed += len(raw)
+                    if raw.strip():
+                        lines.append(raw.decode("utf-8"))
+        except FileNotFoundError:
+            pass
+        return lines, consumed
+
+    def _truncate_if_drained(self):
+        """Reset pending.jsonl once everything in it has been delivered."""
+        offset = self._state.get("offset", 0)
+        if not offset:
+            return
+        with self._pending_locked():
+            if os.path.getsize(self.pending_path) == offset:
+                os.truncate(self.pending_path, 0)
+                self._state["offset"] = 0
+                self._state["generation"] = self._state.get("generation", 0) + 1  # tells pending_count()
+                self._save_state()
+
+    def _dead_letter(self, lines, error):
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            for line in lines:
+                entry = _parse_entry(line) or {"line": line.rstrip("\n")}
+                entry["error"] = error
+                entry["failed_at"] = time.time()
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def _advance(self, consumed: int, attempts: int):
+        self._state["offset"] = self._state.get("offset", 0) + consumed
+        self._state["attempts"] = attempts
+        self._state["next_attempt_at"] = 0
+        self._save_state()
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {"offset": 0, "attempts": 0, "next_attempt_at": 0}
+
+    def _save_state(self):
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+
+    def _read_pending(self) -> list:
+        """Undelivered lines of pending.jsonl, as of the sender's last saved offset.
+
+        Only the sender advances the offset, so other workers read it from
+        state.json; both reads happen under the append lock so a truncation
+        cannot slip in between them.
+        """
+        with self._pending_locked():
+            offset = (self._state if self.sender else self._load_state()).get("offset", 0)
+            try:
+                with open(self.pending_path, "rb") as f:
+                    f.seek(offset)
+                    return [raw for raw in f if raw.endswith(b"\n") and raw.strip()]
+            except FileNotFoundError:
+                return []
+
+    def pending_payloads(self) -> list:
+        """Payloads enqueued and not delivered yet (or waiting for a retry)."""
+        entries = (_parse_entry(raw.decode("utf-8")) for raw in self._read_pending())
+        return [entry["payload"] for entry in entries if entry is not None]
+
+    # ----- metrics -----
+    def pending_count(self) -> int:
+        """Lines after the sender's offset.
+
+        Called on every ``/healthz`` and scrape, so it does not read the whole
+        backlog: it starts from the last count and only reads the bytes
+        appended and consumed since. Blank lines count, though the sender
+        skips them.
+        """
+        with self._pending_locked():
+            state = self._state if self.sender else self._load_state()
+            generation, offset = state.get("generation", 0), state.get("offset", 0)
+            try:
+                size = os.path.getsize(self.pending_path)
+            except FileNotFoundError:
+                size = 0
+            last = self._counted
+            if last is None or last[0] != generation or offset < last[1] or size < last[2]:
+                count = self._count_lines(offset, size)
+            else:
+                count = last[3] + self._count_lines(last[2], size) - self._count_lines(last[1], offset)
+            self._counted = (generation, offset, size, count)
+        return count
+
+    def _count_lines(self, start: int, end: int) -> int:
+        """Newlines in pending.jsonl between byte ``start`` and ``end`` (append lock held)."""
+        if end <= start:
+            return 0
+        count = 0
+        with open(self.pending_path, "rb") as f:
+            f.seek(start)
+            left = end - start
+            while left > 0:
+                chunk = f.read(min(left, 1 << 20))
+                if not chunk:
+                    break
+                count += chunk.count(b"\n")
+                left -= len(chunk)
+        return count
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        while self._recent and now - self._recent[0][0] > 60:
+            self._recent.popleft()
+        return {
+            "sender": self.sender,
+            "batch_size": self.batch_size,
+            "enqueued": self.enqueued,
+            "sent": self.sent,
+            "batches_ok": self.batches_ok,
+            "batches_failed": self.batches_failed,
+            "dead_lettered": self.dead_lettered,
+            "sender_errors": self.sender_errors,
+            "pending": self.pending_count(),
+            "attempts": self._state.get("attempts", 0),
+            "lag_seconds": round(self.lag_seconds, 3),
+            "last_post_ms": round(self.last_post_seconds * 1000, 3),
+            "throughput_per_min": sum(n for _, n in self._recent),
+            "last_error": self.last_error,
+        }
+
+
+def _parse_entry(line: str):
+    try:
+        entry = json.loads(line)
+    except ValueError:
+        return None
+    return entry if isinstance(entry, dict) and "payload" in entry else None
+
+
+def _batch_context(entries) -> dict:
+    """Log context of a batch: the entry's own for one lead, the list of update ids for several."""
+    contexts = [e.get("log") or {} for e in entries]
+    if len(contexts) == 1:
+        return contexts[0]
+    return {"update_ids": [c["update_id"] for c in contexts if "update_id" in c]}
+
+
+def _outcome(error) -> str:
+    if error is None:
+        return "ok"
+    if error == "timeout" or error.startswith("HTTP "):
+        return error.replace(" ", "_").lower()
+    return "error"
+
+
+class _LoopEvent:
+    """asyncio.Event bound to one loop, with a timed wait."""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._event = asyncio.Event()
+
+    def get_loop(self):
+        return self._loop
+
+    def set(self):
+        self._event.set()
+
+    async def wait(self, timeout: float):
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._event.clear()
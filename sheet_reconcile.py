@@ -0,0 +1,211 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from structured_logging import log_context
+
+log = logging.getLogger(__name__)
+
+
+def content_hash(lead: dict) -> str:
+    """Hash of what the Sheet receives for ``lead``; ``seq`` is bookkeeping and left out."""
+    body = {k: v for k, v in lead.items() if k != "seq"}
+    raw = json.dumps(body, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+class SheetReconciler:
+    """Re-sends leads that are in the lead store but never reached the Google Sheet.
+
+    A lead can miss the Sheet if the process dies between storing it and
+    enqueueing it, if its batch ends up in the dead letter file, or if it is
+    changed later (e.g. a broadcast marks the user as blocked). The outbox
+    reports every batch the Sheet accepted, and the reconciler keeps the
+    content hash of each delivered lead, plus a high-water mark: the ``seq``
+    up to which every lead is known to be delivered.
+
+    A run reads only the leads after the high-water mark (the lead store
+    seeks to it). Leads whose newest version hashes to what was delivered are
+    done. Leads already waiting in the outbox are left alone. The rest, up to
+    ``max_per_run``, are enqueued again. The mark then moves up to just below
+    the first lead not delivered yet, and hashes below it are dropped, so a
+    run costs in proportion to the leads since the last one, not to all leads.
+
+    Runs at startup and every ``interval`` seconds, in the process that sends
+    for the outbox. Leads younger than ``settle`` seconds are left to the
+    normal enqueue path.
+    """
+
+    def __init__(
+        self,
+        lead_store,
+        outbox,
+        path: str,
+        interval: float = 900.0,
+        max_per_run: int = 500,
+        settle: float = 10.0,
+        metrics=None,
+    ):
+        self.lead_store = lead_store
+        self.outbox = outbox
+        self.path = path
+        self.interval = interval
+        self.max_per_run = max_per_run
+        self.settle = settle
+        self._lock = threading.Lock()
+        self._state = None  # {"high_water": seq, "delivered": {lead_id: [seq, hash]}}, loaded when sending
+        self._task = None
+        self.runs = 0
+        self.resent = 0
+        self.last_scanned = 0
+        self.last_run_seconds = 0.0
+        self.last_error = None
+        self._resent_total = None
+        if metrics is not None:
+            self._resent_total = metrics.counter(
+                "sheet_reconciled_total", "Leads re-sent to the Google Sheet by reconciliation."
+            )
+        outbox.on_delivered(self.record_delivered)
+
+    async def start(self):
+        if not self.interval:
+            return
+        self._task = asyncio.create_task(self._run(), name="sheet-reconciler")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        delay = self.outbox.idle_interval  # let the outbox take its sender lock first
+        while True:
+            await asyncio.sleep(delay)
+            delay = self.interval
+            if not self.outbox.sender:
+                self._state = None  # another process sends; reload if we take over
+                continue
+            try:
+                await asyncio.to_thread(self.lead_store.refresh)
+                horizon = self.lead_store.last_seq
+                await asyncio.sleep(self.settle)
+                result = await asyncio.to_thread(self.reconcile, horizon)
+            except Exception as e:
+                self.last_error = repr(e)
+                log.warning("⚠️ Sheet reconciliation failed: %s", e)
+                continue
+            if result["more"]:
+                delay = min(self.interval, self.outbox.idle_interval * 2)
+
+    # ----- delivery reports -----
+    def record_delivered(self, payloads):
+        """Outbox hook: remember what the Sheet now holds for these leads."""
+        with self._lock:
+            if self._state is None:
+                self._state = self._load()
+            delivered = self._state["delivered"]
+            high_water = self._state["high_water"]
+            for payload in payloads:
+                seq = payload.get("seq")
+                if "lead_id" in payload and seq is not None and seq > high_water:
+                    delivered[payload["lead_id"]] = [seq, content_hash(payload)]
+            self._save()
+
+    # ----- reconciliation -----
+    def reconcile(self, horizon: int = None) -> dict:
+        """One run over the leads after the high-water mark, up to ``horizon``."""
+        started = time.perf_counter()
+        with self._lock:
+            if self._state is None:
+                self._state = self._load()
+            high_water = self._state["high_water"]
+        horizon = self.lead_store.last_seq if horizon is None else horizon
+        waiting = {
+            p["lead_id"]: content_hash(p) for p in self.outbox.pending_payloads() if "lead_id" in p
+        }
+        first_open = None
+        scanned = 0
+        resend = []
+        more = False
+        for record in self.lead_store.iter_records(after_seq=high_water):
+            if record["seq"] > horizon:
+                break
+            scanned += 1
+            digest = content_hash(record)
+            with self._lock:
+                done = self._state["delivered"].get(record["lead_id"], (0, None))[1] == digest
+            if done:
+                continue
+            if first_open is None:
+                first_open = record["seq"]
+            if waiting.get(record["lead_id"]) == digest:
+                continue
+            if len(resend) >= self.max_per_run:
+                more = True
+                break
+            resend.append(record)
+
+        if resend:
+            with log_context(event="sheet_reconcile"):
+                self.outbox.enqueue_many(resend)
+            self.resent += len(resend)
+            if self._resent_total is not None:
+                self._resent_total.inc(amount=len(resend))
+            log.info("🔁 %d lead(s) missing from the Google Sheet re-sent.", len(resend))
+
+        with self._lock:
+            new_mark = first_open - 1 if first_open is not None else max(high_water, horizon)
+            self._state["high_water"] = max(self._state["high_water"], new_mark)
+            mark = self._state["high_water"]
+            delivered = self._state["delivered"]
+            for lead_id in [k for k, (seq, _) in delivered.items() if seq <= mark]:
+                del delivered[lead_id]
+            self._save()
+        self.runs += 1
+        self.last_scanned = scanned
+        self.last_run_seconds = time.perf_counter() - started
+        self.last_error = None
+        return {"scanned": scanned, "resent": len(resend), "high_water": mark, "more": more}
+
+    # ----- state file -----
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            return {"high_water": state["high_water"], "delivered": state.get("delivered", {})}
+        except (FileNotFoundError, ValueError, KeyError):
+            pass
+        # First run: leads stored before reconciliation existed are taken as
+        # delivered, except those still waiting in the outbox.
+        self.lead_store.refresh()
+        waiting = [p["seq"] for p in self.outbox.pending_payloads() if p.get("seq") is not None]
+        high_water = min(waiting) - 1 if waiting else self.lead_store.last_seq
+        return {"high_water": high_water, "delivered": {}}
+
+    def _save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._state, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            state = self._state
+            high_water = state["high_water"] if state else None
+            tracked = len(state["delivered"]) if state else 0
+        return {
+            "high_water": high_water,
+            "tracked": tracked,
+            "runs": self.runs,
+            "resent": self.resent,
+            "last_scanned": self.last_scanned,
+            "last_run_ms": round(self.last_run_seconds * 1000, 3),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,375 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from ptb_compat import conversation_key, set_conversation_state
+
+log = logging.getLogger(__name__)
+
+_MISSING = object()
+_ON_DISK = object()  # _from_memory(): only the database can tell
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    kind    TEXT NOT NULL,
+    key     TEXT NOT NULL,
+    value   TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS state_version (
+    id      INTEGER PRIMARY KEY CHECK (id = 0),
+    version INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO state_version (id, version) VALUES (0, 0);
+"""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=_plain)
+
+
+def _plain(value):
+    if isinstance(value, Mapping):  # e.g. user_state.UserState
+        return dict(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class SQLitePersistence(BasePersistence):
+    """``BasePersistence`` backed by one SQLite file in WAL mode.
+
+    All gunicorn workers open the same database, so a conversation started on
+    one worker can continue on another, and state survives a restart.
+
+    Writes are write-behind: ``update_*`` calls only stage the new value, and a
+    background task commits everything staged so far in one transaction off the
+    event loop. A value equal to the one last read or written is not staged, so
+    PTB handing back every touched ``user_data`` costs nothing when it did not
+    change.
+
+    Per-user, per-chat and conversation rows are not loaded at startup but read
+    on first use through the ``refresh_*`` hooks. After that they are served
+    from memory: every commit stamps the rows it writes with a new database-wide
+    version, and a refresh only compares the row's stored version with the one
+    in memory, reading the value again only if that row was written by
+    another process since. Before that comparison, ``PRAGMA data_version``
+    tells whether anything was committed at all since the row was last
+    checked; if not, no row is read. ``forget_*`` marks a row as gone from
+    memory, so it is read again on next use.
+
+    Commits use their own connection, and neither a commit waiting for
+    another worker's write lock nor a refresh that has to query the database
+    runs on the event loop. A refresh of a row with a write staged or being
+    committed is answered from memory without leaving the loop.
+
+    Conversation states live inside ``ConversationHandler``, which has no
+    refresh hook of its own; call :meth:`refresh_conversation` before the
+    handler sees an update (it goes through ``ptb_compat``).
+
+    Several bots can share one database: each gets its own instance with a
+    ``namespace``, which prefixes the ``kind`` of every row it reads and writes.
+    """
+
+    def __init__(
+        self,
+        path: str = "state.db",
+        store_data: PersistenceInput = None,
+        update_interval: float = 60,
+        busy_timeout: float = 5.0,
+        namespace: str = "",
+    ):
+        super().__init__(store_data=store_data, update_interval=update_interval)
+        self.path = path
+        self.namespace = namespace
+        self._prefix = f"{namespace}/" if namespace else ""
+        self._lock = threading.Lock()  # the dicts below; never held across a query
+        self._read_lock = threading.Lock()  # _conn
+        self._write_lock = threading.Lock()  # _write_conn, one commit at a time
+        self._conn = self._connect(busy_timeout)
+        self._write_conn = self._connect(busy_timeout)
+        self._write_conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self._write_conn.executescript(_SCHEMA)
+        self._versions = {}  # (kind, key) -> row version the in-memory value matches (None: no row)
+        self._stored = {}  # (kind, key) -> JSON last read or written (None: no row)
+        self._checked = {}  # (kind, key) -> _conn's data_version when its version was last compared
+        self._pending = {}  # (kind, key) -> JSON staged for the next commit (None = delete)
+        self._committing = {}  # the batch _commit_pending() is writing, same shape as _pending
+        self._flush_task = None
+
+        self.cache_hits = 0
+        self.disk_reads = 0
+        self.commits = 0
+        self.rows_written = 0
+        self.last_commit_seconds = 0.0
+
+    def _connect(self, busy_timeout: float):
+        conn = sqlite3.connect(self.path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def close(self):
+        self._conn.close()
+        self._write_conn.close()
+
+    def _migrate(self):
+        # Databases from before per-row versions: their rows count as version 0
+        columns = [row[1] for row in self._write_conn.execute("PRAGMA table_info(state)")]
+        if columns and "version" not in columns:
+            try:
+                self._write_conn.execute("ALTER TABLE state ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError as e:
+                if "duplicate column" not in str(e):  # else another worker migrated it first
+                    raise
+
+    # ----- loading -----
+    def _load_kind(self, kind: str) -> dict:
+        kind = self._prefix + kind
+        with self._read_lock:
+            rows = self._conn.execute("SELECT key, value, version FROM state WHERE kind = ?", (kind,)).fetchall()
+        with self._lock:
+            for key, value, version in rows:
+                self._versions[(kind, key)] = version
+                self._stored[(kind, key)] = value
+            staged = {k: v for (pk, k), v in {**self._committing, **self._pending}.items() if pk == kind}
+        data = {key: json.loads(value) for key, value, _ in rows}
+        for key, value in staged.items():
+            if value is None:
+                data.pop(key, None)
+            else:
+                data[key] = json.loads(value)
+        return data
+
+    async def get_user_data(self) -> dict:
+        return {}  # read per user by refresh_user_data
+
+    async def get_chat_data(self) -> dict:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return self._load_kind("bot").get("", {})
+
+    async def get_callback_data(self):
+        data = self._load_kind("callback").get("")
+        return (data[0], data[1]) if data else None
+
+    async def get_conversations(self, name: str) -> dict:
+        return {}  # read per conversation by refresh_conversation
+
+    # ----- staging writes -----
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        self._stage("user", str(user_id), data)
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        self._stage("chat", str(chat_id), data)
+
+    async def update_bot_data(self, data: dict) -> None:
+        self._stage("bot", "", data)
+
+    async def update_callback_data(self, data) -> None:
+        self._stage("callback", "", list(data))
+
+    async def update_conversation(self, name: str, key, new_state) -> None:
+        self._stage("conv:" + name, _dumps(list(key)), new_state)
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stage("user", str(user_id), None)
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        self._stage("chat", str(chat_id), None)
+
+    def _stage(self, kind: str, key: str, value):
+        cache_key = (self._prefix + kind, key)
+        text = None if value is None else _dumps(value)
+        with self._lock:
+            unstaged = cache_key not in self._pending and cache_key not in self._committing
+            if unstaged and self._stored.get(cache_key, _MISSING) == text:
+                return  # unchanged since it was read or written
+            self._pending[cache_key] = text
+            self._versions.setdefault(cache_key, None)  # memory holds it; the commit sets the version
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_running_loop().create_task(
+                self._drain(), name="sqlite-persistence-writer"
+            )
+
+    async def _drain(self):
+        # Everything staged while a commit is running goes into the next one.
+        try:
+            while self._pending:
+                try:
+                    ok = await asyncio.to_thread(self._commit_pending)
+                except RuntimeError:
+                    ok = self._commit_pending()  # executor already shut down at exit
+                if not ok:
+                    break
+        finally:
+            self._flush_task = None
+
+    def _commit_pending(self) -> bool:
+        # self._lock is only held to take the batch and to record the result, so
+        # refreshes and staging go on while BEGIN IMMEDIATE waits for another
+        # worker's write lock (up to busy_timeout).
+        with self._write_lock:
+            with self._lock:
+                if not self._pending:
+                    return True
+                batch, self._pending = self._pending, {}
+                self._committing = batch
+            started = time.perf_counter()
+            upserts = [(k[0], k[1], v) for k, v in batch.items() if v is not None]
+            deletes = [k for k, v in batch.items() if v is None]
+            conn = self._write_conn
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                (version,) = conn.execute(
+                    "UPDATE state_version SET version = version + 1 WHERE id = 0 RETURNING version"
+                ).fetchone()
+                conn.executemany(
+                    "INSERT INTO state (kind, key, value, version) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (kind, key) DO UPDATE SET value = excluded.value, version = excluded.version",
+                    [row + (version,) for row in upserts],
+                )
+                conn.executemany("DELETE FROM state WHERE kind = ? AND key = ?", deletes)
+                conn.execute("COMMIT")
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                with self._lock:
+                    for k, v in batch.items():
+                        self._pending.setdefault(k, v)  # keep anything staged since
+                    self._committing = {}
+                log.warning("⚠️ Persistence commit failed, will retry: %s", e)
+                return False
+            with self._lock:
+                for k, v in batch.items():
+                    self._versions[k] = version if v is not None else None
+                    self._stored[k] = v
+                self._committing = {}
+                self.commits += 1
+                self.rows_written += len(batch)
+                self.last_commit_seconds = time.perf_counter() - started
+            return True
+
+    async def flush(self) -> None:
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+        self._commit_pending()  # shutdown: commit the rest inline
+
+    # ----- refreshing from other workers -----
+    def _from_memory(self, cache_key):
+        """The staged value of ``cache_key`` as _read_if_stale returns it, or _ON_DISK (lock held)."""
+        if cache_key in self._pending:
+            staged = self._pending[cache_key]
+        elif cache_key in self._committing:
+            staged = self._committing[cache_key]
+        else:
+            return _ON_DISK
+        self.cache_hits += 1
+        if cache_key in self._versions:
+            return _MISSING  # staged from memory, so memory is newer than the disk
+        self._versions[cache_key] = None  # forgotten from memory before its commit
+        return None if staged is None else json.loads(staged)
+
+    async def _refresh(self, kind: str, key: str):
+        """:meth:`_read_if_stale`, off the loop unless memory can answer."""
+        with self._lock:
+            value = self._from_memory((self._prefix + kind, key))
+        if value is not _ON_DISK:
+            return value
+        return await asyncio.to_thread(self._read_if_stale, kind, key)
+
+    def _read_if_stale(self, kind: str, key: str):
+        """Return the stored value (None if absent), or _MISSING if the cached one is current."""
+        cache_key = (self._prefix + kind, key)
+        with self._read_lock:
+            # Changes only when another connection commits, ours included
+            (data_version,) = self._conn.execute("PRAGMA data_version").fetchone()
+            with self._lock:
+                value = self._from_memory(cache_key)
+                if value is not _ON_DISK:
+                    return value
+                known = self._versions.get(cache_key, _MISSING)
+                if known is not _MISSING and self._checked.get(cache_key) == data_version:
+                    self.cache_hits += 1
+                    return _MISSING
+            # The value is only sent back when the row's version is not the one we hold
+            row = self._conn.execute(
+                "SELECT version, CASE WHEN version IS ? THEN NULL ELSE value END FROM state "
+                "WHERE kind = ? AND key = ?",
+                (None if known is _MISSING else known, *cache_key),
+            ).fetchone()
+        version = row[0] if row else None
+        with self._lock:
+            value = self._from_memory(cache_key)  # staged while we queried
+            if value is not _ON_DISK or self._versions.get(cache_key, _MISSING) != known:
+                return _MISSING if value is _ON_DISK else value
+            self._checked[cache_key] = data_version
+            if known is not _MISSING and version == known:
+                self.cache_hits += 1
+                return _MISSING
+            self._versions[cache_key] = version
+            self._stored[cache_key] = row[1] if row else None
+            self.disk_reads += 1
+        return json.loads(row[1]) if row else None
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        self._replace(user_data, await self._refresh("user", str(user_id)))
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        self._replace(chat_data, await self._refresh("chat", str(chat_id)))
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        self._replace(bot_data, await self._refresh("bot", ""))
+
+    @staticmethod
+    def _replace(target: dict, value):
+        if value is _MISSING or value is None:
+            return
+        target.clear()
+        target.update(value)
+
+    def _forget(self, kind: str, key: str):
+        kind = self._prefix + kind
+        with self._lock:
+            self._versions.pop((kind, key), None)
+            self._stored.pop((kind, key), None)
+            self._checked.pop((kind, key), None)
+
+    def forget_user(self, user_id: int):
+        self._forget("user", str(user_id))
+
+    def forget_chat(self, chat_id: int):
+        self._forget("chat", str(chat_id))
+
+    def forget_conversation(self, name: str, key: tuple):
+        self._forget("conv:" + name, _dumps(list(key)))
+
+    async def refresh_conversation(self, handler, update) -> None:
+        """Pull the stored state of ``update``'s conversation in ``handler`` if it changed on disk."""
+        key = conversation_key(handler, update)
+        if key is None:
+            return
+        state = await self._refresh("conv:" + handler.name, _dumps(list(key)))
+        if state is not _MISSING:
+            set_conversation_state(handler, key, state)
+
+    # ----- metrics -----
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending) + len(self._committing)
+        return {
+            "path": self.path,
+            "namespace": self.namespace,
+            "pending": pending,
+            "commits": self.commits,
+            "rows_written": self.rows_written,
+            "cache_hits": self.cache_hits,
+            "disk_reads": self.disk_reads,
+            "last_commit_ms": round(self.last_commit_seconds * 1000, 3),
+        }
@@ -0,0 +1,183 @@
+import atexit
+import contextvars
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_context = contextvars.ContextVar("log_context", default=None)
+# Attributes every LogRecord has; anything else on a record is a user field
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+# ----- correlation -----
+@contextmanager
+def log_context(**fields):
+    """Attach ``fields`` (e.g. update_id) to every record logged inside the block."""
+    current = _context.get()
+    token = _context.set({**current, **fields} if current else fields)
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def current_context() -> dict:
+    return dict(_context.get() or {})
+
+
+async def run_in_context(coro, **fields):
+    """Await ``coro`` with ``fields`` bound, e.g. on a loop the caller's context does not reach."""
+    with log_context(**fields):
+        return await coro
+
+
+class ContextFilter(logging.Filter):
+    """Copies the bound context onto the record while still in the caller's thread/task."""
+
+    def filter(self, record):
+        fields = _context.get()
+        if fields:
+            for key, value in fields.items():
+                if key not in record.__dict__:
+                    setattr(record, key, value)
+        return True
+
+
+# ----- sampling -----
+def parse_sample_rates(spec: str) -> dict:
+    """``"raw_update=100,sheet_post=10"`` -> keep 1 in 100 / 1 in 10 of those events."""
+    rates = {}
+    for part in (spec or "").split(","):
+        if "=" in part:
+            event, every = part.split("=", 1)
+            rates[event.strip()] = max(1, int(every))
+    return rates
+
+
+class EventSampler(logging.Filter):
+    """Keeps 1 in N records per ``extra={"event": ...}``; records without an event pass."""
+
+    def __init__(self, every: dict):
+        super().__init__()
+        self.every = dict(every)
+        self._counters = {event: itertools.count() for event in self.every}
+
+    def keep(self, event: str) -> bool:
+        n = self.every.get(event)
+        return not n or n == 1 or next(self._counters[event]) % n == 0
+
+    def filter(self, record):
+        event = getattr(record, "event", None)
+        return event is None or self.keep(event)
+
+
+# ----- queue and writer -----
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records when the queue is full instead of blocking."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Interpolate here, while the args are still valid; JSON encoding
+        # happens on the writer thread.
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _Listener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # The queue may be full at shutdown; wait a little for room rather than raise
+        try:
+            self.queue.put(self._sentinel, timeout=5)
+        except queue.Full:
+            pass
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, msg, bound context and extras."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str, separators=(",", ":"))
+
+
+class LogPipeline:
+    """Root logging through a bounded queue drained by one writer thread.
+
+    Logging calls only format the message and enqueue the record, so a slow
+    stdout/stderr can never hold up a request; when the queue is full records
+    are dropped and counted.
+    """
+
+    def __init__(self, level="INFO", queue_size: int = 10000, sample: str = "", fmt: str = "json", stream=None):
+        self.level = level
+        self.queue = queue.Queue(queue_size)
+        self.handler = BoundedQueueHandler(self.queue)
+        self.sampler = EventSampler(parse_sample_rates(sample))
+        self.handler.addFilter(self.sampler)
+        self.handler.addFilter(ContextFilter())
+        output = logging.StreamHandler(stream or sys.stderr)
+        if fmt == "json":
+            output.setFormatter(JsonFormatter())
+        else:
+            output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        self.listener = _Listener(self.queue, output)
+        self.started = False
+
+    def install(self) -> "LogPipeline":
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, BoundedQueueHandler):
+                root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.listener.start()
+        self.started = True
+        atexit.register(self.stop)
+        return self
+
+    def stop(self):
+        """Write out what is queued and stop the writer thread."""
+        if self.started:
+            self.started = False
+            self.listener.stop()
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "capacity": self.queue.maxsize, "dropped": self.handler.dropped}
+
+
+# Libraries that log every HTTP request at INFO/DEBUG
+QUIET_LOGGERS = ("httpx", "httpcore", "telegram", "urllib3")
+
+
+def setup_logging(level="INFO", queue_size: int = 10000, sample: str = "", fmt: str = "json") -> LogPipeline:
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+    return LogPipeline(level, queue_size, sample, fmt).install()
@@ -0,0 +1,111 @@
+import os
+import threading
+import time
+
+import pytest
+
+import analytics as analytics_module
+from analytics import SNAPSHOT_PREFIX, FunnelAnalytics, HyperLogLog, _user_hash, _write_json
+
+
+def hll(user_ids):
+    counter = HyperLogLog()
+    for user_id in user_ids:
+        counter.add_hash(_user_hash(user_id))
+    return counter
+
+
+@pytest.mark.parametrize("n", [1, 10, 100, 1000, 10_000, 100_000])
+def test_estimate_error(n):
+    estimate = hll(range(n)).count()
+    assert abs(estimate - n) <= max(1, 0.1 * n)  # about 3% standard error at 1 KiB
+
+
+def test_repeats_do_not_count():
+    assert hll([5] * 1000).count() == 1
+    assert hll(list(range(500)) * 3).count() == hll(range(500)).count()
+
+
+def test_merge_is_the_union():
+    a, b = hll(range(0, 6000)), hll(range(4000, 10_000))  # 2000 users in both
+    union = hll(range(10_000))
+    a.merge(b)
+    assert a.registers == union.registers
+    assert a.count() == union.count()
+    assert abs(a.count() - 10_000) <= 1000
+
+
+def test_merge_with_empty_and_itself():
+    a = hll(range(300))
+    before = a.count()
+    a.merge(HyperLogLog())
+    a.merge(HyperLogLog(a.registers))
+    assert a.count() == before
+
+
+def test_dumps_loads():
+    a = hll(range(2000))
+    b = HyperLogLog.loads(a.dumps())
+    assert b.registers == a.registers and b.count() == a.count()
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    opened = []
+
+    def make(**kwargs):
+        funnel = FunnelAnalytics(str(tmp_path), steps=("start", "lesson"), **kwargs)
+        opened.append(funnel)
+        return funnel
+
+    yield make
+    for funnel in opened:
+        if funnel._liveness_fd is not None:
+            os.close(funnel._liveness_fd)
+
+
+def test_workers_are_merged(analytics):
+    a, b = analytics(), analytics()
+    for user in range(100):
+        a.record("start", user, now=0)
+    for user in range(50, 150):
+        b.record("start", user, now=0)
+    b.record("lesson", 1, now=0)
+    b.snapshot()
+
+    total = a.stats(now=0)["total"]
+    assert total["events"] == {"start": 200, "lesson": 1}
+    assert abs(total["users"]["start"] - 150) <= 15
+    assert a.stats(now=0)["workers"] == 2
+
+
+def test_concurrent_stats_share_the_snapshot_cache(analytics, tmp_path, monkeypatch):
+    funnel = analytics()
+    peer = tmp_path / f"{SNAPSHOT_PREFIX}peer.json"
+    _write_json(str(peer), {"hours": {}, "days": {}, "total": {"events": {"start": 3}, "users": {}}})
+    reads = []
+    reading = threading.Event()
+    release = threading.Event()
+
+    def slow_read(path):
+        reads.append(path)
+        reading.set()
+        release.wait(5)
+        return read_json(path)
+
+    read_json = analytics_module._read_json
+    monkeypatch.setattr(analytics_module, "_read_json", slow_read)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(funnel.stats(now=0))) for _ in range(2)]
+    threads[0].start()
+    assert reading.wait(5)
+    threads[1].start()  # waits for the first parse instead of starting its own
+    for _ in range(20):
+        if len(reads) > 1:
+            break
+        time.sleep(0.01)
+    release.set()
+    for t in threads:
+        t.join()
+    assert reads == [str(peer)]
+    assert [r["total"]["events"]["start"] for r in results] == [3, 3]
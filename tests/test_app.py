@@ -0,0 +1,116 @@
+"""app.py end to end: the Flask app against a local fake Bot API."""
+import importlib
+import os
+import sys
+
+import pytest
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:TEST"
+FLOOD_BURST = 5
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    workdir = tmp_path_factory.mktemp("app")
+    api = FakeBotAPI().start()
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(workdir)
+        for name, value in {
+            "TELEGRAM_TOKEN": TOKEN,
+            "TELEGRAM_API_BASE_URL": api.root_url,
+            "ROOT_URL": "https://test.invalid",
+            "CONTENT_FILE": os.path.join(ROOT, "content.json"),
+            "ADMIN_TOKEN": "secret",
+            "FLOOD_RATE": "0.001",
+            "FLOOD_BURST": str(FLOOD_BURST),
+            "FLOOD_CHAT_RATE": "0",
+            "LOG_LEVEL": "WARNING",
+        }.items():
+            mp.setenv(name, value)
+        sys.modules.pop("app", None)
+        module = importlib.import_module("app")
+        module.fake_api = api
+        yield module
+        module.runtime.stop()
+    api.stop()
+
+
+def sticker(update_id, user_id):
+    chat = {"id": user_id, "type": "private"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": 0, "chat": chat,
+            "from": {"id": user_id, "is_bot": False, "first_name": "u"},
+            "sticker": {
+                "file_id": "s", "file_unique_id": "s", "type": "regular",
+                "width": 1, "height": 1, "is_animated": False, "is_video": False,
+            },
+        },
+    }
+
+
+def test_flood_of_ignored_updates_is_limited(app):
+    client = app.flask_app.test_client()
+    dropped = app.flood_guard.stats()["dropped"]["user"]
+    responses = [client.post(f"/webhook/{TOKEN}", json=sticker(100 + i, 501)) for i in range(FLOOD_BURST + 3)]
+
+    assert all(r.status_code == 200 for r in responses)
+    assert app.flood_guard.stats()["dropped"]["user"] - dropped == 3
+    # The first drop carries the slow-down warning
+    assert responses[FLOOD_BURST].get_json()["method"] == "sendMessage"
+
+
+def test_profile_toggle_is_published(app):
+    client = app.flask_app.test_client()
+    auth = {"Authorization": "Bearer secret"}
+    try:
+        body = client.post("/admin/profile", json={"enabled": True, "every": 4}, headers=auth).get_json()
+        assert body["enabled"] and body["pid"] == os.getpid()
+        assert app.profiler_control._read_control()["enabled"]
+    finally:
+        client.post("/admin/profile", json={"enabled": False, "reset": True}, headers=auth)
+    assert not app.profiler.enabled
+
+
+def test_polling_screens_updates_like_the_webhook(app):
+    app.ensure_runtime_started()
+    app.bots.ensure_started(app.default_bot)
+    dropped = app.flood_guard.stats()["dropped"]["user"]
+    sends = app.fake_api.calls.get("sendMessage", 0)
+    for i in range(FLOOD_BURST + 3):
+        app.runtime.run(app.poll_update(app.default_bot, sticker(200 + i, 502)))
+
+    assert app.flood_guard.stats()["dropped"]["user"] - dropped == 3
+    # Stickers are filtered out; only the slow-down warning is sent, once
+    assert app.fake_api.calls.get("sendMessage", 0) - sends == 1
+
+
+def test_export_refreshes_only_with_a_slot(app, monkeypatch):
+    client = app.flask_app.test_client()
+    auth = {"Authorization": "Bearer secret"}
+    refreshes = []
+    monkeypatch.setattr(app.default_bot.lead_store, "refresh", lambda: refreshes.append(1))
+
+    assert app.export_slots.acquire(blocking=False)
+    try:
+        assert client.get("/admin/leads/export", headers=auth).status_code == 429
+    finally:
+        app.export_slots.release()
+    assert refreshes == []  # a rejected export does not catch up
+
+    def fail():
+        raise OSError("disk")
+
+    monkeypatch.setattr(app.default_bot.lead_store, "refresh", fail)
+    assert client.get("/admin/leads/export", headers=auth).status_code == 500
+    assert app.export_slots.acquire(blocking=False)  # released after the failure
+    app.export_slots.release()
+
+    monkeypatch.setattr(app.default_bot.lead_store, "refresh", lambda: refreshes.append(1))
+    response = client.get("/admin/leads/export", headers=auth)
+    assert response.status_code == 200 and refreshes == [1]
+    response.close()
@@ -0,0 +1,211 @@
+import asyncio
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from bot_registry import DEFAULT_BOT, BotConfig, BotRegistry, HostedBot, SharedRequest, load_bot_configs
+
+
+class FakeApplication:
+    def __init__(self, fail_starts=0):
+        self.bot_data = {}
+        self.running = False
+        self.starts = 0
+        self.fail_starts = fail_starts
+
+    async def initialize(self):
+        await asyncio.sleep(0.01)  # long enough for other threads to pile up
+
+    async def start(self):
+        self.starts += 1
+        if self.starts <= self.fail_starts:
+            raise RuntimeError("getMe failed")
+        self.running = True
+
+    async def stop(self):
+        self.running = False
+
+    async def shutdown(self):
+        pass
+
+
+class FakeRuntime:
+    """The part of BotRuntime the registry uses: a loop in a thread and shutdown hooks."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.shutdown_hooks = []
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def on_shutdown(self, hook):
+        self.shutdown_hooks.append(hook)
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+@pytest.fixture
+def runtime():
+    runtime = FakeRuntime()
+    yield runtime
+    runtime.close()
+
+
+def config(name, token):
+    return BotConfig(name, token, "content.json", "leads", "outbox", "analytics", "broadcasts")
+
+
+def write_bots(tmp_path, bots):
+    path = tmp_path / "bots.json"
+    path.write_text(json.dumps({"bots": bots}), encoding="utf-8")
+    return str(path)
+
+
+def test_load_bot_configs(tmp_path, monkeypatch):
+    monkeypatch.setenv("EN_TOKEN", "2:EN")
+    path = write_bots(tmp_path, [
+        {"name": "en", "token_env": "EN_TOKEN", "content_file": "content.en.json"},
+        {"name": "fr", "token": "3:FR", "content_file": "content.fr.json", "sheet_url": "https://sheet"},
+    ])
+    en, fr = load_bot_configs(path, data_dir=str(tmp_path / "bots"))
+    assert (en.token, fr.token) == ("2:EN", "3:FR")
+    assert en.leads_dir == str(tmp_path / "bots" / "en" / "leads")
+    assert en.state_namespace == "en" and fr.sheet_url == "https://sheet"
+
+
+@pytest.mark.parametrize("bots, message", [
+    ([{"name": DEFAULT_BOT, "token": "2:X", "content_file": "c.json"}], "bad bot name"),
+    ([{"name": "Bad Name", "token": "2:X", "content_file": "c.json"}], "bad bot name"),
+    ([{"name": "en", "token_env": "UNSET_TOKEN_VAR", "content_file": "c.json"}], "no token"),
+    ([{"name": "en", "token": "2:X"}], "no content_file"),
+    ([{"name": "en", "token": "2:X", "content_file": "c.json"}] * 2, "duplicate bot names"),
+])
+def test_load_bot_configs_rejects(tmp_path, bots, message):
+    with pytest.raises(ValueError, match=message):
+        load_bot_configs(write_bots(tmp_path, bots))
+
+
+def test_registry_rejects_reused_token_or_name(runtime):
+    bots = BotRegistry(runtime, factory=None)
+    bots.add(config("en", "2:EN"))
+    with pytest.raises(ValueError):
+        bots.add(config("fr", "2:EN"))
+    with pytest.raises(ValueError):
+        bots.add(config("en", "3:FR"))
+
+
+def test_bot_built_once_on_first_use(runtime):
+    built = []
+
+    def factory(cfg):
+        time.sleep(0.01)
+        built.append(cfg.name)
+        return HostedBot(cfg, FakeApplication())
+
+    bots = BotRegistry(runtime, factory)
+    bots.add(config("en", "2:EN"))
+    assert built == [] and bots.stats()["bots"] == {"en": {"started": False}}
+    assert bots.get("9:UNKNOWN") is None
+
+    with ThreadPoolExecutor(8) as pool:
+        results = list(pool.map(lambda _: bots.get("2:EN"), range(8)))
+    assert built == ["en"]
+    assert all(bot is results[0] for bot in results)
+    assert bots.by_name("en") is results[0]
+
+
+def test_bot_started_once_from_many_threads(runtime):
+    bots = BotRegistry(runtime, lambda cfg: HostedBot(cfg, FakeApplication()))
+    bots.add(config("en", "2:EN"))
+    bot = bots.get("2:EN")
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(lambda _: bots.ensure_started(bot), range(8)))
+    assert bot.started and bot.application.starts == 1
+
+    runtime.run(runtime.shutdown_hooks[0]())
+    assert not bot.started
+
+
+def test_failed_start_is_retried(runtime):
+    bots = BotRegistry(runtime, lambda cfg: HostedBot(cfg, FakeApplication(fail_starts=1)))
+    bots.add(config("en", "2:EN"))
+    bot = bots.get("2:EN")
+    with pytest.raises(RuntimeError):
+        bots.ensure_started(bot)
+    assert bots.stats()["start_failures"] == 1
+    bots.ensure_started(bot)
+    assert bot.started
+
+
+def test_retried_start_runs_each_service_once(runtime):
+    bots = BotRegistry(runtime, lambda cfg: HostedBot(cfg, FakeApplication(fail_starts=1)))
+    bots.add(config("en", "2:EN"))
+    bot = bots.get("2:EN")
+    started = []
+    flaky = {"fails": 1}
+
+    async def outbox():
+        started.append("outbox")
+
+    async def catalog():
+        if flaky["fails"]:
+            flaky["fails"] -= 1
+            raise OSError("content file missing")
+        started.append("catalog")
+
+    bot.on_startup(outbox)
+    bot.on_startup(catalog)
+    for _ in range(2):  # the catalog fails, then getMe does
+        with pytest.raises((OSError, RuntimeError)):
+            bots.ensure_started(bot)
+    bots.ensure_started(bot)
+    assert bot.started and started == ["outbox", "catalog"]
+
+    runtime.run(bot.stop())
+    runtime.run(bot.start())  # a full stop lets every service start again
+    assert started == ["outbox", "catalog"] * 2
+
+
+def test_owned_bot_is_left_to_the_runtime(runtime):
+    bots = BotRegistry(runtime, factory=None)
+    default = HostedBot(config(DEFAULT_BOT, "1:DEFAULT"), FakeApplication())
+    bots.add(default.config, default)
+    bots.ensure_started(default)
+    assert default.application.starts == 0
+
+
+class CountingRequest:
+    def __init__(self):
+        self.initialized = self.closed = 0
+
+    async def initialize(self):
+        self.initialized += 1
+
+    async def shutdown(self):
+        self.closed += 1
+
+
+class SharedCountingRequest(SharedRequest, CountingRequest):
+    pass
+
+
+def test_shared_request_closes_with_last_bot():
+    request = SharedCountingRequest()
+
+    async def main():
+        await request.initialize()
+        await request.initialize()
+        await request.shutdown()
+        assert request.closed == 0
+        await request.shutdown()
+
+    asyncio.run(main())
+    assert request.closed == 1
@@ -0,0 +1,99 @@
+import asyncio
+import threading
+
+import pytest
+
+from broadcast import Broadcaster
+from lead_store import LeadStore
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, parse_mode=None):
+        self.sent.append(chat_id)
+
+
+@pytest.fixture
+def stores(tmp_path):
+    opened = []
+
+    def make(**kwargs):
+        kwargs.setdefault("compact_interval", 1e9)
+        store = LeadStore(str(tmp_path / "leads"), **kwargs)
+        opened.append(store)
+        return store
+
+    yield make
+    for store in opened:
+        store.close()
+
+
+def run_broadcast(broadcaster) -> dict:
+    async def main():
+        state = await broadcaster.launch("hello")
+        for _ in range(1000):
+            if not broadcaster.stats()["running"]:
+                break
+            await asyncio.sleep(0.01)
+        return state, broadcaster.status(state["id"])
+
+    return asyncio.run(main())
+
+
+def add(store, user_id):
+    return store.append({"name": f"u{user_id}", "email": f"u{user_id}@example.com", "user_id": user_id}).result(5)
+
+
+def test_broadcast_reaches_leads_written_by_other_worker(stores, tmp_path):
+    ours, theirs = stores(), stores()
+    add(ours, 1)
+    add(theirs, 2)
+    add(theirs, 3)
+    bot = FakeBot()
+    broadcaster = Broadcaster(str(tmp_path / "broadcasts"), bot, ours, rate=1000, chat_rate=1000)
+
+    started, finished = run_broadcast(broadcaster)
+    assert started["leads_at_start"] == 3
+    assert finished["status"] == "done"
+    assert sorted(bot.sent) == [1, 2, 3]
+
+
+def test_broadcast_messages_user_once_after_foreign_update(stores, tmp_path):
+    ours, theirs = stores(), stores()
+    add(ours, 1)
+    add(theirs, 1)  # the same user registered again on another worker
+    bot = FakeBot()
+    broadcaster = Broadcaster(str(tmp_path / "broadcasts"), bot, ours, rate=1000, chat_rate=1000)
+
+    run_broadcast(broadcaster)
+    assert bot.sent == [1]
+
+
+def test_broadcasts_while_stores_write_and_compact(stores, tmp_path):
+    compacting = dict(segment_max_bytes=400, compact_interval=0.001, compact_min_segments=2)
+    ours, theirs = stores(**compacting), stores(**compacting)
+    add(ours, 0)
+    done = threading.Event()
+
+    def write():
+        for user_id in range(1, 150):
+            add(theirs if user_id % 2 else ours, user_id)
+        done.set()
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    bot = FakeBot()
+    broadcaster = Broadcaster(str(tmp_path / "broadcasts"), bot, ours, rate=10000, chat_rate=10000)
+    runs = []
+    try:
+        while not done.is_set():
+            runs.append(run_broadcast(broadcaster)[1])
+    finally:
+        writer.join()
+    runs.append(run_broadcast(broadcaster)[1])
+
+    assert ours.compactions + theirs.compactions > 0
+    assert [run["status"] for run in runs] == ["done"] * len(runs)
+    assert runs[-1]["sent"] == 150
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from content_catalog import CatalogStore, ContentCatalog
+
+
+def catalog(about="About {brand}", **extra):
+    return {
+        "variables": {"brand": "Academy"},
+        "keyboards": {"main": [["ℹ️ About"]]},
+        "replies": {"about": {"text": about, "keyboard": "main"}},
+        "routes": {"about": ["ℹ️ About"]},
+        **extra,
+    }
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "content.json"
+    write(path, catalog())
+    return path
+
+
+def write(path, data):
+    """Write ``data`` and move the mtime on, as an edit a moment later would."""
+    mtime = os.stat(path).st_mtime_ns if path.exists() else 0
+    path.write_text(data if isinstance(data, str) else json.dumps(data), encoding="utf-8")
+    os.utime(path, ns=(mtime + 10**9, mtime + 10**9))
+
+
+def test_replies_are_prepared_once():
+    content = ContentCatalog(catalog("{brand} for {name}"), variables={"brand": "Lab"})
+    reply = content.replies["about"]
+    assert reply.text == "Lab for {name}"  # per-user fields are filled at send time
+    assert json.loads(reply.markup_json) == {"keyboard": [[{"text": "ℹ️ About"}]], "resize_keyboard": True}
+    assert reply.webhook_body(7, name="Sara")["text"] == "Lab for Sara"
+
+
+def test_route_without_reply_is_rejected():
+    with pytest.raises(ValueError, match="route 'news'"):
+        ContentCatalog(catalog(routes={"news": ["🆕 News"]}))
+
+
+def test_reload_swaps_catalog_and_notifies(path):
+    store = CatalogStore(str(path), variables={"brand": "Lab"})
+    reloaded = []
+    store.on_reload(reloaded.append)
+    assert not store.check_for_changes()
+
+    write(path, catalog("New about {brand}"))
+    assert store.check_for_changes()
+    assert store.current.replies["about"].text == "New about Lab"
+    assert reloaded == [store.current] and store.reloads == 1
+    assert not store.check_for_changes()  # the same file is not loaded twice
+
+
+@pytest.mark.parametrize("broken", [
+    "{not json",
+    catalog(routes={"news": ["🆕 News"]}),
+    catalog(learning=[{"id": "l1", "text": "x", "media": [{"path": "missing.pdf"}]}]),
+])
+def test_failed_reload_keeps_the_previous_catalog(path, broken):
+    store = CatalogStore(str(path))
+    before = store.current
+    store.on_reload(lambda content: pytest.fail("listener called for a failed reload"))
+    write(path, broken)
+    assert not store.check_for_changes()
+    assert store.current is before and store.reloads == 0
+
+
+def test_missing_file_keeps_the_previous_catalog(path):
+    store = CatalogStore(str(path))
+    before = store.current
+    path.unlink()
+    assert not store.check_for_changes()
+    assert store.current is before
+
+
+def test_watcher_picks_up_changes(path):
+    store = CatalogStore(str(path), check_interval=0.01)
+
+    async def main():
+        await store.start()
+        write(path, catalog("Changed"))
+        for _ in range(200):
+            if store.reloads:
+                break
+            await asyncio.sleep(0.01)
+        await store.stop()
+
+    asyncio.run(main())
+    assert store.current.replies["about"].text == "Changed"
@@ -0,0 +1,97 @@
+import asyncio
+import json
+
+import pytest
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, User
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+from telegram.request import HTTPXRequest
+
+from inline_reply import InlineReplyRequest, process_update_inline
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Bot API calls that actually went out, as (method, parameters)."""
+    calls = []
+
+    async def do_request(self, url, method, request_data=None, **kwargs):
+        calls.append((url.rsplit("/", 1)[-1], request_data.parameters if request_data else {}))
+        result = {"message_id": len(calls), "date": 0, "chat": {"id": 7, "type": "private"}}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+    monkeypatch.setattr(HTTPXRequest, "do_request", do_request)
+    return calls
+
+
+def application(callback):
+    app = ApplicationBuilder().token("123:TEST").request(InlineReplyRequest()).build()
+    app.bot._bot_user = User(123, "bot", is_bot=True, username="test_bot")
+    app._initialized = True  # what initialize() would do, without the getMe call
+    app.add_handler(MessageHandler(filters.ALL, callback))
+    return app
+
+
+def run(app, text="hi"):
+    data = {"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "text": text,
+        "chat": {"id": 7, "type": "private"}, "from": {"id": 7, "is_bot": False, "first_name": "u"},
+    }}
+    return asyncio.run(process_update_inline(app, Update.de_json(data, app.bot)))
+
+
+def test_single_reply_becomes_the_response_body(sent):
+    keyboard = InlineKeyboardMarkup([[InlineKeyboardButton("Next", callback_data="lesson:2")]])
+    replies = []
+
+    async def callback(update, context):
+        replies.append(await update.message.reply_text("Lesson 1", reply_markup=keyboard))
+
+    body = run(application(callback))
+    assert sent == [] and replies[0].text == "Lesson 1"  # the stand-in result handlers get back
+    assert body == {
+        "method": "sendMessage",
+        "chat_id": 7,
+        "text": "Lesson 1",
+        "reply_markup": {"inline_keyboard": [[{"text": "Next", "callback_data": "lesson:2"}]]},
+    }
+    json.dumps(body)  # ready to write out as the webhook response
+
+
+def test_preserialized_keyboard_is_decoded(sent):
+    markup = json.dumps({"keyboard": [[{"text": "Register"}]], "resize_keyboard": True})
+
+    async def callback(update, context):
+        await context.bot.send_message(7, "Welcome", api_kwargs={"reply_markup": markup})
+
+    body = run(application(callback))
+    assert body["reply_markup"] == {"keyboard": [[{"text": "Register"}]], "resize_keyboard": True}
+
+
+def test_second_call_flushes_the_held_reply_in_order(sent):
+    async def callback(update, context):
+        await update.message.reply_text("first")
+        await update.message.reply_text("second")
+        await update.message.reply_text("third")
+
+    body = run(application(callback))
+    assert body is None
+    assert [(method, params["text"]) for method, params in sent] == [
+        ("sendMessage", "first"), ("sendMessage", "second"), ("sendMessage", "third"),
+    ]
+
+
+def test_other_methods_are_not_held(sent):
+    async def callback(update, context):
+        await context.bot.send_chat_action(7, "typing")
+        await update.message.reply_text("after the action")
+
+    body = run(application(callback))
+    assert body is None
+    assert [method for method, _ in sent] == ["sendChatAction", "sendMessage"]
+
+
+def test_no_reply_gives_no_body(sent):
+    async def callback(update, context):
+        pass
+
+    assert run(application(callback)) is None and sent == []
@@ -0,0 +1,48 @@
+import csv
+import io
+import json
+
+import pytest
+
+from lead_export import ExportQuery, export_leads
+from lead_store import LeadStore
+
+
+@pytest.fixture
+def stores(tmp_path):
+    opened = []
+
+    def make():
+        store = LeadStore(str(tmp_path), compact_interval=1e9)
+        opened.append(store)
+        return store
+
+    yield make
+    for store in opened:
+        store.close()
+
+
+def export(store, **kwargs):
+    return b"".join(export_leads(store, ExportQuery(**kwargs))).decode("utf-8")
+
+
+def test_export_after_other_worker_writes(stores):
+    exporter, writer = stores(), stores()
+    writer.append({"name": "Ali", "email": "ali@example.com", "user_id": 1}).result(5)
+    lead = writer.append({"name": "Bob", "email": "bob@example.com", "user_id": 2}).result(5)
+    writer.update(lead["lead_id"], {**lead, "status": "Validated"}).result(5)
+
+    assert export(exporter, format="jsonl") == ""  # what the export saw before refresh()
+    exporter.refresh()
+    rows = list(csv.DictReader(io.StringIO(export(exporter))))
+    assert [(r["name"], r["status"]) for r in rows] == [("Ali", ""), ("Bob", "Validated")]
+
+
+def test_export_cursor_after_refresh(stores):
+    exporter, writer = stores(), stores()
+    first = writer.append({"name": "Ali", "email": "ali@example.com", "user_id": 1}).result(5)
+    exporter.refresh()
+    writer.append({"name": "Bob", "email": "bob@example.com", "user_id": 2}).result(5)
+    exporter.refresh()
+    lines = export(exporter, format="jsonl", after=first["seq"]).splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["Bob"]
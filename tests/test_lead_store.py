@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+import pytest
+
+from lead_store import SEGMENT_PREFIX, LeadStore
+
+
+def open_store(directory, **kwargs):
+    kwargs.setdefault("compact_interval", 1e9)
+    return LeadStore(directory, **kwargs)
+
+
+def segments(directory):
+    return sorted(n for n in os.listdir(directory) if n.startswith(SEGMENT_PREFIX))
+
+
+def add(store, i):
+    return store.append({"name": f"u{i}", "email": f"u{i}@example.com", "user_id": i}).result(5)
+
+
+@pytest.fixture
+def stores(tmp_path):
+    opened = []
+
+    def make(**kwargs):
+        store = open_store(str(tmp_path), **kwargs)
+        opened.append(store)
+        return store
+
+    yield make
+    for store in opened:
+        store.close()
+
+
+def test_versions_and_lookups(stores):
+    store = stores()
+    lead = add(store, 1)
+    store.update(lead["lead_id"], {**lead, "status": "Validated"}).result(5)
+    assert store.count == 1
+    assert store.find_by_email("u1@example.com") == lead["lead_id"]
+    assert [r["status"] for r in store.iter_records()] == ["Validated"]
+    assert len(list(store.iter_records(latest_only=False))) == 2
+
+
+def test_refresh_sees_other_process_appends(stores):
+    a, b = stores(), stores()
+    for i in range(5):
+        add(a, i)
+    assert b.find_by_user(3) is None
+    b.refresh()
+    assert b.count == 5
+    assert b.find_by_user(3) == a.find_by_user(3)
+
+
+def test_catch_up_after_foreign_compaction_of_partly_read_segment(stores):
+    a = stores(segment_max_bytes=300, compact_min_segments=2)
+    i = 0
+    while len(segments(a.directory)) < 2:
+        add(a, i)
+        i += 1
+    # b has read the active segment only as far as it is now
+    b = stores(segment_max_bytes=300, compact_min_segments=2)
+    while len(segments(a.directory)) < 3:
+        add(a, i)
+        i += 1
+    # folds the first segment into the one b read partly, which gets a new inode
+    assert a.compact()
+
+    b.refresh()
+    assert b.count == a.count == i
+    assert all(b.find_by_user(n) == a.find_by_user(n) for n in range(i))
+    assert [r["user_id"] for r in b.iter_records()] == list(range(i))
+
+
+def test_compaction_keeps_newest_version_for_other_reader(stores):
+    a = stores(segment_max_bytes=200, compact_min_segments=2)
+    b = stores(segment_max_bytes=200, compact_min_segments=2)
+    leads = [add(a, n) for n in range(6)]
+    b.refresh()
+    a.update(leads[0]["lead_id"], {**leads[0], "status": "Validated"}).result(5)
+    for n in range(6, 12):
+        add(a, n)
+    assert a.compact()
+    b.refresh()
+    (first,) = [r for r in b.iter_records() if r["lead_id"] == leads[0]["lead_id"]]
+    assert first["status"] == "Validated"
+    assert b.count == 12
+
+
+def test_concurrent_writers_keep_seq_unique(stores):
+    a, b = stores(segment_max_bytes=2000), stores(segment_max_bytes=2000)
+
+    def write(store, start):
+        futures = [store.append({"user_id": n}) for n in range(start, start + 200)]
+        for f in futures:
+            f.result(10)
+
+    threads = [threading.Thread(target=write, args=(s, n * 1000)) for n, s in enumerate((a, b))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    a.refresh()
+    seqs = [r["seq"] for r in a.iter_records(latest_only=False)]
+    assert len(seqs) == 400
+    assert seqs == sorted(set(seqs))
+
+
+def test_refresh_from_threads_during_compaction(stores):
+    store = stores(segment_max_bytes=300, compact_interval=0.001, compact_min_segments=2)
+    errors = []
+    done = threading.Event()
+
+    def refresh():
+        while not done.is_set():
+            try:
+                store.refresh()
+            except Exception as e:
+                errors.append(e)
+            time.sleep(0.0005)  # let the writer in
+
+    threads = [threading.Thread(target=refresh) for _ in range(4)]
+    for t in threads:
+        t.start()
+    try:
+        for n in range(300):
+            add(store, n)
+    finally:
+        done.set()
+        for t in threads:
+            t.join()
+    assert store.compactions > 0
+    assert errors == []
+    assert store.count == 300
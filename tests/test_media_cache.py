@@ -0,0 +1,90 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+from telegram.error import BadRequest
+
+from content_catalog import Media
+from media_cache import MediaCache
+
+
+class FakeMessage:
+    """Replies like Telegram: uploads get a new file_id, cached ids fail with ``id_error`` if set."""
+
+    def __init__(self, id_error=None):
+        self.id_error = id_error
+        self.sent = []
+
+    async def reply_document(self, media, caption=None, parse_mode=None, **kwargs):
+        if isinstance(media, str):
+            if self.id_error:
+                raise BadRequest(self.id_error)
+            self.sent.append(media)
+        else:
+            self.sent.append("upload")
+            media = f"id-{len(self.sent)}"
+        return SimpleNamespace(effective_attachment=SimpleNamespace(file_id=media))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = MediaCache(str(tmp_path / "state.db"), bot_id="1")
+    yield cache
+    cache._conn.close()
+
+
+@pytest.fixture
+def item(tmp_path):
+    (tmp_path / "lesson.pdf").write_bytes(b"%PDF")
+    return Media({"type": "document", "path": "lesson.pdf"}, str(tmp_path), {})
+
+
+def test_file_id_reused(cache, item):
+    message = FakeMessage()
+    asyncio.run(cache.send(message, [item, item]))
+    assert message.sent == ["upload", "id-1"]
+    assert cache.stats()["reused"] == 1
+
+
+@pytest.mark.parametrize("error", [
+    "Wrong file identifier/http url specified",
+    "Wrong remote file identifier specified: wrong padding in the string",
+    "File_reference_expired",
+])
+def test_stale_file_id_is_uploaded_again(cache, item, error):
+    asyncio.run(cache.send_one(FakeMessage(), item))
+    message = FakeMessage(id_error=error)
+    asyncio.run(cache.send_one(message, item))
+    assert message.sent == ["upload"]
+    assert cache.stats()["rejected_file_ids"] == 1
+
+
+def test_other_bad_request_keeps_file_id(cache, item):
+    asyncio.run(cache.send_one(FakeMessage(), item))
+    message = FakeMessage(id_error="Can't parse entities: unsupported start tag")
+    with pytest.raises(BadRequest, match="parse entities"):
+        asyncio.run(cache.send_one(message, item))
+    assert message.sent == [] and cache.stats()["rejected_file_ids"] == 0
+
+    message = FakeMessage()
+    asyncio.run(cache.send_one(message, item))
+    assert message.sent == ["id-1"]
+
+
+def test_file_id_lookup_stays_off_the_loop(cache, tmp_path, item, monkeypatch):
+    asyncio.run(cache.send_one(FakeMessage(), item))
+    other = MediaCache(str(tmp_path / "state.db"), bot_id="1")  # another worker, nothing in memory yet
+    lookups = []
+    lookup = other._lookup
+
+    def recording_lookup(key):
+        lookups.append(threading.current_thread() is threading.main_thread())
+        return lookup(key)
+
+    monkeypatch.setattr(other, "_lookup", recording_lookup)
+    message = FakeMessage()
+    asyncio.run(other.send(message, [item, item]))
+    assert message.sent == ["id-1", "id-1"]  # the first worker's upload
+    assert lookups == [False]  # read from STATE_DB once, in a worker thread; then from memory
+    other._conn.close()
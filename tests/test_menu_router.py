@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+from telegram import Update, User
+from telegram.ext import ApplicationBuilder, ConversationHandler, MessageHandler, filters
+
+from menu_router import MenuRouter, normalize_label
+
+
+def update(text, kind="message", update_id=1):
+    return {"update_id": update_id, kind: {
+        "message_id": update_id, "date": 0, "text": text,
+        "chat": {"id": 7, "type": "private"}, "from": {"id": 7, "is_bot": False, "first_name": "u"},
+    }}
+
+
+@pytest.fixture
+def app():
+    """An application with a router and a catch-all handler after it, like app.py's menu."""
+    application = ApplicationBuilder().token("123:TEST").build()
+    application.bot._bot_user = User(123, "bot", is_bot=True, username="test_bot")
+    application._initialized = True  # no getMe
+    application.seen = []
+
+    def route(name):
+        async def callback(update, context):
+            application.seen.append(name)
+        return callback
+
+    async def fallback(update, context):
+        application.seen.append("fallback")
+
+    application.router = MenuRouter({("📚 Lessons", "Lessons"): route("lessons"), "ℹ️ About": route("about")})
+    application.route = route
+    application.add_handler(application.router)
+    application.add_handler(MessageHandler(filters.TEXT, fallback), group=1)
+
+    def process(data):
+        asyncio.run(application.process_update(Update.de_json(data, application.bot)))
+        seen, application.seen = application.seen, []
+        return seen
+
+    application.process = process
+    return application
+
+
+def test_normalize_label():
+    assert normalize_label("\u200f ℹ️ About\u200c ") == "ℹ️ About"
+    assert normalize_label(None) == ""
+
+
+def test_dispatches_by_label(app):
+    assert app.process(update("📚 Lessons")) == ["lessons", "fallback"]
+    assert app.process(update("Lessons")) == ["lessons", "fallback"]  # every label of a tuple
+    assert app.process(update("\u200fℹ️ About ")) == ["about", "fallback"]  # as some clients send it
+
+
+@pytest.mark.parametrize("data", [
+    update("Unknown button"),
+    update("lessons"),  # labels are matched exactly
+    update("📚 Lessons", kind="edited_message"),
+    update("📚 Lessons", kind="channel_post"),
+])
+def test_unknown_labels_fall_through(app, data):
+    assert app.router.check_update(Update.de_json(data, app.bot)) is None
+    seen = app.process(data)
+    assert "lessons" not in seen and "about" not in seen
+
+
+def test_replace_swaps_the_whole_table(app):
+    app.router.replace({"🆕 News": app.route("news")})
+    assert app.process(update("🆕 News")) == ["news", "fallback"]
+    assert app.process(update("📚 Lessons")) == ["fallback"]
+    assert app.router.probe_texts() == ["🆕 News"]
+
+
+def test_wrapper_applies_to_later_routes(app):
+    def wrap(callback):
+        async def wrapped(update, context):
+            app.seen.append("wrapped")
+            return await callback(update, context)
+        return wrapped
+
+    app.router.wrap_callbacks(wrap)
+    assert app.process(update("ℹ️ About")) == ["wrapped", "about", "fallback"]
+    app.router.add("🆕 News", app.route("news"))
+    assert app.process(update("🆕 News")) == ["wrapped", "news", "fallback"]
+    app.router.replace({"Lessons": app.route("lessons")})
+    assert app.process(update("Lessons")) == ["wrapped", "lessons", "fallback"]
+
+
+def test_conversation_entry_point_returns_the_state():
+    async def start(update, context):
+        return 1
+
+    router = MenuRouter({"Register": start})
+    conversation = ConversationHandler(entry_points=[router], states={1: []}, fallbacks=[])
+    application = ApplicationBuilder().token("123:TEST").build()
+    application._initialized = True
+    application.add_handler(conversation)
+
+    asyncio.run(application.process_update(Update.de_json(update("Register"), application.bot)))
+    assert conversation._conversations == {(7, 7): 1}
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from telegram.ext import ApplicationBuilder, MessageHandler, filters
+
+from metrics import MetricsRegistry, instrument_handlers
+
+
+def lines(registry, name):
+    return [line for line in registry.render().splitlines() if line.startswith(name)]
+
+
+def test_labeled_views_share_instruments():
+    registry = MetricsRegistry()
+    a, b = registry.labeled(bot="a"), registry.labeled(bot="b")
+    a.counter("sends_total", "Sends.", ("source",)).inc("upload")
+    b.counter("sends_total", "Sends.", ("source",)).inc("upload", amount=2)
+    a.histogram("write_seconds", "Writes.").observe(0.002)
+    assert lines(registry, "sends_total") == [
+        'sends_total{bot="a",source="upload"} 1',
+        'sends_total{bot="b",source="upload"} 2',
+    ]
+    assert 'write_seconds_count{bot="a"} 1' in lines(registry, "write_seconds_count")
+
+
+def test_labeled_callback_gauges_report_every_view():
+    registry = MetricsRegistry()
+    registry.labeled(bot="a").gauge_callback("leads", "Leads.", lambda: 3)
+    registry.labeled(bot="b").gauge_callback("leads", "Leads.", lambda: 5)
+    assert lines(registry, "leads") == ['leads{bot="a"} 3', 'leads{bot="b"} 5']
+
+
+def test_labeled_callback_clashes_with_unlabeled_one():
+    registry = MetricsRegistry()
+    registry.gauge_callback("leads", "Leads.", lambda: 3)
+    with pytest.raises(ValueError):
+        registry.labeled(bot="a").gauge_callback("leads", "Leads.", lambda: 5)
+
+
+def test_counter_callback_renders_as_counter():
+    registry = MetricsRegistry()
+    dropped = [0]
+    registry.counter_callback("log_records_dropped_total", "Dropped.", lambda: dropped[0])
+    dropped[0] = 4
+    text = registry.render()
+    assert "# TYPE log_records_dropped_total counter" in text
+    assert "log_records_dropped_total 4" in text.splitlines()
+
+
+def test_instrumented_handlers_carry_bot_label():
+    registry = MetricsRegistry()
+
+    async def greet(update, context):
+        return None
+
+    async def fail(update, context):
+        raise RuntimeError("boom")
+
+    application = ApplicationBuilder().token("123:TEST").build()
+    application.add_handler(MessageHandler(filters.ALL, greet))
+    application.add_handler(MessageHandler(filters.ALL, fail), group=1)
+    instrument_handlers(application, registry.labeled(bot="en"))
+
+    asyncio.run(application.handlers[0][0].callback(None, None))
+    with pytest.raises(RuntimeError):
+        asyncio.run(application.handlers[1][0].callback(None, None))
+    assert 'telegram_handler_seconds_count{bot="en",handler="greet"} 1' in lines(registry, "telegram_handler_seconds_count")
+    assert lines(registry, "telegram_handler_errors_total") == ['telegram_handler_errors_total{bot="en",handler="fail"} 1']
@@ -0,0 +1,125 @@
+import asyncio
+
+from polling import UpdatePoller
+from webhook_setup import WebhookError
+
+
+class FakeRegistrar:
+    """getUpdates from a list: returns updates at or after ``offset``, then waits."""
+
+    def __init__(self, updates, fail=0):
+        self.updates = updates
+        self.fail = fail
+        self.calls = []
+        self.deleted = self.closed = False
+
+    async def delete(self, drop_pending_updates=False):
+        self.deleted = True
+
+    async def call(self, method, **params):
+        self.calls.append(params)
+        if self.fail:
+            self.fail -= 1
+            raise WebhookError("Conflict", error_code=409, retry_after=0.01)
+        pending = [u for u in self.updates if u["update_id"] >= params.get("offset", 0)][: params["limit"]]
+        if not pending and params["timeout"]:
+            await asyncio.sleep(3600)  # a long poll with nothing to return
+        return pending
+
+    async def aclose(self):
+        self.closed = True
+
+
+def message(update_id, chat_id):
+    chat = {"id": chat_id, "type": "private"}
+    return {"update_id": update_id, "message": {"message_id": update_id, "date": 0, "chat": chat, "text": "hi"}}
+
+
+async def wait_for(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.005)
+    raise AssertionError("timed out")
+
+
+def test_chats_in_order_and_offset_after_batch():
+    updates = [message(1, 10), message(2, 20), message(3, 10), message(4, 20), message(5, 10)]
+    registrar = FakeRegistrar(updates)
+    seen = []
+    offsets = []
+    poller = None
+
+    async def handler(data):
+        offsets.append(poller.offset)  # not moved while the batch runs
+        await asyncio.sleep(0.01 if data["update_id"] == 1 else 0)
+        seen.append(data["update_id"])
+
+    async def main():
+        nonlocal poller
+        poller = UpdatePoller(registrar, handler, limit=10, timeout=30)
+        await poller.start()
+        await wait_for(lambda: poller.offset == 6)
+        await poller.stop()
+
+    asyncio.run(main())
+    assert registrar.deleted and registrar.closed
+    assert [u for u in seen if u % 2] == [1, 3, 5]  # chat 10 in order despite the slow first update
+    assert seen.index(2) < seen.index(1)  # chat 20 did not wait for chat 10
+    assert offsets == [None] * 5
+    assert poller.stats()["updates"] == 5 and poller.stats()["batches"] == 1
+
+
+def test_failed_update_is_counted_not_retried():
+    registrar = FakeRegistrar([message(1, 10), message(2, 10)])
+    seen = []
+
+    async def handler(data):
+        seen.append(data["update_id"])
+        if data["update_id"] == 1:
+            raise RuntimeError("boom")
+
+    async def main():
+        poller = UpdatePoller(registrar, handler, timeout=30)
+        await poller.start()
+        await wait_for(lambda: poller.offset == 3)
+        await poller.stop()
+        return poller
+
+    poller = asyncio.run(main())
+    assert seen == [1, 2] and poller.failed == 1
+
+
+def test_stop_confirms_processed_offset():
+    registrar = FakeRegistrar([message(7, 10)])
+
+    async def handler(data):
+        pass
+
+    async def main():
+        poller = UpdatePoller(registrar, handler, timeout=30)
+        await poller.start()
+        await wait_for(lambda: poller.offset == 8)
+        await poller.stop()
+
+    asyncio.run(main())
+    # The long poll with offset=8 was cancelled, so stop() told Telegram once more
+    assert registrar.calls[-1] == {"timeout": 0, "limit": 1, "offset": 8}
+
+
+def test_conflict_is_retried():
+    registrar = FakeRegistrar([message(1, 10)], fail=2)
+    seen = []
+
+    async def handler(data):
+        seen.append(data["update_id"])
+
+    async def main():
+        poller = UpdatePoller(registrar, handler, timeout=30)
+        await poller.start()
+        await wait_for(lambda: seen)
+        await poller.stop()
+        return poller
+
+    poller = asyncio.run(main())
+    assert seen == [1] and poller.errors == 2
@@ -0,0 +1,87 @@
+import asyncio
+
+from profiler import SamplingProfiler, SharedProfilerControl
+
+
+def record(control, stack, count):
+    for _ in range(count):
+        control.profiler._count(stack)
+
+
+def make_controls(tmp_path):
+    directory = str(tmp_path / "profile")
+    return [SharedProfilerControl(SamplingProfiler(), directory, worker=name) for name in ("a", "b")]
+
+
+def test_toggle_reaches_other_workers(tmp_path):
+    a, b = make_controls(tmp_path)
+    try:
+        a.publish(enabled=True, every=3, interval=0.01)
+        assert a.profiler.enabled and not b.profiler.enabled
+        b.sync()
+        assert b.profiler.enabled and (b.profiler.every, b.profiler.interval) == (3, 0.01)
+
+        a.publish(enabled=False)
+        b.sync()
+        assert not a.profiler.enabled and not b.profiler.enabled
+    finally:
+        a.profiler.disable()
+        b.profiler.disable()
+
+
+def test_late_worker_follows_current_settings(tmp_path):
+    directory = str(tmp_path / "profile")
+    a = SharedProfilerControl(SamplingProfiler(), directory, worker="a")
+    a.publish(enabled=True, every=7)
+    b = SharedProfilerControl(SamplingProfiler(), directory, worker="b")
+    try:
+        b.sync()
+        assert b.profiler.enabled and b.profiler.every == 7
+    finally:
+        a.profiler.disable()
+        b.profiler.disable()
+
+
+def test_collapsed_adds_up_workers(tmp_path):
+    a, b = make_controls(tmp_path)
+    record(a, ("x", "y"), 2)
+    record(b, ("x", "y"), 3)
+    record(b, ("z",), 1)
+    assert a.collapsed() == "x;y 2\n"  # b has not written its stacks yet
+    b.sync()
+    assert a.collapsed() == "x;y 5\nz 1\n"
+    assert a.stats()["pid"] and a.stats()["workers_with_samples"] == 2
+
+
+def test_reset_clears_every_worker(tmp_path):
+    a, b = make_controls(tmp_path)
+    record(a, ("x",), 1)
+    record(b, ("y",), 1)
+    b.sync()
+    a.publish(reset=True)
+    assert a.collapsed() == ""
+    b.sync()
+    assert b.profiler.samples == 0 and b.collapsed() == ""
+
+
+def test_poll_task_applies_changes(tmp_path):
+    a, b = make_controls(tmp_path)
+    b.poll_interval = 0.01
+
+    async def main():
+        await b.start()
+        a.publish(enabled=True)
+        for _ in range(100):
+            if b.profiler.enabled:
+                break
+            await asyncio.sleep(0.01)
+        record(b, ("w",), 4)
+        await b.stop()
+
+    try:
+        asyncio.run(main())
+        assert b.profiler.enabled
+        assert a.collapsed() == "w 4\n"  # written on stop
+    finally:
+        a.profiler.disable()
+        b.profiler.disable()
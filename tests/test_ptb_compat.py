@@ -0,0 +1,90 @@
+import asyncio
+import datetime
+import os
+import re
+
+import pytest
+import telegram
+from telegram import Chat, Message, Update, User
+from telegram.ext import ConversationHandler, MessageHandler, PersistenceInput, filters
+
+import ptb_compat
+from sqlite_persistence import SQLitePersistence
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_update(user_id=7, chat_id=7, update_id=1):
+    user = User(user_id, "u", is_bot=False)
+    message = Message(1, datetime.datetime.now(), Chat(chat_id, "private"), from_user=user, text="hi")
+    return Update(update_id, message=message)
+
+
+def make_handler(name="registration"):
+    noop = MessageHandler(filters.ALL, lambda u, c: None)
+    handler = ConversationHandler([noop], {0: [noop]}, [], name=name, persistent=True)
+    # What Application does when it loads a persistent handler
+    asyncio.run(handler._initialize_persistence(_FakeApplication()))
+    return handler
+
+
+class _FakeApplication:
+    class persistence:
+        @staticmethod
+        async def get_conversations(name):
+            return {}
+
+
+def test_installed_ptb_is_the_pinned_one():
+    with open(os.path.join(ROOT, "requirements.txt"), encoding="utf-8") as f:
+        pinned = re.search(r"^python-telegram-bot==(\S+)", f.read(), re.M).group(1)
+    assert pinned == ptb_compat.TESTED_PTB_VERSION
+    assert telegram.__version__ == ptb_compat.TESTED_PTB_VERSION
+
+
+def test_conversation_key_and_untracked_state():
+    handler = make_handler()
+    key = ptb_compat.conversation_key(handler, make_update())
+    assert key == (7, 7)
+
+    ptb_compat.set_conversation_state(handler, key, 1)
+    assert handler._conversations[key] == 1
+    assert not handler._conversations.pop_accessed_write_items()  # not persisted back
+    ptb_compat.set_conversation_state(handler, key, None)
+    assert key not in handler._conversations
+    assert not handler._conversations.pop_accessed_write_items()
+
+
+def test_conversation_key_without_chat():
+    handler = make_handler()
+    assert ptb_compat.conversation_key(handler, Update(1)) is None
+
+
+@pytest.mark.parametrize("state", [1, None])
+def test_refresh_conversation_from_other_worker(tmp_path, state):
+    path = str(tmp_path / "state.db")
+    a, b = SQLitePersistence(path, store_data=PersistenceInput()), SQLitePersistence(path, store_data=PersistenceInput())
+    handler, update = make_handler(), make_update()
+    key = ptb_compat.conversation_key(handler, update)
+    ptb_compat.set_conversation_state(handler, key, 0)
+
+    async def main():
+        await a.update_conversation(handler.name, key, 0)
+        await a.flush()
+        await b.refresh_conversation(handler, update)
+        await a.update_conversation(handler.name, key, state)
+        await a.flush()
+        await b.refresh_conversation(handler, update)
+
+    asyncio.run(main())
+    assert handler._conversations.get(key) == state
+
+
+def test_end_conversation_is_tracked():
+    handler = make_handler()
+    key = ptb_compat.conversation_key(handler, make_update())
+    assert not ptb_compat.end_conversation(handler, key)
+    ptb_compat.set_conversation_state(handler, key, 1)
+    assert not ptb_compat.conversation_unsaved(handler, key)
+    assert ptb_compat.end_conversation(handler, key)
+    assert ptb_compat.conversation_unsaved(handler, key)  # update_persistence() deletes the row
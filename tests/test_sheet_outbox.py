@@ -0,0 +1,244 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from sheet_outbox import SheetOutbox
+
+
+class FakeResponse:
+    status_code = 200
+
+
+class FakeSheet:
+    """Accepts every POST and keeps the leads it received."""
+
+    def __init__(self):
+        self.received = []
+
+    async def post(self, url, json):
+        self.received.extend(json["leads"] if "leads" in json else [json])
+        return FakeResponse()
+
+
+@pytest.fixture
+def outboxes(tmp_path):
+    opened = []
+
+    def make(**kwargs):
+        kwargs.setdefault("batch_size", 5)
+        outbox = SheetOutbox(str(tmp_path), "https://sheet.invalid", FakeSheet(), **kwargs)
+        opened.append(outbox)
+        return outbox
+
+    yield make
+    for outbox in opened:
+        asyncio.run(outbox.stop())
+
+
+def drain_once(outbox) -> list:
+    """What one turn of the sender does, minus the POST."""
+    lines, consumed = outbox._read_batch()
+    if lines:
+        outbox._advance(consumed, attempts=0)
+    else:
+        outbox._truncate_if_drained()
+    return lines
+
+
+def enqueue_from_process(directory, start, count):
+    outbox = SheetOutbox(directory, "", None)
+    for i in range(start, start + count):
+        outbox.enqueue({"n": i})
+
+
+def test_enqueue_and_drain_in_threads_lose_nothing(outboxes):
+    outbox = outboxes()
+    outbox._is_sender()
+    writers_done = threading.Event()
+    delivered = []
+
+    def drain():
+        while True:
+            lines = drain_once(outbox)
+            delivered.extend(lines)
+            if not lines and writers_done.is_set() and not outbox.pending_count():
+                return
+
+    def write(start):
+        for i in range(start, start + 300):
+            outbox.enqueue({"n": i})
+
+    drainer = threading.Thread(target=drain)
+    writers = [threading.Thread(target=write, args=(k * 1000,)) for k in range(4)]
+    drainer.start()
+    for t in writers:
+        t.start()
+    for t in writers:
+        t.join()
+    writers_done.set()
+    drainer.join(30)
+
+    received = sorted(json.loads(line)["payload"]["n"] for line in delivered)
+    assert received == sorted(k * 1000 + i for k in range(4) for i in range(300))
+
+
+def test_enqueue_between_drain_check_and_truncate_is_kept(outboxes, monkeypatch):
+    outbox = outboxes()
+    outbox._is_sender()
+    outbox.enqueue({"n": 0})
+    assert len(drain_once(outbox)) == 1
+
+    getsize = os.path.getsize
+    late = []
+
+    def getsize_then_enqueue(path):
+        size = getsize(path)
+        # Another thread enqueues right after the drained check; it has to
+        # wait for the truncation rather than be wiped out by it.
+        writer = threading.Thread(target=outbox.enqueue, args=({"n": 1},))
+        writer.start()
+        writer.join(0.2)
+        late.append(writer)
+        return size
+
+    monkeypatch.setattr(os.path, "getsize", getsize_then_enqueue)
+    drain_once(outbox)
+    monkeypatch.undo()
+    late[0].join(5)
+
+    assert [p["n"] for p in outbox.pending_payloads()] == [1]
+    assert [json.loads(line)["payload"]["n"] for line in drain_once(outbox)] == [1]
+
+
+def test_enqueue_from_other_processes_while_sender_drains(outboxes, tmp_path):
+    sender = outboxes()
+    sender._is_sender()
+    ctx = multiprocessing.get_context("fork")
+    writers = [ctx.Process(target=enqueue_from_process, args=(str(tmp_path), k * 1000, 200)) for k in range(3)]
+    for p in writers:
+        p.start()
+    delivered = []
+    while any(p.is_alive() for p in writers):
+        delivered.extend(drain_once(sender))
+    for p in writers:
+        p.join()
+    while lines := drain_once(sender):
+        delivered.extend(lines)
+
+    assert len(delivered) == 600
+    assert sender.pending_count() == 0
+
+
+def test_other_worker_sees_current_pending_count(outboxes):
+    sender, other = outboxes(), outboxes()
+    sender._is_sender()
+    for i in range(7):
+        other.enqueue({"n": i})
+    assert other.pending_count() == 7
+
+    drain_once(sender)  # delivers 5
+    assert other.pending_count() == 2
+    assert [p["n"] for p in other.pending_payloads()] == [5, 6]
+
+    drain_once(sender)
+    drain_once(sender)  # drained: truncates the file
+    assert other.pending_count() == 0
+    other.enqueue({"n": 7})
+    assert [p["n"] for p in other.pending_payloads()] == [7]
+
+
+def test_sender_delivers_leads_enqueued_from_threads(outboxes):
+    outbox = outboxes(idle_interval=0.05)
+
+    async def main():
+        await outbox.start()
+        await asyncio.gather(
+            *(asyncio.to_thread(lambda k=k: [outbox.enqueue({"n": k * 100 + i}) for i in range(50)]) for k in range(4))
+        )
+        for _ in range(200):
+            if outbox.sent == 200:
+                break
+            await asyncio.sleep(0.05)
+        await outbox.stop()
+
+    asyncio.run(main())
+    assert sorted(p["n"] for p in outbox.http_client.received) == sorted(
+        k * 100 + i for k in range(4) for i in range(50)
+    )
+    assert outbox.pending_count() == 0
+
+
+def run_sender(outbox, until):
+    async def main():
+        await outbox.start()
+        for _ in range(200):
+            if until():
+                break
+            await asyncio.sleep(0.02)
+        await outbox.stop()
+
+    asyncio.run(main())
+
+
+def test_unparseable_line_is_dead_lettered(outboxes):
+    outbox = outboxes(idle_interval=0.05)
+    outbox.enqueue({"n": 0})
+    with open(outbox.pending_path, "a", encoding="utf-8") as f:
+        f.write('{"queued_at": 1, "payl\n')
+    outbox.enqueue({"n": 1})
+    assert [p["n"] for p in outbox.pending_payloads()] == [0, 1]
+
+    run_sender(outbox, lambda: outbox.sent == 2)
+    assert [p["n"] for p in outbox.http_client.received] == [0, 1]
+    with open(outbox.dead_letter_path, encoding="utf-8") as f:
+        (dead,) = [json.loads(line) for line in f]
+    assert dead["line"] == '{"queued_at": 1, "payl' and dead["error"] == "unparseable"
+
+
+def test_sender_survives_errors(outboxes, monkeypatch):
+    outbox = outboxes(idle_interval=0.05, backoff_base=0.01)
+    outbox.enqueue({"n": 0})
+    save_state = outbox._save_state
+    failures = []
+
+    def flaky_save_state():
+        if len(failures) < 2:
+            failures.append(1)
+            raise OSError("disk full")
+        save_state()
+
+    monkeypatch.setattr(outbox, "_save_state", flaky_save_state)
+    run_sender(outbox, lambda: outbox.sender_errors == 2 and os.path.getsize(outbox.pending_path) == 0)
+    assert outbox.stats()["sender_errors"] == 2
+    assert os.path.getsize(outbox.pending_path) == 0  # kept going: drained and truncated
+    assert [p["n"] for p in outbox.http_client.received] == [0]
+
+
+def test_pending_count_reads_only_what_changed(outboxes, monkeypatch):
+    sender, other = outboxes(), outboxes()
+    sender._is_sender()
+    for i in range(12):
+        other.enqueue({"n": i})
+    assert other.pending_count() == sender.pending_count() == 12
+
+    read = []
+    count_lines = SheetOutbox._count_lines
+    monkeypatch.setattr(SheetOutbox, "_count_lines", lambda self, a, b: read.append(b - a) or count_lines(self, a, b))
+    assert other.pending_count() == 12 and sum(read) == 0
+
+    drain_once(sender)
+    other.enqueue({"n": 12})
+    consumed_and_appended = sum(len(line) for line in other._read_pending()[-1:]) + sender._state["offset"]
+    assert other.pending_count() == 8
+    assert sum(read) == consumed_and_appended
+
+    while drain_once(sender):
+        pass
+    drain_once(sender)  # drained: truncates the file
+    assert other.pending_count() == sender.pending_count() == 0
+    other.enqueue({"n": 13})
+    assert other.pending_count() == len(other._read_pending()) == 1
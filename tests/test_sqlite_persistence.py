@@ -0,0 +1,165 @@
+import asyncio
+import multiprocessing
+import sqlite3
+
+import pytest
+from telegram.ext import PersistenceInput
+
+from sqlite_persistence import SQLitePersistence
+
+
+@pytest.fixture
+def persistences(tmp_path):
+    opened = []
+
+    def make(**kwargs):
+        p = SQLitePersistence(str(tmp_path / "state.db"), store_data=PersistenceInput(), **kwargs)
+        opened.append(p)
+        return p
+
+    yield make
+    for p in opened:
+        p.close()
+
+
+def save(persistence, user_id, data):
+    async def main():
+        await persistence.update_user_data(user_id, data)
+        await persistence.flush()
+
+    asyncio.run(main())
+
+
+def refresh(persistence, user_id, user_data):
+    asyncio.run(persistence.refresh_user_data(user_id, user_data))
+    return user_data
+
+
+def save_from_process(path, user_id, data):
+    save(SQLitePersistence(path, store_data=PersistenceInput()), user_id, data)
+
+
+def test_foreign_write_rereads_only_that_row(persistences):
+    a, b = persistences(), persistences()
+    save(a, 1, {"name": "one"})
+    save(a, 2, {"name": "two"})
+    one, two = refresh(b, 1, {}), refresh(b, 2, {})
+    assert b.disk_reads == 2
+
+    save(a, 1, {"name": "uno"})
+    assert refresh(b, 2, two) == {"name": "two"}
+    assert b.disk_reads == 2  # user 2's row did not change
+    assert refresh(b, 1, one) == {"name": "uno"}
+    assert b.disk_reads == 3
+    refresh(b, 1, one)
+    assert b.disk_reads == 3
+
+
+def test_own_writes_are_not_read_back(persistences):
+    a = persistences()
+    user_data = refresh(a, 1, {})
+    user_data["name"] = "one"
+    save(a, 1, user_data)
+    reads = a.disk_reads
+    assert refresh(a, 1, user_data) == {"name": "one"}
+    assert a.disk_reads == reads
+
+
+def test_row_dropped_and_written_again_is_reread(persistences):
+    a, b = persistences(), persistences()
+    save(a, 1, {"name": "old"})
+    user_data = refresh(b, 1, {})
+
+    async def drop():
+        await a.drop_user_data(1)
+        await a.flush()
+
+    asyncio.run(drop())
+    save(a, 1, {"name": "new"})
+    assert refresh(b, 1, user_data) == {"name": "new"}
+
+
+def test_forgotten_row_is_read_again(persistences):
+    a = persistences()
+    save(a, 1, {"name": "one"})
+    refresh(a, 1, {})
+    a.forget_user(1)
+    assert refresh(a, 1, {}) == {"name": "one"}
+
+
+def test_write_from_another_process(persistences, tmp_path):
+    a = persistences()
+    save(a, 1, {"name": "one"})
+    user_data = refresh(a, 1, {})
+    child = multiprocessing.get_context("fork").Process(
+        target=save_from_process, args=(str(tmp_path / "state.db"), 1, {"name": "from child"})
+    )
+    child.start()
+    child.join(10)
+    assert child.exitcode == 0
+    assert refresh(a, 1, user_data) == {"name": "from child"}
+
+
+def test_database_without_versions_is_migrated(tmp_path):
+    path = str(tmp_path / "state.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE state (kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+        "PRIMARY KEY (kind, key)) WITHOUT ROWID"
+    )
+    conn.execute("INSERT INTO state VALUES ('user', '1', '{\"name\": \"one\"}')")
+    conn.commit()
+    conn.close()
+
+    a, b = SQLitePersistence(path), SQLitePersistence(path)
+    user_data = refresh(b, 1, {})
+    assert user_data == {"name": "one"}
+    save(a, 1, {"name": "uno"})
+    assert refresh(b, 1, user_data) == {"name": "uno"}
+
+
+def queries(persistence) -> list:
+    seen = []
+    persistence._conn.set_trace_callback(seen.append)
+    return seen
+
+
+def test_no_query_while_nothing_was_committed(persistences):
+    a, b = persistences(), persistences()
+    save(a, 1, {"name": "one"})
+    user_data = refresh(b, 1, {})
+    seen = queries(b)
+    refresh(b, 1, user_data)
+    assert [q for q in seen if q.startswith("SELECT")] == []
+
+    save(a, 2, {"name": "two"})  # another row: one version check, no value read
+    reads = b.disk_reads
+    refresh(b, 1, user_data)
+    assert len([q for q in seen if q.startswith("SELECT")]) == 1 and b.disk_reads == reads
+
+
+def test_refresh_does_not_wait_for_a_blocked_commit(persistences, tmp_path):
+    a = persistences(busy_timeout=2.0)
+    save(persistences(), 2, {"name": "two"})  # a has to read this one
+    other = sqlite3.connect(str(tmp_path / "state.db"), isolation_level=None)
+    other.execute("BEGIN IMMEDIATE")  # another worker holds the write lock
+
+    async def main():
+        await a.update_user_data(1, {"name": "one"})  # its commit now waits for the lock
+        await asyncio.sleep(0.05)
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        user_data = {}
+        await a.refresh_user_data(2, user_data)
+        await a.refresh_user_data(1, user_data_1 := {})
+        waited = loop.time() - started
+        other.execute("COMMIT")
+        await a.flush()
+        return user_data, user_data_1, waited
+
+    user_data, user_data_1, waited = asyncio.run(main())
+    other.close()
+    assert waited < 0.5
+    assert user_data == {"name": "two"}
+    assert user_data_1 == {}  # staged from memory: memory is newer than the disk
+    assert a.stats()["commits"] == 1
@@ -0,0 +1,119 @@
+import pytest
+from telegram import User
+from telegram.ext import (
+    ApplicationBuilder,
+    CallbackQueryHandler,
+    CommandHandler,
+    ConversationHandler,
+    MessageHandler,
+    TypeHandler,
+    filters,
+)
+
+from metrics import MetricsRegistry
+from update_filter import UpdatePrefilter, parse_update, update_signature
+
+
+async def noop(update, context):
+    pass
+
+
+def message(update_id=1, kind="message", chat_type="private", **content):
+    content = content or {"text": "hello"}
+    body = {"message_id": update_id, "date": 0, "chat": {"id": 7, "type": chat_type}, **content}
+    body["from"] = {"id": 7, "is_bot": False, "first_name": "u"}
+    return {"update_id": update_id, kind: body}
+
+
+def command(text, update_id=1):
+    entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return message(update_id, text=text, entities=entities)
+
+
+NEW_TEXT = filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND  # as in app.py
+STICKER = {"file_id": "s", "file_unique_id": "s", "type": "regular", "width": 1, "height": 1,
+           "is_animated": False, "is_video": False}
+
+
+@pytest.fixture
+def prefilter():
+    application = ApplicationBuilder().token("123:TEST").build()
+    application.bot._bot_user = User(123, "bot", is_bot=True, username="test_bot")  # what getMe would set
+    passive = TypeHandler(object, noop)
+    application.add_handler(passive, group=-1)  # sees everything, like the shared-state hooks
+    application.add_handler(CommandHandler("start", noop, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(CallbackQueryHandler(noop, pattern="^lesson:"))
+    application.add_handler(ConversationHandler(
+        entry_points=[MessageHandler(filters.UpdateType.MESSAGE & filters.Regex("^Register$"), noop)],
+        states={0: [MessageHandler(NEW_TEXT, noop)]},
+        fallbacks=[],
+    ))
+    registry = MetricsRegistry()
+    prefilter = UpdatePrefilter(application, passive=[passive], metrics=registry)
+    prefilter.registry = registry
+    return prefilter
+
+
+def test_signature():
+    assert update_signature(command("/start")) == ("message", "command", "private")
+    assert update_signature(message(sticker=STICKER)) == ("message", "sticker", "private")
+    assert update_signature({"update_id": 1, "my_chat_member": {}}) == ("my_chat_member", None, None)
+
+
+def test_junk_body_is_not_an_update():
+    assert parse_update(b"not json") is None
+    assert parse_update(b'{"update_id": 1}') == {"update_id": 1}
+
+
+@pytest.mark.parametrize("data", [
+    command("/start"),
+    message(text="Register"),  # the conversation's entry point, looked up inside the ConversationHandler
+    {"update_id": 1, "callback_query": {
+        "id": "q", "chat_instance": "c", "data": "lesson:1",
+        "from": {"id": 7, "is_bot": False, "first_name": "u"},
+    }},
+])
+def test_handled_updates_pass(prefilter, data):
+    assert prefilter.wanted(data)
+    assert prefilter.stats()["passed"] == 1
+
+
+@pytest.mark.parametrize("data, kind", [
+    (message(sticker=STICKER), "message"),
+    (message(kind="edited_message"), "edited_message"),
+    (message(kind="channel_post", chat_type="channel"), "channel_post"),
+    ({"update_id": 1, "my_chat_member": {}}, "my_chat_member"),
+])
+def test_ignored_updates_are_skipped(prefilter, data, kind):
+    assert not prefilter.wanted(data)
+    assert prefilter.stats()["skipped"] == {kind: 1}
+    assert f'updates_skipped_total{{kind="{kind}"}} 1' in prefilter.registry.render()
+
+
+def test_repeated_signature_is_answered_from_cache(prefilter, monkeypatch):
+    assert not prefilter.wanted(message(1, sticker=STICKER))
+    assert prefilter.wanted(command("/start", 2))
+
+    def no_probe(*args):
+        raise AssertionError("probed again")
+
+    monkeypatch.setattr(prefilter, "_probe", no_probe)
+    assert not prefilter.wanted(message(3, sticker=STICKER))  # the same update kind again
+    assert prefilter.wanted(command("/start", 4))
+    assert prefilter.stats()["passed"] == 2 and prefilter.stats()["skipped"] == {"message": 2}
+    assert 'updates_skipped_total{kind="message"} 2' in prefilter.registry.render()
+
+
+def test_new_handler_after_invalidate(prefilter):
+    sticker = message(sticker=STICKER)
+    assert not prefilter.wanted(sticker)
+    prefilter.application.add_handler(MessageHandler(filters.Sticker.ALL, noop))
+    assert not prefilter.wanted(sticker)  # cached until invalidated
+    prefilter.invalidate()
+    assert prefilter.wanted(sticker)
+
+
+def test_unready_bot_lets_updates_through_uncached(prefilter):
+    prefilter.application.bot._bot_user = None  # CommandHandler needs the bot's username
+    assert prefilter.wanted(command("/start"))
+    assert prefilter.stats()["signatures"] == {}
@@ -0,0 +1,95 @@
+import asyncio
+import threading
+
+import pytest
+
+from update_queue import UpdateQueue, extract_chat_id, extract_sender_id, is_valid_update
+
+
+class LoopThread:
+    """The runtime loop in its own thread, as the webhook threads see it."""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self._thread.start()
+
+    def run(self, coro, timeout=10):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result(timeout)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+
+@pytest.fixture
+def loop():
+    loop = LoopThread()
+    yield loop
+    loop.close()
+
+
+def update(update_id, chat_id):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "from": {"id": chat_id + 1000}}}
+
+
+def test_raw_update_helpers():
+    assert extract_chat_id(update(1, 5)) == 5
+    assert extract_sender_id(update(1, 5)) == 1005
+    assert extract_chat_id({"update_id": 1, "callback_query": {"from": {"id": 9}, "message": {"chat": {"id": 4}}}}) == 4
+    assert extract_chat_id({"update_id": 1, "poll": {"id": "p"}}) is None
+    assert is_valid_update(update(1, 5))
+    assert not is_valid_update({"update_id": "1", "message": {}})
+    assert not is_valid_update({"update_id": 1})
+
+
+def test_put_before_start_raises():
+    with pytest.raises(RuntimeError):
+        UpdateQueue(None).put(update(1, 1))
+
+
+def test_full_queue_refuses_then_stop_drains(loop):
+    release = threading.Event()
+    handled = []
+
+    async def handler(data, tag):
+        await asyncio.to_thread(release.wait)
+        handled.append((data["update_id"], tag))
+
+    queue = UpdateQueue(handler, workers=2, maxsize=4)
+    loop.run(queue.start())
+    accepted = [queue.put(update(i, i % 3), "t") for i in range(6)]
+    assert accepted == [True] * 4 + [False] * 2
+    assert queue.stats()["dropped"] == 2 and queue.stats()["high_water"] == 4
+
+    stopping = asyncio.run_coroutine_threadsafe(queue.stop(), loop.loop)
+    release.set()
+    stopping.result(10)  # returns only once everything accepted is handled
+    assert sorted(handled) == [(i, "t") for i in range(4)]
+    assert queue.stats()["depth"] == 0 and queue.stats()["processed"] == 4
+
+
+def test_per_chat_order_and_failures(loop):
+    handled = []
+
+    async def handler(data):
+        if data["update_id"] == 3:
+            raise ValueError("bad update")
+        await asyncio.sleep(0.001 * (data["update_id"] % 4))  # later updates may finish first across chats
+        handled.append(data["update_id"])
+
+    queue = UpdateQueue(handler, workers=3, maxsize=100)
+    loop.run(queue.start())
+    threads = [
+        threading.Thread(target=lambda c=c: [queue.put(update(c * 100 + i, c)) for i in range(20)])
+        for c in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    loop.run(queue.stop())
+
+    for c in range(5):
+        assert [u for u in handled if u // 100 == c] == [c * 100 + i for i in range(20) if c * 100 + i != 3]
+    assert queue.stats()["failed"] == 1 and queue.stats()["processed"] == 100
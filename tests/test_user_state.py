@@ -0,0 +1,137 @@
+import asyncio
+import datetime
+
+import pytest
+from telegram import Chat, Message, Update, User
+from telegram.ext import ApplicationBuilder, ConversationHandler, MessageHandler, PersistenceInput, filters
+
+import ptb_compat
+from sqlite_persistence import SQLitePersistence
+from user_state import SEEN_RESOLUTION, UserState, UserStateCache
+
+TIMEOUT = 1000.0
+SLACK = TIMEOUT * SEEN_RESOLUTION
+
+
+def make_update(user_id=7, update_id=1):
+    user = User(user_id, "u", is_bot=False)
+    message = Message(1, datetime.datetime.now(), Chat(user_id, "private"), from_user=user, text="hi")
+    return Update(update_id, message=message)
+
+
+class Worker:
+    """One process's Application, persistence and cache on a shared database."""
+
+    def __init__(self, path, **kwargs):
+        self.persistence = SQLitePersistence(
+            path, store_data=PersistenceInput(bot_data=False, chat_data=False, callback_data=False)
+        )
+        self.application = ApplicationBuilder().token("123:TEST").persistence(self.persistence).build()
+        noop = MessageHandler(filters.ALL, lambda u, c: None)
+        self.handler = ConversationHandler([noop], {0: [noop]}, [], name="registration", persistent=True)
+        self.application.add_handler(self.handler)
+        # What Application.initialize() does for persistent conversations, without getMe
+        asyncio.run(self.application._add_ch_to_persistence(self.handler))
+        kwargs.setdefault("conversation_timeout", TIMEOUT)
+        self.cache = UserStateCache(self.application, self.persistence, conversations=[self.handler], **kwargs)
+
+    def start_conversation(self, update, user_data, now):
+        self.cache.expire(update, user_data, now=now)
+        self.handler._conversations[ptb_compat.conversation_key(self.handler, update)] = 0
+        self.save(update.effective_user.id, user_data)
+
+    def save(self, user_id, user_data):
+        async def main():
+            self.application.mark_data_for_update_persistence(user_ids=user_id)
+            self.application.user_data[user_id].update(user_data)
+            await self.application.update_persistence()
+            await self.persistence.flush()
+
+        asyncio.run(main())
+
+
+@pytest.fixture
+def workers(tmp_path):
+    opened = []
+
+    def make(**kwargs):
+        worker = Worker(str(tmp_path / "state.db"), **kwargs)
+        opened.append(worker)
+        return worker
+
+    yield make
+    for worker in opened:
+        worker.persistence.close()
+
+
+def test_seen_moves_only_past_the_resolution(workers):
+    cache = workers().cache
+    user_data = UserState()
+    cache.expire(make_update(), user_data, now=0)
+    assert user_data["seen"] == 0
+    cache.expire(make_update(), user_data, now=SLACK)
+    assert user_data["seen"] == 0
+    cache.expire(make_update(), user_data, now=SLACK + 1)
+    assert user_data["seen"] == SLACK + 1
+
+
+def test_unchanged_user_data_is_not_committed(workers):
+    worker = workers()
+    update, user_data = make_update(), UserState(name="Ali")
+    worker.cache.expire(update, user_data, now=0)
+    worker.save(7, user_data)
+    commits = worker.persistence.commits
+    for now in (1, 2, 3):
+        worker.cache.expire(update, user_data, now=now)
+        worker.save(7, user_data)
+    assert worker.persistence.commits == commits
+
+
+def test_conversation_ends_only_after_the_timeout(workers):
+    worker = workers()
+    update, user_data = make_update(), UserState()
+    worker.start_conversation(update, user_data, now=0)
+    key = ptb_compat.conversation_key(worker.handler, update)
+
+    assert not worker.cache.expire(update, user_data, now=TIMEOUT + SLACK)
+    assert worker.handler._conversations.get(key) == 0
+
+    user_data["seen"] = 0  # as if no update came in since
+    assert worker.cache.expire(update, user_data, now=TIMEOUT + SLACK + 1)
+    assert key not in worker.handler._conversations
+    assert dict(user_data) == {"seen": int(TIMEOUT + SLACK + 1)}
+    assert worker.cache.expired == 1
+
+
+def test_conversation_expired_on_another_worker(workers):
+    a, b = workers(), workers()
+    update = make_update()
+    a.start_conversation(update, UserState(name="Ali"), now=0)
+
+    async def load(worker):
+        user_data = UserState()
+        await worker.persistence.refresh_user_data(7, user_data)
+        await worker.persistence.refresh_conversation(worker.handler, update)
+        return user_data
+
+    user_data = asyncio.run(load(b))
+    assert user_data["name"] == "Ali"
+    assert b.cache.expire(update, user_data, now=TIMEOUT * 2)
+    b.save(7, user_data)
+
+    asyncio.run(load(a))
+    assert ptb_compat.conversation_key(a.handler, update) not in a.handler._conversations
+
+
+def test_eviction_keeps_unsaved_users(workers):
+    worker = workers(max_users=1, ttl=0)
+    worker.application.user_data[1]["name"] = "one"
+    worker.application.mark_data_for_update_persistence(user_ids=1)
+    worker.cache.touch(make_update(1), now=0)
+    worker.cache.touch(make_update(2), now=1)
+    assert 1 in worker.application.user_data  # not persisted yet
+
+    worker.save(1, {"name": "one"})
+    worker.cache.touch(make_update(3), now=2)
+    assert 1 not in worker.application.user_data
+    assert worker.cache.evicted >= 1
@@ -0,0 +1,151 @@
+import json
+import threading
+
+from telegram import Update
+from telegram.ext import CommandHandler, ConversationHandler
+
+try:
+    import orjson  # optional: faster parsing of webhook bodies
+except ImportError:
+    orjson = None
+
+MESSAGE_KINDS = frozenset({
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "business_message", "edited_business_message",
+})
+# Checked in order; the first one present is the message's content type
+CONTENT_FIELDS = (
+    "text", "photo", "sticker", "animation", "video", "video_note", "voice", "audio",
+    "document", "contact", "location", "venue", "poll", "dice", "game", "invoice",
+    "successful_payment", "web_app_data", "new_chat_members", "left_chat_member",
+    "new_chat_title", "new_chat_photo", "pinned_message",
+)
+TEXT_CONTENT = ("text", "command")
+
+
+def parse_update(raw: bytes):
+    """Decode a webhook body; None if it is not JSON."""
+    try:
+        return orjson.loads(raw) if orjson is not None else json.loads(raw)
+    except ValueError:
+        return None
+
+
+def update_signature(data: dict) -> tuple:
+    """(kind, content type, chat type) of a raw update, e.g. ("message", "sticker", "private")."""
+    for kind, value in data.items():
+        if kind == "update_id":
+            continue
+        if kind not in MESSAGE_KINDS or not isinstance(value, dict):
+            return kind, None, None
+        content = next((field for field in CONTENT_FIELDS if field in value), "other")
+        if content == "text" and _is_command(value):
+            content = "command"
+        return kind, content, (value.get("chat") or {}).get("type")
+    return None, None, None
+
+
+def _is_command(message: dict) -> bool:
+    entities = message.get("entities") or ()
+    return bool(entities) and entities[0].get("type") == "bot_command" and entities[0].get("offset") == 0
+
+
+class UpdatePrefilter:
+    """Acknowledges updates no handler would act on without building an Update.
+
+    Updates are grouped by :func:`update_signature`. The first update of each
+    signature is probed against every registered handler (recursing into
+    ConversationHandler states) and the answer is cached, so the set of
+    interesting kinds follows the handlers instead of a hand-kept list. As a
+    handler's ``check_update`` may depend on the text itself, text updates are
+    also probed with texts the handler is known to accept: its command names,
+    or whatever a handler's ``probe_texts()`` returns (MenuRouter: a label).
+
+    ``passive`` handlers, such as the shared-state hooks that see every
+    update, do not make an update worth processing. Call :meth:`invalidate`
+    after changing the handlers.
+    """
+
+    def __init__(self, application, passive=(), metrics=None):
+        self.application = application
+        self.passive = tuple(passive)
+        self._lock = threading.Lock()
+        self._wanted = {}  # signature -> bool
+        self.passed = 0
+        self.skipped = {}  # kind -> count
+        self._skipped_total = None
+        if metrics is not None:
+            self._skipped_total = metrics.counter(
+                "updates_skipped_total", "Updates acknowledged without processing, by kind.", ("kind",)
+            )
+
+    def wanted(self, data: dict) -> bool:
+        signature = update_signature(data)
+        verdict = self._wanted.get(signature)
+        if verdict is None:
+            verdict = self._probe(signature, data)
+        with self._lock:
+            if verdict:
+                self.passed += 1
+            else:
+                self.skipped[signature[0]] = self.skipped.get(signature[0], 0) + 1
+        if not verdict and self._skipped_total is not None:
+            self._skipped_total.inc(signature[0])
+        return verdict
+
+    def invalidate(self):
+        with self._lock:
+            self._wanted = {}
+
+    def _probe(self, signature, data: dict) -> bool:
+        try:
+            verdict = any(
+                self._accepts(handler, signature, data)
+                for handlers in self.application.handlers.values()
+                for handler in handlers
+                if not any(handler is p for p in self.passive)
+            )
+        except Exception:
+            # e.g. the bot is not initialized yet: process it, and probe again next time
+            return True
+        with self._lock:
+            self._wanted[signature] = verdict
+        return verdict
+
+    def _accepts(self, handler, signature, data: dict) -> bool:
+        if isinstance(handler, ConversationHandler):
+            inner = [*handler.entry_points, *handler.fallbacks]
+            for state_handlers in handler.states.values():
+                inner.extend(state_handlers)
+            return any(self._accepts(h, signature, data) for h in inner)
+        for probe in self._probes(handler, signature, data):
+            if handler.check_update(Update.de_json(probe, self.application.bot)):
+                return True
+        return False
+
+    @staticmethod
+    def _probes(handler, signature, data: dict):
+        yield data
+        kind, content, _ = signature
+        if kind not in MESSAGE_KINDS or content not in TEXT_CONTENT:
+            return
+        if isinstance(handler, CommandHandler):
+            texts = [f"/{command}" for command in handler.commands]
+        elif hasattr(handler, "probe_texts"):
+            texts = handler.probe_texts()
+        else:
+            return
+        for text in texts:
+            message = {k: v for k, v in data[kind].items() if k not in ("text", "entities")}
+            message["text"] = text
+            if text.startswith("/"):
+                message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+            yield {**data, kind: message}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "passed": self.passed,
+                "skipped": dict(self.skipped),
+                "signatures": {"/".join(str(p) for p in s): w for s, w in self._wanted.items()},
+            }
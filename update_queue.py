@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import threading
+
+log = logging.getLogger(__name__)
+
+
+def extract_chat_id(data: dict):
+    """Best-effort chat (or sender) id from a raw update dict, without de_json."""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        chat = value.get("chat") or (value.get("message") or {}).get("chat")
+        if chat:
+            return chat.get("id")
+        sender = value.get("from")
+        if sender:
+            return sender.get("id")
+    return None
+
+
+def extract_sender_id(data: dict):
+    """Id of the user who caused a raw update, without de_json."""
+    for key, value in data.items():
+        if key == "update_id" or not isinstance(value, dict):
+            continue
+        sender = value.get("from") or value.get("user")
+        if sender:
+            return sender.get("id")
+    return None
+
+
+def is_valid_update(data) -> bool:
+    return isinstance(data, dict) and isinstance(data.get("update_id"), int) and len(data) > 1
+
+
+class UpdateQueue:
+    """Bounded in-process queue between the webhook threads and the bot loop.
+
+    ``put()`` is called from request threads and never blocks: it either
+    accepts the update or reports the queue as full so the webhook can push
+    back on Telegram. A fixed pool of consumers drains the queue on the
+    runtime loop; updates are sharded by chat id so each chat is handled by
+    exactly one consumer, which keeps per-chat ordering.
+    """
+
+    def __init__(self, handler, workers: int = 4, maxsize: int = 1000):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.maxsize = maxsize
+        self.loop = None
+        self._queues = []
+        self._tasks = []
+        self._lock = threading.Lock()
+        self.depth = 0
+        self.high_water = 0
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.dropped = 0
+
+    async def start(self):
+        """Create the shards and consumer tasks; must run on the runtime loop."""
+        self.loop = asyncio.get_running_loop()
+        self._queues = [asyncio.Queue() for _ in range(self.workers)]
+        self._tasks = [
+            asyncio.create_task(self._consume(q), name=f"update-consumer-{i}")
+            for i, q in enumerate(self._queues)
+        ]
+
+    async def stop(self):
+        """Drain what is already queued, then stop the consumers."""
+        for q in self._queues:
+            await q.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def put(self, data: dict, *args) -> bool:
+        """Enqueue a raw update from any thread; ``handler(data, *args)`` processes it.
+
+        Returns False when the queue is full.
+        """
+        if self.loop is None:
+            raise RuntimeError("UpdateQueue is not started")
+        with self._lock:
+            if self.depth >= self.maxsize:
+                self.dropped += 1
+                return False
+            self.depth += 1
+            self.enqueued += 1
+            self.high_water = max(self.high_water, self.depth)
+        key = extract_chat_id(data)
+        if key is None:
+            key = data["update_id"]
+        shard = self._queues[hash(key) % self.workers]
+        self.loop.call_soon_threadsafe(shard.put_nowait, (data, args))
+        return True
+
+    async def _consume(self, queue: asyncio.Queue):
+        while True:
+            data, args = await queue.get()
+            ok = False
+            try:
+                await self.handler(data, *args)
+                ok = True
+            except Exception as e:
+                log.exception("❌ Update consumer error: %s", e)
+            finally:
+                with self._lock:
+                    self.depth -= 1
+                    self.processed += 1
+                    self.failed += not ok
+                queue.task_done()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "maxsize": self.maxsize,
+                "depth": self.depth,
+                "high_water": self.high_water,
+                "enqueued": self.enqueued,
+                "processed": self.processed,
+                "failed": self.failed,
+                "dropped": self.dropped,
+            }
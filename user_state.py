@@ -0,0 +1,226 @@
+import time
+from collections import OrderedDict
+from collections.abc import MutableMapping
+from copy import deepcopy
+
+import ptb_compat
+
+_UNSET = object()
+# user_data["seen"] is only moved on by more than this fraction of the timeout,
+# so most updates leave user_data unchanged and nothing is written back
+SEEN_RESOLUTION = 0.05
+
+
+class UserState(MutableMapping):
+    """``context.user_data`` with the bot's own fields in slots.
+
+    An empty dict is 64 bytes and grows to 184 with its first key; this is 56,
+    whatever the fields hold. Keys other than ``FIELDS`` (e.g. from an older
+    release, read back from the persistence) go into a dict made on demand.
+    """
+
+    __slots__ = ("name", "seen", "_extra")
+    FIELDS = ("name", "seen")
+
+    def __init__(self, *args, **kwargs):
+        self.name = self.seen = _UNSET
+        self._extra = None
+        if args or kwargs:
+            self.update(*args, **kwargs)
+
+    def __getitem__(self, key):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+            if value is not _UNSET:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key in self.FIELDS:
+            setattr(self, key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in self.FIELDS and getattr(self, key) is not _UNSET:
+            setattr(self, key, _UNSET)
+        elif key not in self.FIELDS and self._extra is not None and key in self._extra:
+            del self._extra[key]
+            if not self._extra:
+                self._extra = None
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for key in self.FIELDS:
+            if getattr(self, key) is not _UNSET:
+                yield key
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __deepcopy__(self, memo):
+        # The default slot copy would deep-copy _UNSET into a new object
+        return UserState((key, deepcopy(value, memo)) for key, value in self.items())
+
+    def __repr__(self):
+        return f"UserState({dict(self)!r})"
+
+
+class _Resident:
+    __slots__ = ("chats", "seen")
+
+    def __init__(self, chat_id, now: float):
+        self.chats = (chat_id,) if chat_id is not None else ()
+        self.seen = now
+
+
+class UserStateCache:
+    """Bounds the per-user state an ``Application`` keeps in memory.
+
+    PTB keeps ``user_data``, ``chat_data`` and every ConversationHandler's
+    states in plain dicts that gain an entry for each user and never shrink.
+    :meth:`touch` is called for every update; it keeps users in LRU order and
+    evicts from memory the least recently seen ones beyond ``max_users``, and
+    any idle for ``ttl`` seconds. Eviction is memory-only: the persistence
+    still holds the state and reads it back on the user's next update (the
+    persistence must have ``forget_*`` methods, see ``SQLitePersistence``).
+    Users whose changes are not persisted yet are kept until they are.
+
+    :meth:`expire` ends conversations abandoned for ``conversation_timeout``
+    seconds, based on ``user_data["seen"]``, so it holds across workers and
+    restarts. ``seen`` is kept to within ``SEEN_RESOLUTION`` of the timeout,
+    so a conversation ends after between 1 and 1 + ``SEEN_RESOLUTION`` times
+    the timeout of silence.
+
+    PTB's private state is reached through ``ptb_compat``.
+    """
+
+    def __init__(
+        self,
+        application,
+        persistence,
+        conversations=(),
+        max_users: int = 10_000,
+        ttl: float = 3600.0,
+        conversation_timeout: float = 86400.0,
+        metrics=None,
+    ):
+        self.application = application
+        self.persistence = persistence
+        self.conversations = tuple(conversations)
+        self.max_users = max_users
+        self.ttl = ttl
+        self.conversation_timeout = conversation_timeout
+        self._users = OrderedDict()  # user_id -> _Resident, least recently seen first
+        self.evicted = 0
+        self.expired = 0
+        self._evicted_total = self._expired_total = None
+        if metrics is not None:
+            self._evicted_total = metrics.counter("user_state_evicted_total", "Users whose state was evicted from memory.")
+            self._expired_total = metrics.counter("conversations_expired_total", "Conversations ended by timeout.")
+            metrics.gauge_callback("user_state_resident", "Users with state in memory.", lambda: len(self._users))
+
+    def touch(self, update, now: float = None):
+        """Record activity of ``update``'s user, then evict who is over the limits."""
+        user, chat = update.effective_user, update.effective_chat
+        if user is None:
+            return
+        now = time.monotonic() if now is None else now
+        chat_id = chat.id if chat is not None else None
+        resident = self._users.get(user.id)
+        if resident is None:
+            self._users[user.id] = _Resident(chat_id, now)
+        else:
+            self._users.move_to_end(user.id)
+            resident.seen = now
+            if chat_id is not None and chat_id not in resident.chats:
+                resident.chats += (chat_id,)
+        self._evict(now)
+
+    def expire(self, update, user_data, now: float = None) -> bool:
+        """End ``update``'s conversations if the user was last seen over the timeout ago."""
+        if not self.conversation_timeout:
+            return False
+        now = time.time() if now is None else now
+        seen = user_data.get("seen")
+        resolution = self.conversation_timeout * SEEN_RESOLUTION
+        if seen is None or now - seen > resolution:
+            user_data["seen"] = int(now)
+        # seen may lag the last update by up to ``resolution``; never end early
+        if seen is None or now - seen <= self.conversation_timeout + resolution:
+            return False
+        ended = False
+        for handler in self.conversations:
+            key = ptb_compat.conversation_key(handler, update)
+            if key is not None and ptb_compat.end_conversation(handler, key):
+                ended = True
+        if ended:
+            user_data.clear()
+            user_data["seen"] = int(now)
+            self.expired += 1
+            if self._expired_total is not None:
+                self._expired_total.inc()
+        return ended
+
+    def _evict(self, now: float):
+        while self._users:
+            user_id, resident = next(iter(self._users.items()))
+            if len(self._users) <= self.max_users and (not self.ttl or now - resident.seen < self.ttl):
+                return
+            if self._unsaved(user_id, resident):
+                return  # saved at the end of its update; evicted on a later touch
+            del self._users[user_id]
+            self._forget(user_id, resident)
+
+    def _unsaved(self, user_id, resident) -> bool:
+        # Dropping marked-but-unsaved entries would make update_persistence()
+        # save an empty user_data over them.
+        if ptb_compat.user_unsaved(self.application, user_id):
+            return True
+        if self.persistence.store_data.chat_data and any(
+            ptb_compat.chat_unsaved(self.application, chat_id) for chat_id in resident.chats
+        ):
+            return True
+        return any(
+            ptb_compat.conversation_unsaved(handler, key)
+            for handler in self.conversations
+            for key in self._keys(handler, user_id, resident)
+        )
+
+    def _forget(self, user_id, resident):
+        ptb_compat.drop_user_from_memory(self.application, user_id)
+        self.persistence.forget_user(user_id)
+        for chat_id in resident.chats:
+            ptb_compat.drop_chat_from_memory(self.application, chat_id)
+            self.persistence.forget_chat(chat_id)
+            if not self.persistence.store_data.chat_data:
+                ptb_compat.unmark_chat(self.application, chat_id)
+        for handler in self.conversations:
+            for key in self._keys(handler, user_id, resident):
+                # Untracked, or the next update_persistence() would delete the row
+                ptb_compat.set_conversation_state(handler, key, None)
+                self.persistence.forget_conversation(handler.name, key)
+        self.evicted += 1
+        if self._evicted_total is not None:
+            self._evicted_total.inc()
+
+    @staticmethod
+    def _keys(handler, user_id, resident):
+        if not handler.per_chat:
+            return [(user_id,)] if handler.per_user else []
+        return [(chat_id, user_id) if handler.per_user else (chat_id,) for chat_id in resident.chats]
+
+    def stats(self) -> dict:
+        return {
+            "resident": len(self._users),
+            "max_users": self.max_users,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
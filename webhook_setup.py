@@ -0,0 +1,84 @@
+import asyncio
+import fcntl
+import os
+import tempfile
+
+from http_client import SharedHTTPClient
+
+TELEGRAM_API_BASE_URL = "https://api.telegram.org"
+
+
+class WebhookError(RuntimeError):
+    def __init__(self, message: str, error_code: int = None, retry_after: float = None):
+        super().__init__(message)
+        self.error_code = error_code
+        self.retry_after = retry_after  # seconds, on 429 Too Many Requests
+
+
+def webhook_url_for(root_url: str, token: str) -> str:
+    return f"{root_url.rstrip('/')}/webhook/{token}"
+
+
+class WebhookRegistrar:
+    """Bot API webhook calls, plus a one-shot ``ensure`` for deploys.
+
+    ``ensure`` holds an flock while it works, so when several processes on an
+    instance start together only one talks to Telegram at a time; it calls
+    ``getWebhookInfo`` first and only calls ``setWebhook`` if the registered URL
+    differs.
+    """
+
+    def __init__(self, token: str, http_client=None, api_base_url: str = TELEGRAM_API_BASE_URL, lock_path: str = None):
+        self.api_url = f"{api_base_url.rstrip('/')}/bot{token}"
+        self.http_client = http_client or SharedHTTPClient(max_connections=1)
+        self.lock_path = lock_path or os.path.join(tempfile.gettempdir(), f"webhook-{token.split(':')[0]}.lock")
+
+    async def call(self, method: str, **params):
+        response = await self.http_client.post(f"{self.api_url}/{method}", json=params)
+        try:
+            body = response.json()
+        except ValueError:
+            raise WebhookError(f"{method}: HTTP {response.status_code}", error_code=response.status_code)
+        if not body.get("ok"):
+            raise WebhookError(
+                f"{method}: {body.get('description') or response.status_code}",
+                error_code=body.get("error_code", response.status_code),
+                retry_after=(body.get("parameters") or {}).get("retry_after"),
+            )
+        return body["result"]
+
+    async def info(self) -> dict:
+        return await self.call("getWebhookInfo")
+
+    async def set(self, url: str, drop_pending_updates: bool = False):
+        return await self.call("setWebhook", url=url, drop_pending_updates=drop_pending_updates)
+
+    async def delete(self, drop_pending_updates: bool = False):
+        return await self.call("deleteWebhook", drop_pending_updates=drop_pending_updates)
+
+    async def ensure(self, url: str) -> str:
+        """Register ``url`` unless it already is. Returns ``"unchanged"`` or ``"set"``."""
+        fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            await asyncio.to_thread(fcntl.flock, fd, fcntl.LOCK_EX)
+            if (await self.info()).get("url") == url:
+                return "unchanged"
+            await self.set(url)
+            return "set"
+        finally:
+            os.close(fd)  # also releases the lock
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+def ensure_webhook(token: str, url: str, **kwargs) -> str:
+    """Blocking ``WebhookRegistrar.ensure`` for scripts and the deploy step."""
+    async def run():
+        registrar = WebhookRegistrar(token, **kwargs)
+        try:
+            return await registrar.ensure(url)
+        finally:
+            await registrar.aclose()
+
+    return asyncio.run(run())